@@ -0,0 +1,284 @@
+"""
+Módulo de Arquivo de Transações
+Arquivo colunar (Parquet) particionado por data/hora de cada janela ingerida,
+com consulta por intervalo, origem, código e estado lendo apenas as partições
+e colunas necessárias
+
+Uso (CLI):
+    python3 arquivo_transacoes.py consultar --inicio "2026-10-13 14:10" --fim "2026-10-13 14:40" \\
+        --cod-resp N2 --contar-por origem
+    python3 arquivo_transacoes.py importar Recargas/Transacao*.xlsx
+"""
+
+import os
+import sys
+import logging
+import argparse
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import List, Optional
+from recarga_analyzer import RecargaAnalyzer
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    PYARROW_DISPONIVEL = True
+except ImportError:
+    PYARROW_DISPONIVEL = False
+
+logger = logging.getLogger(__name__)
+
+
+# Colunas do export → colunas do arquivo
+MAPA_COLUNAS = {
+    'Data/Hora Origem': 'data_hora',
+    'Origem': 'origem',
+    'Telefone': 'telefone',
+    'Valor': 'valor',
+    'Estado Transação': 'estado',
+    'Cod Resp': 'cod_resp',
+}
+
+COLUNAS_ARQUIVO = list(MAPA_COLUNAS.values())
+
+
+class ArquivoTransacoes:
+    """
+    Arquivo de transações brutas em Parquet, particionado em data=YYYY-MM-DD/hora=HH
+
+    Cada janela gera um arquivo por partição tocada (janela_YYYYMMDD_HHMM.parquet),
+    então reprocessar a mesma janela sobrescreve em vez de duplicar. As linhas são
+    gravadas ordenadas por data_hora, o que deixa as estatísticas de cada row group
+    úteis para descartar blocos fora do intervalo consultado.
+    """
+
+    def __init__(self, base_dir: str):
+        """
+        Inicializa o arquivo
+
+        Args:
+            base_dir: Diretório raiz das partições
+        """
+        if not PYARROW_DISPONIVEL:
+            raise ImportError("pyarrow não instalado - execute: pip install pyarrow")
+
+        self.base_dir = base_dir
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _dir_particao(self, momento: datetime) -> str:
+        """
+        Diretório da partição de uma data/hora
+        """
+        return os.path.join(self.base_dir, f"data={momento:%Y-%m-%d}", f"hora={momento:%H}")
+
+    @staticmethod
+    def normalizar(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Converte o DataFrame do export para o esquema do arquivo
+
+        Args:
+            df: DataFrame carregado por RecargaAnalyzer
+
+        Returns:
+            DataFrame com colunas data_hora, origem, telefone, valor, estado, cod_resp
+        """
+        saida = pd.DataFrame({
+            'data_hora': pd.to_datetime(df['Data/Hora Origem'], errors='coerce')
+                         if 'Data/Hora Origem' in df.columns else pd.NaT,
+            'origem': df['Origem'].astype(str),
+            'telefone': df['Telefone'].astype(str),
+            'valor': RecargaAnalyzer.converter_valor(df['Valor']),
+            'estado': df['Estado Transação'].astype(str),
+            'cod_resp': df['Cod Resp'].astype(str),
+        })
+        return saida
+
+    def anexar_janela(self, df: pd.DataFrame, fim_janela: datetime) -> int:
+        """
+        Grava as transações de uma janela nas partições de data/hora
+
+        Linhas sem Data/Hora Origem válida vão para a partição do fim da janela.
+
+        Args:
+            df: DataFrame carregado por RecargaAnalyzer (colunas originais do export)
+            fim_janela: Fim da janela (identifica o arquivo gravado)
+
+        Returns:
+            Quantidade de linhas gravadas
+        """
+        if df is None or len(df) == 0:
+            return 0
+
+        dados = self.normalizar(df)
+        dados['data_hora'] = dados['data_hora'].fillna(pd.Timestamp(fim_janela))
+        dados = dados.sort_values('data_hora', kind='stable')
+
+        nome_arquivo = f"janela_{fim_janela:%Y%m%d_%H%M}.parquet"
+        total = 0
+
+        for hora, grupo in dados.groupby(dados['data_hora'].dt.floor('h'), sort=True):
+            destino_dir = self._dir_particao(hora.to_pydatetime())
+            os.makedirs(destino_dir, exist_ok=True)
+            destino = os.path.join(destino_dir, nome_arquivo)
+
+            tabela = pa.Table.from_pandas(grupo[COLUNAS_ARQUIVO], preserve_index=False)
+            tmp_path = f"{destino}.tmp"
+            pq.write_table(tabela, tmp_path, compression='zstd', row_group_size=16384)
+            os.replace(tmp_path, destino)
+            total += len(grupo)
+
+        logger.info(f"Arquivo de transações: {total} linhas gravadas ({nome_arquivo})")
+        return total
+
+    def _arquivos_no_intervalo(self, inicio: datetime, fim: datetime) -> List[str]:
+        """
+        Lista os arquivos apenas das partições de hora entre inicio e fim
+
+        Args:
+            inicio: Início do intervalo
+            fim: Fim do intervalo
+
+        Returns:
+            Lista de caminhos .parquet
+        """
+        arquivos = []
+        hora = inicio.replace(minute=0, second=0, microsecond=0)
+
+        while hora <= fim:
+            diretorio = self._dir_particao(hora)
+            if os.path.isdir(diretorio):
+                arquivos.extend(
+                    os.path.join(diretorio, nome) for nome in sorted(os.listdir(diretorio))
+                    if nome.endswith('.parquet')
+                )
+            hora += timedelta(hours=1)
+
+        return arquivos
+
+    def consultar(self, inicio: datetime, fim: datetime,
+                  origens: Optional[List[str]] = None,
+                  codigos: Optional[List[str]] = None,
+                  estados: Optional[List[str]] = None,
+                  colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Consulta transações por intervalo e filtros
+
+        Apenas as partições de hora do intervalo são abertas, apenas as
+        colunas pedidas (mais as filtradas) são lidas, e os filtros são
+        empurrados para o leitor Parquet.
+
+        Args:
+            inicio: Início do intervalo (inclusivo)
+            fim: Fim do intervalo (inclusivo)
+            origens: Filtrar estas origens (None = todas)
+            codigos: Filtrar estes códigos de resposta (None = todos)
+            estados: Filtrar estes estados de transação (None = todos)
+            colunas: Colunas a retornar (None = todas)
+
+        Returns:
+            DataFrame com as transações encontradas
+        """
+        colunas = colunas or COLUNAS_ARQUIVO
+        arquivos = self._arquivos_no_intervalo(inicio, fim)
+
+        if not arquivos:
+            return pd.DataFrame(columns=colunas)
+
+        filtro = (ds.field('data_hora') >= pa.scalar(pd.Timestamp(inicio), type=pa.timestamp('ns'))) & \
+                 (ds.field('data_hora') <= pa.scalar(pd.Timestamp(fim), type=pa.timestamp('ns')))
+        if origens:
+            filtro = filtro & ds.field('origem').isin([str(o) for o in origens])
+        if codigos:
+            filtro = filtro & ds.field('cod_resp').isin([str(c) for c in codigos])
+        if estados:
+            filtro = filtro & ds.field('estado').isin([str(e) for e in estados])
+
+        dataset = ds.dataset(arquivos, format='parquet')
+        tabela = dataset.to_table(columns=colunas, filter=filtro)
+        return tabela.to_pandas()
+
+
+def _parse_data(texto: str) -> datetime:
+    """
+    Converte 'YYYY-MM-DD HH:MM' (ou 'DD/MM/YYYY HH:MM') em datetime
+    """
+    for formato in ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S'):
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"Data inválida: {texto} (use 'YYYY-MM-DD HH:MM')")
+
+
+def _diretorio_padrao() -> str:
+    """
+    Diretório do arquivo definido em config.py (ou ./arquivo_transacoes)
+    """
+    try:
+        import config
+        return getattr(config, 'ARQUIVO_TRANSACOES_DIR', None) or os.path.join(config.BASE_DIR, "arquivo_transacoes")
+    except ImportError:
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), "arquivo_transacoes")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI de consulta e importação do arquivo de transações
+    """
+    parser = argparse.ArgumentParser(description="Arquivo particionado de transações de recarga")
+    parser.add_argument('--dir', default=None, help="Diretório do arquivo (padrão: config.ARQUIVO_TRANSACOES_DIR)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_consulta = sub.add_parser('consultar', help="Consulta transações por intervalo e filtros")
+    p_consulta.add_argument('--inicio', type=_parse_data, required=True)
+    p_consulta.add_argument('--fim', type=_parse_data, required=True)
+    p_consulta.add_argument('--origem', action='append', help="Pode repetir")
+    p_consulta.add_argument('--cod-resp', action='append', help="Pode repetir")
+    p_consulta.add_argument('--estado', action='append', help="Pode repetir")
+    p_consulta.add_argument('--colunas', help="Lista separada por vírgula")
+    p_consulta.add_argument('--contar-por', choices=COLUNAS_ARQUIVO, help="Agrupa e conta por coluna")
+    p_consulta.add_argument('--csv', help="Salva o resultado em CSV")
+
+    p_import = sub.add_parser('importar', help="Importa exports Transacao*.xlsx existentes")
+    p_import.add_argument('arquivos', nargs='+')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    arquivo = ArquivoTransacoes(args.dir or _diretorio_padrao())
+
+    if args.comando == 'importar':
+        for caminho in args.arquivos:
+            analyzer = RecargaAnalyzer()
+            if not analyzer.carregar_arquivo(caminho):
+                continue
+            datas = analyzer.df['Data/Hora Origem'] if 'Data/Hora Origem' in analyzer.df.columns else pd.Series(dtype='datetime64[ns]')
+            fim = datas.max() if datas.notna().any() else datetime.fromtimestamp(os.path.getmtime(caminho))
+            arquivo.anexar_janela(analyzer.df, pd.Timestamp(fim).to_pydatetime().replace(second=0, microsecond=0))
+        return 0
+
+    colunas = [c.strip() for c in args.colunas.split(',')] if args.colunas else None
+    if args.contar_por and colunas and args.contar_por not in colunas:
+        colunas.append(args.contar_por)
+
+    inicio_consulta = datetime.now()
+    resultado = arquivo.consultar(args.inicio, args.fim, args.origem, args.cod_resp, args.estado, colunas)
+    duracao = (datetime.now() - inicio_consulta).total_seconds()
+
+    if args.contar_por:
+        resultado = (resultado[args.contar_por].value_counts()
+                     .rename_axis(args.contar_por).reset_index(name='quantidade'))
+
+    if args.csv:
+        resultado.to_csv(args.csv, index=False)
+    else:
+        with pd.option_context('display.max_rows', 200, 'display.width', 200):
+            print(resultado.to_string(index=False) if len(resultado) else "Nenhuma transação encontrada")
+
+    print(f"\n{len(resultado)} linha(s) em {duracao:.3f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
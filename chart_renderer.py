@@ -0,0 +1,246 @@
+"""
+Módulo de Renderização de Gráficos
+Renderiza rankings em PNG sem o estado global do pyplot, em paralelo e com cache
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+logger = logging.getLogger(__name__)
+
+
+# Figuras reutilizáveis por thread/processo, indexadas por (figsize, dpi)
+_templates = threading.local()
+
+
+def _obter_figura(figsize: Tuple[float, float], dpi: int) -> Figure:
+    """
+    Retorna a figura-template da thread atual, limpa para um novo desenho
+
+    Args:
+        figsize: Tamanho da figura em polegadas
+        dpi: Resolução
+
+    Returns:
+        Figure pronta para uso (sem eixos)
+    """
+    cache = getattr(_templates, 'figuras', None)
+    if cache is None:
+        cache = _templates.figuras = {}
+
+    chave = (tuple(figsize), dpi)
+    figura = cache.get(chave)
+
+    if figura is None:
+        figura = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(figura)
+        cache[chave] = figura
+    else:
+        figura.clear()
+
+    return figura
+
+
+def renderizar_ranking(spec: Dict) -> str:
+    """
+    Desenha um gráfico de barras horizontais de ranking e salva em PNG
+
+    Função de módulo (sem logging e sem estado global do pyplot) para poder
+    rodar em threads ou processos de trabalho.
+
+    Args:
+        spec: Dict com origens, valores, titulo, cor, figsize, dpi e caminho
+
+    Returns:
+        Caminho do PNG gerado
+    """
+    figura = _obter_figura(spec['figsize'], spec['dpi'])
+    ax = figura.add_subplot(111)
+
+    origens = spec['origens']
+    valores = spec['valores']
+    y_pos = range(len(origens))
+
+    # Criar barras
+    bars = ax.barh(y_pos, valores, color=spec['cor'], alpha=0.8, edgecolor='black', linewidth=0.5)
+
+    # Adicionar valores nas barras
+    for bar in bars:
+        width = bar.get_width()
+        if width > 0:
+            ax.text(width, bar.get_y() + bar.get_height()/2,
+                   f' {int(width)}', va='center', ha='left', fontsize=10, fontweight='bold')
+
+    # Configurar eixos
+    ax.set_yticks(list(y_pos))
+    ax.set_yticklabels(origens, fontsize=10)
+    ax.invert_yaxis()  # Top = primeira origem
+    ax.set_xlabel('Quantidade de Transações', fontsize=12, fontweight='bold')
+    ax.set_title(spec['titulo'], fontsize=14, fontweight='bold', pad=20)
+
+    # Grid
+    ax.grid(axis='x', alpha=0.3, linestyle='--')
+
+    figura.tight_layout()
+    figura.savefig(spec['caminho'], dpi=spec['dpi'], bbox_inches='tight', facecolor='white')
+
+    return spec['caminho']
+
+
+class ChartRenderer:
+    """
+    Renderiza gráficos de ranking com figuras reutilizáveis, em paralelo e com cache
+
+    O cache é indexado por um hash dos dados do ranking e dos parâmetros visuais:
+    um ranking que não mudou entre janelas é apenas copiado do cache.
+    """
+
+    def __init__(self, cache_dir: str, figsize: Tuple[float, float] = (12, 8), dpi: int = 150,
+                 max_workers: int = 2, usar_processos: bool = False, max_entradas_cache: int = 200):
+        """
+        Inicializa o renderizador
+
+        Args:
+            cache_dir: Diretório do cache de PNGs
+            figsize: Tamanho das figuras em polegadas
+            dpi: Resolução dos PNGs
+            max_workers: Quantidade de workers para gráficos independentes
+            usar_processos: Usa processos em vez de threads (paralelismo real de CPU,
+                            com custo de inicialização do matplotlib em cada processo)
+            max_entradas_cache: Quantidade máxima de PNGs mantidos no cache
+        """
+        self.cache_dir = cache_dir
+        self.figsize = figsize
+        self.dpi = dpi
+        self.max_workers = max(1, max_workers)
+        self.usar_processos = usar_processos
+        self.max_entradas_cache = max_entradas_cache
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def chave_cache(self, origens: List[str], valores: List[int], titulo: str, cor: str) -> str:
+        """
+        Calcula o hash que identifica um gráfico
+
+        Args:
+            origens: Rótulos das barras
+            valores: Valores das barras
+            titulo: Título do gráfico
+            cor: Cor das barras
+
+        Returns:
+            Hash hexadecimal (sha256)
+        """
+        h = hashlib.sha256()
+        h.update(repr((list(origens), [int(v) for v in valores], titulo, cor,
+                       tuple(self.figsize), self.dpi)).encode('utf-8'))
+        return h.hexdigest()
+
+    def renderizar(self, pedidos: List[Dict]) -> List[Optional[str]]:
+        """
+        Renderiza uma lista de gráficos independentes
+
+        Cada pedido é um dict com 'origens', 'valores', 'titulo', 'cor' e 'caminho'
+        (destino final do PNG). Acertos de cache são copiados; os demais são
+        renderizados em paralelo.
+
+        Args:
+            pedidos: Lista de pedidos de gráfico
+
+        Returns:
+            Lista de caminhos gerados (None para pedidos que falharam), na mesma ordem
+        """
+        resultados: List[Optional[str]] = [None] * len(pedidos)
+        pendentes = []
+
+        for idx, pedido in enumerate(pedidos):
+            chave = self.chave_cache(pedido['origens'], pedido['valores'], pedido['titulo'], pedido['cor'])
+            caminho_cache = os.path.join(self.cache_dir, f"{chave}.png")
+
+            if os.path.exists(caminho_cache):
+                try:
+                    shutil.copyfile(caminho_cache, pedido['caminho'])
+                    resultados[idx] = pedido['caminho']
+                    logger.info(f"Gráfico reutilizado do cache: {pedido['caminho']}")
+                    continue
+                except OSError as e:
+                    logger.warning(f"Falha ao copiar gráfico do cache, renderizando: {e}")
+
+            spec = {
+                'origens': list(pedido['origens']),
+                'valores': [int(v) for v in pedido['valores']],
+                'titulo': pedido['titulo'],
+                'cor': pedido['cor'],
+                'figsize': self.figsize,
+                'dpi': self.dpi,
+                'caminho': caminho_cache,
+            }
+            pendentes.append((idx, spec, pedido['caminho']))
+
+        if not pendentes:
+            return resultados
+
+        if len(pendentes) == 1 or self.max_workers == 1:
+            renderizados = [_renderizar_seguro(spec) for _, spec, _ in pendentes]
+        else:
+            executor_cls = ProcessPoolExecutor if self.usar_processos else ThreadPoolExecutor
+            with executor_cls(max_workers=min(self.max_workers, len(pendentes))) as executor:
+                renderizados = list(executor.map(_renderizar_seguro, [spec for _, spec, _ in pendentes]))
+
+        for (idx, spec, destino), renderizado in zip(pendentes, renderizados):
+            if renderizado is None:
+                continue
+            try:
+                shutil.copyfile(renderizado, destino)
+                resultados[idx] = destino
+                logger.info(f"Gráfico gerado: {destino}")
+            except OSError as e:
+                logger.error(f"Erro ao copiar gráfico renderizado: {e}")
+
+        self._podar_cache()
+        return resultados
+
+    def _podar_cache(self):
+        """
+        Mantém apenas os max_entradas_cache PNGs mais recentes no cache
+        """
+        try:
+            arquivos = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.png')]
+            if len(arquivos) <= self.max_entradas_cache:
+                return
+
+            arquivos.sort(key=os.path.getmtime, reverse=True)
+            for caminho in arquivos[self.max_entradas_cache:]:
+                os.remove(caminho)
+
+        except Exception as e:
+            logger.error(f"Erro ao podar cache de gráficos: {e}")
+
+
+def _renderizar_seguro(spec: Dict) -> Optional[str]:
+    """
+    Renderiza um gráfico retornando None em caso de erro
+
+    Args:
+        spec: Especificação do gráfico
+
+    Returns:
+        Caminho do PNG ou None
+    """
+    try:
+        # Renderiza em arquivo temporário e renomeia: o cache nunca fica com PNG parcial
+        caminho_final = spec['caminho']
+        tmp_spec = dict(spec, caminho=f"{caminho_final}.{os.getpid()}.{threading.get_ident()}.tmp.png")
+        renderizar_ranking(tmp_spec)
+        os.replace(tmp_spec['caminho'], caminho_final)
+        return caminho_final
+    except Exception as e:
+        logger.error(f"Erro ao renderizar gráfico '{spec.get('titulo')}': {e}")
+        return None
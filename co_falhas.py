@@ -0,0 +1,217 @@
+"""
+Módulo de Co-falhas de Origens
+Matriz janela x origem da taxa de negadas, mantida incrementalmente em disco
+(.npz), e agrupamento das origens que falham juntas (correlação entre janelas
++ componentes conexos), para indicar causas comuns (gateway, integrador)
+"""
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class MatrizFalhas:
+    """
+    Taxas de negadas por janela (linhas) e origem (colunas)
+
+    A cada janela é acrescentada uma linha (origens novas ganham uma coluna);
+    as janelas mais antigas que max_janelas são descartadas. Origens com menos
+    de min_transacoes na janela ficam com NaN (taxa pouco confiável).
+    """
+
+    def __init__(self, caminho: str, max_janelas: int = 336, min_transacoes: int = 5):
+        """
+        Carrega a matriz (vazia se o arquivo não existir)
+
+        Args:
+            caminho: Arquivo .npz da matriz
+            max_janelas: Janelas mantidas (336 = 7 dias de janelas de 30 min)
+            min_transacoes: Transações mínimas da origem na janela para registrar a taxa
+        """
+        self.caminho = caminho
+        self.max_janelas = max_janelas
+        self.min_transacoes = min_transacoes
+
+        self.janelas = np.array([], dtype=object)
+        self.origens = np.array([], dtype=object)
+        self.taxas = np.zeros((0, 0), dtype=np.float32)
+
+        if os.path.exists(caminho):
+            try:
+                with np.load(caminho, allow_pickle=False) as dados:
+                    self.janelas = dados['janelas'].astype(object)
+                    self.origens = dados['origens'].astype(object)
+                    self.taxas = dados['taxas']
+            except Exception as e:
+                logger.error(f"Matriz de co-falhas ilegível ({e}) - recomeçando vazia")
+
+    def __len__(self) -> int:
+        return len(self.janelas)
+
+    def acrescentar(self, chave_janela: str, agregado_origem: pd.DataFrame):
+        """
+        Acrescenta (ou substitui) a linha de uma janela
+
+        Args:
+            chave_janela: Fim da janela ('YYYY-MM-DD HH:MM')
+            agregado_origem: resultado['agregado_origem'] (Origem, total, negadas)
+        """
+        if agregado_origem is None or len(agregado_origem) == 0:
+            origens = np.array([], dtype=object)
+            taxas = np.array([], dtype=np.float32)
+        else:
+            total = agregado_origem['total'].to_numpy(dtype=float)
+            negadas = agregado_origem['negadas'].to_numpy(dtype=float)
+            origens = agregado_origem['Origem'].astype(str).to_numpy(dtype=object)
+            taxas = np.where(total >= self.min_transacoes, negadas / np.maximum(total, 1.0), np.nan).astype(np.float32)
+
+        # Novas origens viram colunas (NaN nas janelas anteriores)
+        novas = np.setdiff1d(origens, self.origens) if len(origens) else np.array([], dtype=object)
+        if len(novas):
+            self.origens = np.concatenate([self.origens, novas])
+            self.taxas = np.hstack([self.taxas, np.full((len(self.janelas), len(novas)), np.nan, dtype=np.float32)])
+
+        linha = np.full(len(self.origens), np.nan, dtype=np.float32)
+        if len(origens):
+            posicao = {o: i for i, o in enumerate(self.origens)}
+            linha[[posicao[o] for o in origens]] = taxas
+
+        existente = np.flatnonzero(self.janelas == chave_janela)
+        if len(existente):
+            self.taxas[existente[0]] = linha
+        else:
+            self.janelas = np.append(self.janelas, chave_janela)
+            self.taxas = np.vstack([self.taxas, linha[None, :]])
+
+        # Janela deslizante; origens sem nenhuma taxa restante saem da matriz
+        if len(self.janelas) > self.max_janelas:
+            self.janelas = self.janelas[-self.max_janelas:]
+            self.taxas = self.taxas[-self.max_janelas:]
+            ativas = ~np.isnan(self.taxas).all(axis=0)
+            self.origens = self.origens[ativas]
+            self.taxas = self.taxas[:, ativas]
+
+    def salvar(self):
+        """
+        Grava a matriz (arquivo temporário + rename, nunca deixa um .npz pela metade)
+        """
+        diretorio = os.path.dirname(self.caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        temporario = self.caminho + '.tmp.npz'
+        np.savez(temporario, janelas=self.janelas.astype(str), origens=self.origens.astype(str), taxas=self.taxas)
+        os.replace(temporario, self.caminho)
+
+    def carregar_historico(self, origens_historico: pd.DataFrame):
+        """
+        Preenche a matriz a partir de HistoricoJanelas.carregar_origens() (primeira execução)
+
+        Args:
+            origens_historico: DataFrame com fim_janela, origem, total e negadas
+        """
+        if origens_historico is None or len(origens_historico) == 0:
+            return
+        for chave, grupo in origens_historico.groupby('fim_janela', sort=True):
+            self.acrescentar(chave, grupo.rename(columns={'origem': 'Origem'}))
+
+    def correlacao(self, origens: List[str], min_janelas: int = 6):
+        """
+        Correlação entre as taxas das origens, usando em cada par só as janelas com as duas taxas
+
+        Totalmente vetorizada: somas de pares via produtos de matrizes com a
+        máscara de presença (sem laço por par).
+
+        Args:
+            origens: Origens a correlacionar
+            min_janelas: Janelas em comum mínimas (abaixo disso a correlação é NaN)
+
+        Returns:
+            Tupla (origens encontradas, matriz de correlação, matriz de janelas em comum)
+        """
+        indice = {o: i for i, o in enumerate(self.origens)}
+        presentes = [o for o in dict.fromkeys(origens) if o in indice]
+        if len(presentes) < 2 or len(self.janelas) == 0:
+            return presentes, np.zeros((len(presentes), len(presentes))), np.zeros((len(presentes), len(presentes)))
+
+        x = self.taxas[:, [indice[o] for o in presentes]].astype(np.float64)
+        m = (~np.isnan(x)).astype(np.float64)
+        x = np.nan_to_num(x)
+
+        n = m.T @ m                       # janelas em comum por par
+        sx = x.T @ m                      # soma de x_i nas janelas em comum com j
+        sxx = (x * x).T @ m
+        sxy = x.T @ x
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sxy - sx * sx.T / n
+            var_i = sxx - sx * sx / n
+            var_j = var_i.T
+            corr = cov / np.sqrt(var_i * var_j)
+
+        corr[(n < min_janelas) | ~np.isfinite(corr)] = np.nan
+        return presentes, corr, n
+
+
+def componentes_conexos(adjacencia: np.ndarray) -> np.ndarray:
+    """
+    Rótulo do componente conexo de cada nó (propagação do menor rótulo, vetorizada)
+
+    Args:
+        adjacencia: Matriz booleana simétrica K x K
+
+    Returns:
+        Array de rótulos (nós do mesmo grupo têm o mesmo rótulo)
+    """
+    k = len(adjacencia)
+    rotulos = np.arange(k)
+    vizinhos = adjacencia | np.eye(k, dtype=bool)
+    for _ in range(k):
+        novos = np.where(vizinhos, rotulos[None, :], k).min(axis=1)
+        if np.array_equal(novos, rotulos):
+            break
+        rotulos = novos
+    return rotulos
+
+
+def agrupar_co_falhas(matriz: MatrizFalhas, origens: List[str], limiar: float = 0.7,
+                      min_janelas: int = 6) -> List[Dict]:
+    """
+    Grupos de origens cujas taxas de negadas sobem e descem juntas
+
+    Args:
+        matriz: Matriz de falhas atualizada com a janela atual
+        origens: Origens em falha na janela (ex: ranking de negadas)
+        limiar: Correlação mínima para ligar duas origens
+        min_janelas: Janelas em comum mínimas por par
+
+    Returns:
+        Lista de grupos (2+ origens), maiores primeiro: dicts com 'origens',
+        'correlacao_media' e 'janelas'
+    """
+    presentes, corr, n = matriz.correlacao(origens, min_janelas)
+    if len(presentes) < 2:
+        return []
+
+    adjacencia = np.nan_to_num(corr, nan=-1.0) >= limiar
+    np.fill_diagonal(adjacencia, False)
+    rotulos = componentes_conexos(adjacencia)
+
+    grupos = []
+    for rotulo in np.unique(rotulos):
+        membros = np.flatnonzero(rotulos == rotulo)
+        if len(membros) < 2:
+            continue
+        sub = corr[np.ix_(membros, membros)]
+        pares = sub[np.triu_indices(len(membros), k=1)]
+        grupos.append({
+            'origens': [presentes[i] for i in membros],
+            'correlacao_media': round(float(np.nanmean(pares)), 2),
+            'janelas': int(np.min(n[np.ix_(membros, membros)])),
+        })
+
+    grupos.sort(key=lambda g: (-len(g['origens']), -g['correlacao_media']))
+    return grupos
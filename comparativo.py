@@ -0,0 +1,140 @@
+"""
+Módulo de Contexto Comparativo
+Variação da janela atual em relação à janela anterior, ao mesmo horário de
+ontem e ao mesmo horário da semana passada, a partir do histórico de janelas
+(consultas pela chave fim_janela, sem reler exports antigos)
+"""
+
+import logging
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from historico_janelas import HistoricoJanelas
+
+logger = logging.getLogger(__name__)
+
+
+# Referências comparadas: (chave, rótulo no e-mail, distância até a janela atual)
+REFERENCIAS = [
+    ('janela_anterior', 'Janela anterior', timedelta(minutes=30)),
+    ('ontem', 'Ontem', timedelta(days=1)),
+    ('semana_passada', 'Semana passada', timedelta(days=7)),
+]
+
+# Métricas da tabela comparativa: (rótulo, coluna, tipo de variação, formato do valor atual)
+METRICAS = [
+    ('Total de Transações', 'total_transacoes', 'relativa', '{:.0f}'),
+    ('Recargas Negadas (%)', 'percentual_negadas', 'pontos', '{:.2f}'),
+    ('Erro N2 (%)', 'percentual_n2', 'pontos', '{:.2f}'),
+    ('Valor Negado (%)', 'percentual_valor_negado', 'pontos', '{:.2f}'),
+    ('Valor Negado (R$)', 'valor_negado', 'relativa', '{:.2f}'),
+]
+
+
+def montar_comparativo(historico: HistoricoJanelas, fim_janela: datetime, origens: Optional[List[str]] = None,
+                       tolerancia_min: int = 5) -> Dict:
+    """
+    Busca no histórico as janelas de referência e os agregados das origens
+
+    Args:
+        historico: Histórico de janelas aberto
+        fim_janela: Fim da janela atual
+        origens: Origens cujos agregados são buscados (ex: as dos rankings)
+        tolerancia_min: Diferença máxima entre o horário procurado e o fim da janela gravada
+
+    Returns:
+        Dict com 'referencias': lista (na ordem de REFERENCIAS) de dicts com
+        'chave', 'rotulo' e 'janela' (linha da tabela janelas ou None), e
+        'origens': dict chave da referência -> DataFrame indexado pela origem
+        (total, negadas, n2, valor_negado)
+    """
+    comparativo = {'referencias': [], 'origens': {}}
+    for chave, rotulo, distancia in REFERENCIAS:
+        janela = historico.janela_mais_proxima(fim_janela - distancia, tolerancia_min)
+        comparativo['referencias'].append({'chave': chave, 'rotulo': rotulo, 'janela': janela})
+
+        if janela is None or not origens:
+            continue
+        momento = datetime.strptime(janela['fim_janela'], '%Y-%m-%d %H:%M')
+        agregados = historico.carregar_origens(inicio=momento, fim=momento, origens=origens)
+        comparativo['origens'][chave] = agregados.set_index('origem')[['total', 'negadas', 'n2', 'valor_negado']]
+
+    return comparativo
+
+
+def _variacao(atual: float, anterior: Optional[float], tipo: str) -> str:
+    """
+    Texto da variação de uma métrica ('+2.35 p.p.', '-12.0%', 'n/d')
+    """
+    if anterior is None:
+        return 'n/d'
+    if tipo == 'pontos':
+        return f"{atual - anterior:+.2f} p.p."
+    if anterior == 0:
+        return 'n/d' if atual == 0 else 'novo'
+    return f"{(atual - anterior) / anterior * 100:+.1f}%"
+
+
+def tabela_comparativa(resultado: Dict, comparativo: Optional[Dict]) -> pd.DataFrame:
+    """
+    Tabela das métricas da janela atual com a variação contra cada referência
+
+    Args:
+        resultado: Resultado da análise
+        comparativo: Retorno de montar_comparativo()
+
+    Returns:
+        DataFrame (Métrica, Atual e uma coluna 'Δ <referência>' por referência);
+        vazio se nenhuma referência foi encontrada
+    """
+    if not comparativo or not any(r['janela'] for r in comparativo['referencias']):
+        return pd.DataFrame()
+
+    linhas = []
+    for rotulo, coluna, tipo, formato in METRICAS:
+        atual = float(resultado.get(coluna, 0.0) or 0.0)
+        linha = {'Métrica': rotulo, 'Atual': formato.format(atual)}
+        for referencia in comparativo['referencias']:
+            janela = referencia['janela']
+            anterior = float(janela[coluna] or 0.0) if janela else None
+            linha[f"Δ {referencia['rotulo']}"] = _variacao(atual, anterior, tipo)
+        linhas.append(linha)
+
+    return pd.DataFrame(linhas)
+
+
+def acrescentar_deltas(ranking: pd.DataFrame, comparativo: Optional[Dict], coluna_ranking: str,
+                       metrica: str) -> pd.DataFrame:
+    """
+    Acrescenta a um ranking de origens a variação da contagem contra cada referência
+
+    Args:
+        ranking: Ranking com as colunas 'Origem' e coluna_ranking
+        comparativo: Retorno de montar_comparativo()
+        coluna_ranking: Coluna com a contagem atual (ex: 'Total Negadas')
+        metrica: Coluna correspondente no histórico ('negadas' ou 'n2')
+
+    Returns:
+        Cópia do ranking com uma coluna 'Δ <referência>' por referência encontrada
+        ('+5', '-3', 'novo' se a origem não teve a métrica na referência)
+    """
+    if ranking is None or len(ranking) == 0 or not comparativo or coluna_ranking not in ranking.columns:
+        return ranking
+
+    ranking = ranking.copy()
+    origens = ranking['Origem'].astype(str)
+    atual = ranking[coluna_ranking].astype(float).to_numpy()
+
+    for referencia in comparativo['referencias']:
+        if referencia['janela'] is None:
+            continue
+        agregados = comparativo['origens'].get(referencia['chave'])
+        if agregados is None:
+            agregados = pd.DataFrame(columns=[metrica])
+        anterior = agregados[metrica].reindex(origens).fillna(0).astype(float).to_numpy()
+        ranking[f"Δ {referencia['rotulo']}"] = [
+            'novo' if a == 0 and v > 0 else f"{v - a:+.0f}" for v, a in zip(atual, anterior)
+        ]
+
+    return ranking
@@ -18,15 +18,116 @@ DOWNLOAD_DIR = os.path.join(BASE_DIR, "Recargas")
 SCREENSHOT_DIR = os.path.join(BASE_DIR, "Screenshots")
 LOG_DIR = os.path.join(BASE_DIR, "Logs")
 
+# Histórico de agregados por janela (SQLite)
+HISTORICO_DB_PATH = os.path.join(BASE_DIR, "historico", "historico_janelas.db")
+
+# Arquivo colunar (Parquet) das transações de cada janela, particionado por
+# data/hora - consultas via: python3 arquivo_transacoes.py consultar ...
+# None = desativado (requer pyarrow)
+ARQUIVO_TRANSACOES_DIR = os.path.join(BASE_DIR, "arquivo_transacoes")
+
+# ===== RETENÇÃO DE ARQUIVOS =====
+# Arquivos que saem dos diretórios quentes são compactados em zips diários
+# (com manifest.json) dentro de ARQUIVO_DIR/<categoria>/
+ARQUIVO_DIR = os.path.join(BASE_DIR, "arquivo")
+RETENCAO_POLITICAS = {
+    "Recargas": {
+        "diretorio": DOWNLOAD_DIR,
+        "padrao": "Transacao*",
+        "dias_quente": 2,        # Dias no diretório quente
+        "max_mb_quente": 200,    # Cota do diretório quente
+        "dias_arquivo": 365,     # Dias mantidos compactados (None = sempre)
+    },
+    "output": {
+        "diretorio": os.path.join(BASE_DIR, "output"),
+        "padrao": "*.*",
+        "dias_quente": 2,
+        "max_mb_quente": 100,
+        "dias_arquivo": 90,
+    },
+    "Logs": {
+        "diretorio": LOG_DIR,
+        "padrao": "*.log*",
+        "dias_quente": 3,
+        "max_mb_quente": 100,
+        "dias_arquivo": 180,
+    },
+}
+
 # ===== BANCO DE DADOS (OPCIONAL) =====
 DB_HOST = "seu-db-host.exemplo.com"
 DB_USER = "seu_usuario_db"
 DB_PASSWORD = "sua_senha_db"
 DB_NAME = "nome_database"
 
+# Carga das transações e agregados de cada janela no banco (db_loader.py)
+# DB_BACKEND: "mysql" (usa DB_HOST/DB_USER/DB_PASSWORD/DB_NAME) ou
+# "sqlite" (arquivo local em DB_SQLITE_PATH, útil para testes offline)
+DB_LOADER_ATIVO = False
+DB_BACKEND = "mysql"
+DB_SQLITE_PATH = os.path.join(BASE_DIR, "historico", "recargas.db")
+
+# Alerta em duas fases: resumo imediato (só com a análise) e relatório completo
+# (gráficos + Excel) gerado em segundo plano e enviado como resposta ao resumo
+ALERTA_DUAS_FASES = True
+ALERTA_TIMEOUT_RELATORIO_S = 600  # Espera máxima pelo relatório antes de encerrar o processo
+
+# Queda de volume: transações por janela comparadas com o esperado para a meia hora
+# da semana (total e por origem), aprendido incrementalmente das janelas anteriores
+VOLUME_ATIVO = False
+VOLUME_MIN_SEMANAS = 4          # Semanas observadas antes de avaliar um horário
+VOLUME_Z_LIMITE = 3.0           # Desvios abaixo do esperado para considerar queda
+VOLUME_FATOR_QUEDA = 0.5        # ... e abaixo de 50% do esperado
+VOLUME_FATOR_CRITICO = 0.2      # Total abaixo de 20% do esperado = Crítico (colapso)
+VOLUME_MINIMO_ORIGEM = 20       # Volume esperado mínimo para acusar origem sem tráfego
+
+# Co-falhas: matriz janela x origem da taxa de negadas (últimas N janelas) e
+# grupos de origens do ranking que falham juntas, anotados no e-mail de alerta
+CO_FALHAS_ATIVO = False
+CO_FALHAS_PATH = os.path.join(BASE_DIR, "historico", "co_falhas.npz")
+CO_FALHAS_JANELAS = 336         # 7 dias de janelas de 30 minutos
+CO_FALHAS_CORRELACAO = 0.7      # Correlação mínima para ligar duas origens
+
+# Comparativo no e-mail: variação contra a janela anterior, o mesmo horário de
+# ontem e o da semana passada (geral e por origem nos rankings), lida do histórico
+COMPARATIVO_ATIVO = True
+COMPARATIVO_TOLERANCIA_MIN = 5  # Diferença máxima até o fim da janela de referência
+
+# Cubo Origem x Cod Resp x Estado x bucket de cada janela (None = não grava).
+# Consulta de várias janelas: python3 cubo_recargas.py --inicio ... --fim ... --por origem
+# (inclua o diretório em RETENCAO_POLITICAS para limitar o espaço)
+CUBO_DIR = None  # ex: os.path.join(BASE_DIR, "historico", "cubos")
+
+# Saúde do portal: tempo de cada etapa do GWCelWeb e tamanho do export gravados a cada
+# execução (relatório: python3 telemetria_portal.py --dias 7)
+PORTAL_TELEMETRIA_ATIVO = True
+PORTAL_ALERTA_ATIVO = False         # E-mail quando o portal fica degradado/normaliza
+PORTAL_AMOSTRAS_BASE = 336          # Execuções na linha de base (7 dias de janelas de 30 min)
+PORTAL_MIN_AMOSTRAS = 10            # Execuções antes de avaliar uma etapa
+PORTAL_FATOR_LENTIDAO = 2.0         # Etapa lenta acima de 2x a mediana...
+PORTAL_MINIMO_S = 5.0               # ... e de mediana + 5 segundos
+PORTAL_EXECUCOES_DEGRADADAS = 2     # Execuções lentas seguidas para alarmar
+
+# Esperas do portal por condição: timeout da etapa = percentil da latência registrada x margem
+ESPERA_PERCENTIL = 99
+ESPERA_MARGEM = 1.5
+ESPERA_MINIMO_S = 5.0               # Timeout mínimo de uma etapa
+ESPERA_MAXIMO_S = 120.0             # Timeout calibrado máximo
+ESPERA_EXTENSAO_S = 10.0            # Extensão única após o timeout de uma etapa (0 = nenhuma)
+ESPERA_MIN_AMOSTRAS = 20            # Medições da etapa antes de sair do timeout padrão
+
+# Alvo de latência de detecção: segundos entre o fim da janela e a primeira notificação
+# (relatório: python3 slo_latencia.py --dias 7)
+SLO_DETECCAO_S = 600
+
 # ===== TELEGRAM (OPCIONAL) =====
+# Aviso curto (nível, percentuais, top 3 origens) na abertura e no escalonamento
+# do incidente, enviado logo após a análise, antes do relatório e do e-mail
+TELEGRAM_ATIVO = False
 TELEGRAM_TOKEN = "1234567890:ABCdefGHIjklMNOpqrsTUVwxyz"
 TELEGRAM_CHAT_ID = "-123456789"
+TELEGRAM_API_URL = "https://api.telegram.org"  # Trocar por um servidor HTTP local para testes
+TELEGRAM_TIMEOUT_S = 10
 
 # ===== CONFIGURAÇÕES DE E-MAIL =====
 # Configurações SMTP para envio de alertas
@@ -35,6 +136,35 @@ EMAIL_SMTP_PORT = 587  # Porta TLS padrão
 EMAIL_USER = "seu.email@exemplo.com"  # E-mail que enviará os alertas
 EMAIL_PASSWORD = "sua_senha_email"  # Senha do e-mail ou app password
 
+# Protocolo: STARTTLS antes do login (False apenas para servidores SMTP locais de teste)
+EMAIL_USAR_TLS = True
+
+# Caixa de saída em disco: alertas são enfileirados e enviados por um worker
+# com conexão persistente e reenvio com backoff (falha do SMTP não perde o alarme)
+# None = envio síncrono. Drenagem manual: python3 email_outbox.py drenar
+EMAIL_OUTBOX_DIR = os.path.join(BASE_DIR, "outbox")
+
+# Gráficos de ranking no corpo do e-mail: "html" (tabela CSS, compatível com
+# Outlook), "svg" (webmail/Apple Mail) ou None (desativado)
+EMAIL_GRAFICOS_INLINE = "html"
+
+# Limites do corpo do relatório: linhas por seção e tamanho total do HTML
+# (abaixo do corte de ~102 KB do Gmail). Seções além do limite são truncadas com nota.
+EMAIL_LIMITES_LINHAS = {
+    "resumo": None,
+    "ranking_negadas": 20,
+    "ranking_n2": 20,
+    "codigos": 20,
+    "negadas": 50,
+}
+EMAIL_LIMITE_BYTES = 95_000
+
+# Anexos (Excel e gráficos PNG): codificados em blocos; o que exceder o limite
+# (somado, já em base64) é citado no corpo pelo caminho local em vez de anexado
+EMAIL_LIMITE_ANEXOS_MB = 10
+EMAIL_COMPACTAR_ANEXOS = False  # True = um único .zip com todos os anexos
+EMAIL_ANEXAR_GRAFICOS = True
+
 # Destinatários dos alertas
 EMAIL_DESTINATARIOS_NOC = [
     "equipe1@exemplo.com",
@@ -42,6 +172,29 @@ EMAIL_DESTINATARIOS_NOC = [
     "noc@exemplo.com",
 ]
 
+# Modo digest: durante um incidente, a abertura recebe o relatório completo e as
+# janelas seguintes são acumuladas no histórico e enviadas em um único e-mail
+# consolidado (tendência por janela + rankings combinados) a cada
+# DIGEST_INTERVALO_MINUTOS, na mudança de severidade ou na resolução
+DIGEST_ATIVO = False
+DIGEST_INTERVALO_MINUTOS = 120
+
+# Roteamento de alertas: cada grupo recebe apenas as origens/códigos da sua rota
+# (além do relatório completo para EMAIL_DESTINATARIOS_NOC). Avaliado em toda janela,
+# independente do incidente do NOC: e-mail quando a fatia da rota atinge a severidade
+# mínima ou escala. origens/codigos = None significa "todos".
+ROTAS_ALERTA = [
+    # {
+    #     "nome": "Parceiro Exemplo",
+    #     "destinatarios": ["noc@parceiro.exemplo.com"],
+    #     "origens": ["ORIGEM_A", "ORIGEM_B"],
+    #     "codigos": None,
+    #     "severidade_minima": "Alerta",  # 'Normal', 'Alerta' ou 'Crítico'
+    # },
+]
+# Último nível notificado por rota (uma rota não recebe o mesmo alerta a cada janela)
+ROTAS_ESTADO_PATH = os.path.join(BASE_DIR, "historico", "estado_rotas.json")
+
 # ===== THRESHOLDS DE ALARMÍSTICA =====
 # IMPORTANTE: Thresholds baseados em análise histórica
 # Ajuste conforme o comportamento do seu sistema
@@ -74,14 +227,28 @@ THRESHOLDS_POR_PERIODO = {
 # Fallback: Se não conseguir determinar o período, usar valores padrão
 THRESHOLD_WARNING_NEGADAS = 10.0  # 10% de recargas negadas (padrão)
 
+# Alarme ponderado por VALOR (opcional): percentual do valor (R$) das recargas
+# que foi negado. None = desativado. Pode ser sobrescrito por período com a
+# chave "threshold_valor_negadas" em THRESHOLDS_POR_PERIODO.
+THRESHOLD_VALOR_NEGADAS = None
+
+# ===== ESTADO DO ALARME (HISTERESE) =====
+# O relatório completo (gráficos + Excel) é enviado só na abertura e no
+# escalonamento do incidente; janelas seguintes recebem uma atualização leve.
+ALARME_ESTADO_PATH = os.path.join(BASE_DIR, "historico", "estado_alarme.json")
+# Incidente só é resolvido com métricas abaixo de threshold × fator
+ALARME_FATOR_HISTERESE = 0.8
+# Janelas seguintes abaixo da histerese para considerar resolvido
+ALARME_JANELAS_PARA_RESOLVER = 2
+
 # ===== FUNÇÕES HELPER =====
-def get_periodo_do_dia():
+def get_periodo_do_dia(momento=None):
     """
-    Determina o período do dia baseado na hora atual
+    Determina o período do dia baseado na hora atual (ou em momento, para replay)
     Returns: 'manha', 'tarde', 'noite' ou 'madrugada'
     """
     from datetime import datetime
-    hora_atual = datetime.now().hour
+    hora_atual = (momento or datetime.now()).hour
 
     if 6 <= hora_atual < 12:
         return "manha"
@@ -92,12 +259,13 @@ def get_periodo_do_dia():
     else:
         return "madrugada"
 
-def get_thresholds_atuais():
+def get_thresholds_atuais(momento=None):
     """
     Retorna os thresholds apropriados baseados no período do dia atual
-    Returns: dict com 'threshold_negadas' e 'threshold_n2'
+    (ou no período de momento, usado pelo replay de janelas antigas)
+    Returns: dict com 'threshold_negadas', 'threshold_n2' e 'threshold_valor_negadas'
     """
-    periodo = get_periodo_do_dia()
+    periodo = get_periodo_do_dia(momento)
     thresholds = THRESHOLDS_POR_PERIODO.get(periodo, {
         "threshold_negadas": THRESHOLD_WARNING_NEGADAS,
         "threshold_n2": THRESHOLD_ALERT_N2
@@ -105,5 +273,6 @@ def get_thresholds_atuais():
     return {
         "periodo": periodo,
         "threshold_negadas": thresholds["threshold_negadas"],
-        "threshold_n2": thresholds["threshold_n2"]
+        "threshold_n2": thresholds["threshold_n2"],
+        "threshold_valor_negadas": thresholds.get("threshold_valor_negadas", THRESHOLD_VALOR_NEGADAS)
     }
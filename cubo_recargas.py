@@ -0,0 +1,418 @@
+"""
+Módulo do Cubo de Recargas
+Contagens e soma de Valor por Origem x Cod Resp x Estado x bucket de tempo,
+montadas uma vez por janela em arrays esparsos (só as células com transações),
+combináveis entre janelas e consultadas por fatia/consolidação sem voltar às
+linhas do export
+
+Uso (consulta ad hoc sobre os cubos gravados em CUBO_DIR):
+    python3 cubo_recargas.py --inicio "2026-10-19 08:00" --fim "2026-10-19 12:00" \\
+        --por origem,cod_resp [--estado Negada] [--origem X] [--top 20] [--dir caminho]
+"""
+
+import os
+import sys
+import glob
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+# Dimensões do cubo, na ordem das colunas de coordenadas
+DIMENSOES = ['origem', 'cod_resp', 'estado', 'bucket']
+
+# Filtro de uma dimensão: um rótulo, uma lista de rótulos ou uma função rótulos -> máscara
+Filtro = Union[object, Iterable, Callable[[pd.Index], np.ndarray]]
+
+
+class CuboRecargas:
+    """
+    Cubo esparso de recargas
+
+    Cada dimensão tem um domínio (pd.Index de rótulos, nulos incluídos);
+    cada célula não vazia é uma linha de coordenadas (posições nos domínios)
+    com a quantidade de transações e a soma de Valor. Fatiar é uma máscara
+    sobre as células; consolidar é um np.bincount sobre as dimensões mantidas.
+    """
+
+    def __init__(self, dominios: Dict[str, pd.Index], coordenadas: np.ndarray,
+                 quantidade: np.ndarray, valor: np.ndarray):
+        """
+        Cria o cubo a partir das células (use construir() ou mesclar())
+
+        Args:
+            dominios: Dimensão -> rótulos
+            coordenadas: Matriz (células x 4) com a posição de cada célula em cada domínio
+            quantidade: Transações por célula
+            valor: Soma de Valor por célula
+        """
+        self.dominios = dominios
+        self.coordenadas = coordenadas
+        self.quantidade = quantidade
+        self.valor = valor
+
+    def __len__(self) -> int:
+        return len(self.quantidade)
+
+    @property
+    def forma(self) -> tuple:
+        """
+        Tamanho de cada dimensão (forma do cubo denso equivalente)
+        """
+        return tuple(len(self.dominios[d]) for d in DIMENSOES)
+
+    @classmethod
+    def _consolidar_celulas(cls, dominios: Dict[str, pd.Index], coordenadas: np.ndarray,
+                            quantidade: np.ndarray, valor: np.ndarray) -> 'CuboRecargas':
+        """
+        Soma células repetidas (mesmas coordenadas) em uma só
+        """
+        forma = tuple(len(dominios[d]) for d in DIMENSOES)
+        if len(coordenadas) == 0:
+            return cls(dominios, np.zeros((0, len(DIMENSOES)), dtype=np.int64),
+                       np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+
+        plano = np.ravel_multi_index(tuple(coordenadas.T), forma)
+        celulas, inverso = np.unique(plano, return_inverse=True)
+        return cls(
+            dominios,
+            np.column_stack(np.unravel_index(celulas, forma)).astype(np.int64),
+            np.bincount(inverso, weights=quantidade, minlength=len(celulas)).astype(np.int64),
+            np.bincount(inverso, weights=valor, minlength=len(celulas)),
+        )
+
+    @classmethod
+    def construir(cls, origem: pd.Series, cod_resp: pd.Series, estado: pd.Series,
+                  bucket: pd.Series, valor: pd.Series) -> 'CuboRecargas':
+        """
+        Monta o cubo de uma janela a partir das colunas das transações
+
+        Args:
+            origem: Coluna Origem
+            cod_resp: Coluna Cod Resp (como texto)
+            estado: Coluna Estado Transação
+            bucket: Data/Hora Origem já arredondada ao bucket (NaT se ausente)
+            valor: Valor numérico de cada transação
+
+        Returns:
+            CuboRecargas
+        """
+        dominios = {}
+        codigos = []
+        for dimensao, serie in zip(DIMENSOES, (origem, cod_resp, estado, bucket)):
+            if dimensao != 'bucket':
+                # Rótulos como texto (como no histórico), para combinar com cubos lidos do disco
+                serie = serie.where(serie.isna(), serie.astype(str))
+            codigo, rotulos = pd.factorize(serie, use_na_sentinel=False)
+            dominios[dimensao] = pd.Index(rotulos)
+            codigos.append(codigo)
+
+        return cls._consolidar_celulas(
+            dominios,
+            np.column_stack(codigos).astype(np.int64) if len(codigos[0]) else np.zeros((0, len(DIMENSOES)), dtype=np.int64),
+            np.ones(len(codigos[0]), dtype=np.int64),
+            np.asarray(valor, dtype=np.float64),
+        )
+
+    @classmethod
+    def mesclar(cls, cubos: List['CuboRecargas']) -> 'CuboRecargas':
+        """
+        Combina cubos (ex: várias janelas) em um só, unindo os domínios
+
+        Args:
+            cubos: Cubos a combinar
+
+        Returns:
+            CuboRecargas com as somas de todos
+        """
+        cubos = [c for c in cubos if c is not None]
+        if not cubos:
+            return cls({d: pd.Index([]) for d in DIMENSOES}, np.zeros((0, len(DIMENSOES)), dtype=np.int64),
+                       np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+
+        dominios = {}
+        for dimensao in DIMENSOES:
+            uniao = cubos[0].dominios[dimensao]
+            for cubo in cubos[1:]:
+                uniao = uniao.union(cubo.dominios[dimensao], sort=False)
+            dominios[dimensao] = uniao
+
+        # Reposiciona as coordenadas de cada cubo nos domínios unidos
+        coordenadas = []
+        for cubo in cubos:
+            mapa = [dominios[d].get_indexer(cubo.dominios[d]) for d in DIMENSOES]
+            coordenadas.append(np.column_stack([m[cubo.coordenadas[:, i]] for i, m in enumerate(mapa)])
+                               if len(cubo) else np.zeros((0, len(DIMENSOES)), dtype=np.int64))
+
+        return cls._consolidar_celulas(
+            dominios,
+            np.concatenate(coordenadas),
+            np.concatenate([c.quantidade for c in cubos]),
+            np.concatenate([c.valor for c in cubos]),
+        )
+
+    def fatiar(self, **filtros: Filtro) -> 'CuboRecargas':
+        """
+        Restringe o cubo a alguns rótulos de uma ou mais dimensões
+
+        Exemplos:
+            cubo.fatiar(cod_resp='N2')
+            cubo.fatiar(origem=['A', 'B'], estado=lambda e: e.astype(str).str.contains('Negada'))
+
+        Args:
+            **filtros: Dimensão -> rótulo, lista de rótulos ou função (domínio -> máscara booleana)
+
+        Returns:
+            CuboRecargas com as mesmas dimensões e só as células selecionadas
+        """
+        manter = np.ones(len(self), dtype=bool)
+        for dimensao, filtro in filtros.items():
+            dominio = self.dominios[dimensao]
+            if callable(filtro):
+                permitidos = np.asarray(filtro(dominio), dtype=bool)
+            else:
+                # Domínios pequenos: teste rótulo a rótulo é mais rápido que isin do pandas
+                aceitos = set(filtro) if isinstance(filtro, (list, tuple, set, np.ndarray, pd.Index)) else {filtro}
+                permitidos = np.fromiter((v in aceitos for v in dominio), dtype=bool, count=len(dominio))
+            manter &= permitidos[self.coordenadas[:, DIMENSOES.index(dimensao)]]
+
+        # take com índices: bem mais rápido que a máscara booleana na matriz de coordenadas
+        celulas = np.flatnonzero(manter)
+        return CuboRecargas(self.dominios, self.coordenadas.take(celulas, axis=0),
+                            self.quantidade.take(celulas), self.valor.take(celulas))
+
+    def agregar(self, por: List[str], descartar_nulos: bool = True) -> pd.DataFrame:
+        """
+        Consolida o cubo nas dimensões pedidas (soma sobre as demais)
+
+        Args:
+            por: Dimensões mantidas (ex: ['origem'], ['bucket', 'estado'])
+            descartar_nulos: Remove as linhas com rótulo nulo (como o groupby do pandas)
+
+        Returns:
+            DataFrame com uma coluna por dimensão, 'quantidade' e 'valor'
+        """
+        if not por:
+            return pd.DataFrame({'quantidade': [int(self.quantidade.sum())], 'valor': [float(self.valor.sum())]})
+
+        eixos = [DIMENSOES.index(d) for d in por]
+        if len(self) == 0:
+            return pd.DataFrame({**{d: pd.Series([], dtype=self.dominios[d].dtype) for d in por},
+                                 'quantidade': pd.Series([], dtype=np.int64), 'valor': pd.Series([], dtype=np.float64)})
+
+        forma = tuple(len(self.dominios[d]) for d in por)
+        plano = np.ravel_multi_index(tuple(self.coordenadas[:, e] for e in eixos), forma)
+        tamanho = int(np.prod(forma))
+
+        if tamanho <= max(4 * len(self), 4096):
+            # Poucas combinações possíveis: soma direta no cubo denso consolidado (sem ordenar)
+            quantidade = np.bincount(plano, weights=self.quantidade, minlength=tamanho)
+            valor = np.bincount(plano, weights=self.valor, minlength=tamanho)
+            celulas = np.flatnonzero(quantidade)
+            quantidade, valor = quantidade.take(celulas), valor.take(celulas)
+        else:
+            celulas, inverso = np.unique(plano, return_inverse=True)
+            quantidade = np.bincount(inverso, weights=self.quantidade, minlength=len(celulas))
+            valor = np.bincount(inverso, weights=self.valor, minlength=len(celulas))
+
+        posicoes = np.unravel_index(celulas, forma)
+        if descartar_nulos:
+            validas = np.ones(len(celulas), dtype=bool)
+            for d, p in zip(por, posicoes):
+                validas &= ~np.asarray(self.dominios[d].isna())[p]
+            manter = np.flatnonzero(validas)
+            posicoes = [p.take(manter) for p in posicoes]
+            quantidade, valor = quantidade.take(manter), valor.take(manter)
+
+        # Montado direto dos arrays (consulta de microssegundos, sem filtros do pandas)
+        colunas = {d: self.dominios[d].to_numpy()[p] for d, p in zip(por, posicoes)}
+        colunas['quantidade'] = quantidade.astype(np.int64)
+        colunas['valor'] = valor
+        return pd.DataFrame(colunas)
+
+    def total(self, medida: str = 'quantidade') -> float:
+        """
+        Soma de uma medida no cubo inteiro ('quantidade' ou 'valor')
+        """
+        return float(getattr(self, medida).sum())
+
+    def reagrupar_tempo(self, minutos: int) -> 'CuboRecargas':
+        """
+        Consolida os buckets de tempo em buckets maiores (ex: 60 para hora a hora)
+
+        Args:
+            minutos: Novo tamanho do bucket
+
+        Returns:
+            CuboRecargas com o domínio de tempo reduzido
+        """
+        novos = pd.DatetimeIndex(self.dominios['bucket']).floor(f"{minutos}min")
+        codigo, rotulos = pd.factorize(novos, use_na_sentinel=False)
+        dominios = dict(self.dominios)
+        dominios['bucket'] = pd.Index(rotulos)
+
+        coordenadas = self.coordenadas.copy()
+        coordenadas[:, DIMENSOES.index('bucket')] = codigo[self.coordenadas[:, DIMENSOES.index('bucket')]]
+        return self._consolidar_celulas(dominios, coordenadas, self.quantidade, self.valor)
+
+    # ===== PERSISTÊNCIA =====
+
+    def salvar(self, caminho: str):
+        """
+        Grava o cubo em .npz (arquivo temporário + rename)
+
+        Args:
+            caminho: Arquivo de destino
+        """
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        # Rótulos como texto + máscara de nulos; o bucket em datetime64 (nulos = NaT)
+        rotulos = {}
+        for dimensao in ('origem', 'cod_resp', 'estado'):
+            dominio = self.dominios[dimensao]
+            rotulos[dimensao] = np.array([str(v) for v in dominio], dtype=str)
+            rotulos[f"{dimensao}_nula"] = np.asarray(dominio.isna(), dtype=bool)
+
+        temporario = caminho + '.tmp.npz'
+        np.savez(
+            temporario,
+            coordenadas=self.coordenadas,
+            quantidade=self.quantidade,
+            valor=self.valor,
+            bucket=pd.DatetimeIndex(self.dominios['bucket']).to_numpy(dtype='datetime64[ns]'),
+            **rotulos,
+        )
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho: str) -> 'CuboRecargas':
+        """
+        Lê um cubo gravado com salvar()
+
+        Args:
+            caminho: Arquivo .npz
+
+        Returns:
+            CuboRecargas
+        """
+        with np.load(caminho, allow_pickle=False) as dados:
+            dominios = {}
+            for dimensao in ('origem', 'cod_resp', 'estado'):
+                rotulos = dados[dimensao].astype(object)
+                rotulos[dados[f"{dimensao}_nula"]] = np.nan
+                dominios[dimensao] = pd.Index(rotulos, dtype=object)
+            dominios['bucket'] = pd.DatetimeIndex(dados['bucket'])
+            return cls(dominios, dados['coordenadas'], dados['quantidade'], dados['valor'])
+
+
+def estados_negados(dominio: pd.Index) -> np.ndarray:
+    """
+    Filtro de estado das recargas negadas (mesmo critério de RecargaAnalyzer.analisar)
+    """
+    return np.fromiter((isinstance(e, str) and 'negada' in e.lower() for e in dominio),
+                       dtype=bool, count=len(dominio))
+
+
+def nome_arquivo(fim_janela: datetime) -> str:
+    """
+    Nome do arquivo do cubo de uma janela
+    """
+    return f"cubo_{fim_janela.strftime('%Y%m%d_%H%M')}.npz"
+
+
+def carregar_intervalo(diretorio: str, inicio: Optional[datetime] = None,
+                       fim: Optional[datetime] = None) -> CuboRecargas:
+    """
+    Combina os cubos gravados das janelas que terminam no intervalo
+
+    Args:
+        diretorio: Diretório dos cubos (CUBO_DIR)
+        inicio: Fim de janela mínimo (None = sem limite)
+        fim: Fim de janela máximo (None = sem limite)
+
+    Returns:
+        CuboRecargas combinado (vazio se não houver cubos)
+    """
+    cubos = []
+    for caminho in sorted(glob.glob(os.path.join(diretorio, "cubo_*.npz"))):
+        try:
+            momento = datetime.strptime(os.path.basename(caminho)[5:18], '%Y%m%d_%H%M')
+        except ValueError:
+            continue
+        if (inicio and momento < inicio) or (fim and momento > fim):
+            continue
+        try:
+            cubos.append(CuboRecargas.carregar(caminho))
+        except Exception as e:
+            logger.error(f"Cubo ilegível ignorado: {caminho} ({e})")
+    return CuboRecargas.mesclar(cubos)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI de consulta aos cubos gravados
+    """
+    parser = argparse.ArgumentParser(description="Consulta ad hoc aos cubos de recargas (Origem x Cod Resp x Estado x tempo)")
+    parser.add_argument('--inicio', default=None, help="Fim de janela mínimo 'YYYY-MM-DD HH:MM'")
+    parser.add_argument('--fim', default=None, help="Fim de janela máximo 'YYYY-MM-DD HH:MM'")
+    parser.add_argument('--por', default='origem', help=f"Dimensões mantidas, separadas por vírgula ({', '.join(DIMENSOES)})")
+    parser.add_argument('--estado', default=None, help="Filtra estados que contêm o texto (ex: Negada)")
+    parser.add_argument('--origem', action='append', default=None, help="Filtra uma origem (repetível)")
+    parser.add_argument('--cod-resp', action='append', default=None, help="Filtra um código de resposta (repetível)")
+    parser.add_argument('--bucket-min', type=int, default=None, help="Consolida o tempo em buckets deste tamanho")
+    parser.add_argument('--top', type=int, default=30, help="Linhas exibidas, por quantidade (padrão: 30)")
+    parser.add_argument('--dir', default=None, help="Diretório dos cubos (padrão: CUBO_DIR)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    diretorio = args.dir
+    if diretorio is None:
+        import config
+        diretorio = getattr(config, 'CUBO_DIR', None)
+    if not diretorio:
+        print("Informe --dir ou configure CUBO_DIR", file=sys.stderr)
+        return 1
+
+    por = [d.strip() for d in args.por.split(',') if d.strip()]
+    invalidas = [d for d in por if d not in DIMENSOES]
+    if invalidas:
+        print(f"Dimensão inválida: {', '.join(invalidas)}", file=sys.stderr)
+        return 1
+
+    formato = '%Y-%m-%d %H:%M'
+    cubo = carregar_intervalo(
+        diretorio,
+        datetime.strptime(args.inicio, formato) if args.inicio else None,
+        datetime.strptime(args.fim, formato) if args.fim else None,
+    )
+    if len(cubo) == 0:
+        print("Nenhum cubo no intervalo", file=sys.stderr)
+        return 1
+
+    filtros = {}
+    if args.estado:
+        filtros['estado'] = lambda e: e.astype(str).str.contains(args.estado, case=False, na=False)
+    if args.origem:
+        filtros['origem'] = args.origem
+    if args.cod_resp:
+        filtros['cod_resp'] = args.cod_resp
+    if args.bucket_min:
+        cubo = cubo.reagrupar_tempo(args.bucket_min)
+
+    tabela = cubo.fatiar(**filtros).agregar(por)
+    tabela = tabela.sort_values('quantidade', ascending=False).head(args.top)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(tabela.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+Módulo de Carga em Banco de Dados
+Grava as transações e os agregados de cada janela em MySQL (ou SQLite para
+testes offline), em lotes e em uma única transação por janela
+"""
+
+import os
+import logging
+import sqlite3
+import threading
+import pandas as pd
+from datetime import datetime
+from typing import Dict
+
+from arquivo_transacoes import ArquivoTransacoes
+
+logger = logging.getLogger(__name__)
+
+
+# Pools de conexão MySQL reutilizados dentro do processo (chave: host/usuário/banco)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+DDL_MYSQL = [
+    """
+    CREATE TABLE IF NOT EXISTS recargas_janelas (
+        janela_id VARCHAR(16) PRIMARY KEY,
+        inicio_janela DATETIME,
+        fim_janela DATETIME,
+        total_transacoes INT,
+        transacoes_negadas INT,
+        transacoes_n2 INT,
+        percentual_negadas DOUBLE,
+        percentual_n2 DOUBLE,
+        valor_total DOUBLE,
+        valor_negado DOUBLE,
+        percentual_valor_negado DOUBLE,
+        nivel_alarme VARCHAR(16),
+        carregado_em DATETIME
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS recargas_transacoes (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        janela_id VARCHAR(16) NOT NULL,
+        data_hora DATETIME,
+        origem VARCHAR(128),
+        telefone VARCHAR(32),
+        valor DOUBLE,
+        estado VARCHAR(64),
+        cod_resp VARCHAR(16),
+        INDEX idx_transacoes_janela (janela_id),
+        INDEX idx_transacoes_data_hora (data_hora)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS recargas_janelas_origem (
+        janela_id VARCHAR(16) NOT NULL,
+        origem VARCHAR(128) NOT NULL,
+        total INT,
+        negadas INT,
+        n2 INT,
+        valor_total DOUBLE,
+        valor_negado DOUBLE,
+        PRIMARY KEY (janela_id, origem)
+    )
+    """,
+]
+
+DDL_SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS recargas_janelas (
+        janela_id TEXT PRIMARY KEY,
+        inicio_janela TEXT,
+        fim_janela TEXT,
+        total_transacoes INTEGER,
+        transacoes_negadas INTEGER,
+        transacoes_n2 INTEGER,
+        percentual_negadas REAL,
+        percentual_n2 REAL,
+        valor_total REAL,
+        valor_negado REAL,
+        percentual_valor_negado REAL,
+        nivel_alarme TEXT,
+        carregado_em TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS recargas_transacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        janela_id TEXT NOT NULL,
+        data_hora TEXT,
+        origem TEXT,
+        telefone TEXT,
+        valor REAL,
+        estado TEXT,
+        cod_resp TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_transacoes_janela ON recargas_transacoes (janela_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transacoes_data_hora ON recargas_transacoes (data_hora)",
+    """
+    CREATE TABLE IF NOT EXISTS recargas_janelas_origem (
+        janela_id TEXT NOT NULL,
+        origem TEXT NOT NULL,
+        total INTEGER,
+        negadas INTEGER,
+        n2 INTEGER,
+        valor_total REAL,
+        valor_negado REAL,
+        PRIMARY KEY (janela_id, origem)
+    )
+    """,
+]
+
+COLUNAS_JANELA = ['janela_id', 'inicio_janela', 'fim_janela', 'total_transacoes', 'transacoes_negadas',
+                  'transacoes_n2', 'percentual_negadas', 'percentual_n2', 'valor_total', 'valor_negado',
+                  'percentual_valor_negado', 'nivel_alarme', 'carregado_em']
+
+
+class CarregadorBanco:
+    """
+    Carrega janelas no banco de forma idempotente
+
+    Cada janela (janela_id = fim da janela 'YYYYMMDD_HHMM') é gravada em uma
+    única transação: upsert do agregado da janela, e substituição (delete +
+    insert em lotes via executemany) das transações e dos agregados por origem.
+    Recarregar a mesma janela produz o mesmo resultado.
+    """
+
+    def __init__(self, backend: str = 'mysql', host: str = None, user: str = None, password: str = None,
+                 database: str = None, sqlite_path: str = None, pool_size: int = 2, tamanho_lote: int = 5000):
+        """
+        Inicializa o carregador
+
+        Args:
+            backend: 'mysql' ou 'sqlite'
+            host: Host MySQL
+            user: Usuário MySQL
+            password: Senha MySQL
+            database: Banco MySQL
+            sqlite_path: Arquivo SQLite (backend 'sqlite')
+            pool_size: Tamanho do pool de conexões MySQL
+            tamanho_lote: Linhas por chamada de executemany
+        """
+        if backend not in ('mysql', 'sqlite'):
+            raise ValueError(f"Backend não suportado: {backend}")
+
+        self.backend = backend
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+        self.sqlite_path = sqlite_path
+        self.pool_size = pool_size
+        self.tamanho_lote = tamanho_lote
+        self.ph = '%s' if backend == 'mysql' else '?'
+        self._tabelas_criadas = False
+
+    def _conectar(self):
+        """
+        Obtém uma conexão (do pool, no MySQL)
+
+        Returns:
+            Conexão DB-API
+        """
+        if self.backend == 'sqlite':
+            os.makedirs(os.path.dirname(os.path.abspath(self.sqlite_path)), exist_ok=True)
+            return sqlite3.connect(self.sqlite_path, timeout=30)
+
+        import mysql.connector.pooling
+
+        chave = (self.host, self.user, self.database)
+        with _pools_lock:
+            pool = _pools.get(chave)
+            if pool is None:
+                pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name=f"recargas_{len(_pools)}",
+                    pool_size=self.pool_size,
+                    host=self.host,
+                    user=self.user,
+                    password=self.password,
+                    database=self.database,
+                    autocommit=False,
+                )
+                _pools[chave] = pool
+
+        return pool.get_connection()
+
+    def criar_tabelas(self):
+        """
+        Cria as tabelas se não existirem
+        """
+        conn = self._conectar()
+        try:
+            cursor = conn.cursor()
+            for ddl in (DDL_MYSQL if self.backend == 'mysql' else DDL_SQLITE):
+                cursor.execute(ddl)
+            conn.commit()
+            cursor.close()
+            self._tabelas_criadas = True
+        finally:
+            conn.close()
+
+    def _sql_upsert_janela(self) -> str:
+        """
+        SQL de upsert do agregado da janela no dialeto do backend
+        """
+        colunas = ', '.join(COLUNAS_JANELA)
+        valores = ', '.join([self.ph] * len(COLUNAS_JANELA))
+        atualizacoes = [c for c in COLUNAS_JANELA if c != 'janela_id']
+
+        if self.backend == 'mysql':
+            sets = ', '.join(f"{c} = VALUES({c})" for c in atualizacoes)
+            return f"INSERT INTO recargas_janelas ({colunas}) VALUES ({valores}) ON DUPLICATE KEY UPDATE {sets}"
+
+        sets = ', '.join(f"{c} = excluded.{c}" for c in atualizacoes)
+        return f"INSERT INTO recargas_janelas ({colunas}) VALUES ({valores}) ON CONFLICT(janela_id) DO UPDATE SET {sets}"
+
+    def carregar_janela(self, df: pd.DataFrame, resultado: Dict, inicio_janela: datetime,
+                        fim_janela: datetime) -> bool:
+        """
+        Grava uma janela (transações + agregados) em uma única transação
+
+        Args:
+            df: DataFrame carregado por RecargaAnalyzer (colunas originais do export)
+            resultado: Resultado de RecargaAnalyzer.analisar()
+            inicio_janela: Início da janela
+            fim_janela: Fim da janela
+
+        Returns:
+            True se gravou com sucesso
+        """
+        if not self._tabelas_criadas:
+            self.criar_tabelas()
+
+        janela_id = fim_janela.strftime('%Y%m%d_%H%M')
+        formato = '%Y-%m-%d %H:%M:%S'
+
+        linha_janela = (
+            janela_id,
+            inicio_janela.strftime(formato),
+            fim_janela.strftime(formato),
+            int(resultado.get('total_transacoes', 0)),
+            int(resultado.get('transacoes_negadas', 0)),
+            int(resultado.get('transacoes_n2', 0)),
+            float(resultado.get('percentual_negadas', 0.0)),
+            float(resultado.get('percentual_n2', 0.0)),
+            float(resultado.get('valor_total', 0.0)),
+            float(resultado.get('valor_negado', 0.0)),
+            float(resultado.get('percentual_valor_negado', 0.0)),
+            resultado.get('nivel_alarme', 'Normal'),
+            datetime.now().strftime(formato),
+        )
+
+        # Transações no esquema do arquivo colunar, com datas como texto (aceito por ambos os backends)
+        transacoes = []
+        if df is not None and len(df) > 0:
+            dados = ArquivoTransacoes.normalizar(df)
+            datas = dados['data_hora'].dt.strftime(formato)
+            dados['data_hora'] = datas.astype(object).where(datas.notna(), None)
+            dados.insert(0, 'janela_id', janela_id)
+            transacoes = list(dados.itertuples(index=False, name=None))
+
+        origens = []
+        agregado_origem = resultado.get('agregado_origem')
+        if agregado_origem is not None and len(agregado_origem) > 0:
+            origens = [
+                (janela_id, str(origem), int(total), int(negadas), int(n2), float(valor_total), float(valor_negado))
+                for origem, total, negadas, n2, valor_total, valor_negado in zip(
+                    agregado_origem['Origem'], agregado_origem['total'], agregado_origem['negadas'],
+                    agregado_origem['n2'], agregado_origem['valor_total'], agregado_origem['valor_negado'])
+            ]
+
+        ph = self.ph
+        conn = self._conectar()
+        try:
+            cursor = conn.cursor()
+
+            cursor.execute(self._sql_upsert_janela(), linha_janela)
+
+            cursor.execute(f"DELETE FROM recargas_transacoes WHERE janela_id = {ph}", (janela_id,))
+            sql_transacao = (f"INSERT INTO recargas_transacoes "
+                             f"(janela_id, data_hora, origem, telefone, valor, estado, cod_resp) "
+                             f"VALUES ({', '.join([ph] * 7)})")
+            for inicio in range(0, len(transacoes), self.tamanho_lote):
+                cursor.executemany(sql_transacao, transacoes[inicio:inicio + self.tamanho_lote])
+
+            cursor.execute(f"DELETE FROM recargas_janelas_origem WHERE janela_id = {ph}", (janela_id,))
+            if origens:
+                cursor.executemany(
+                    f"INSERT INTO recargas_janelas_origem VALUES ({', '.join([ph] * 7)})", origens
+                )
+
+            conn.commit()
+            cursor.close()
+
+            logger.info(f"Janela {janela_id} carregada no banco ({self.backend}): "
+                       f"{len(transacoes)} transações, {len(origens)} origens")
+            return True
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Erro ao carregar janela {janela_id} no banco: {e}")
+            return False
+
+        finally:
+            conn.close()
+
@@ -0,0 +1,163 @@
+"""
+Módulo de Digest de Alertas
+Acumula as janelas de um incidente no histórico e monta um e-mail consolidado
+por cadência ou mudança de severidade, combinando os agregados já gravados
+"""
+
+import logging
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from historico_janelas import HistoricoJanelas
+from estado_alarme import SEVERIDADE
+
+logger = logging.getLogger(__name__)
+
+
+# Motivos de envio do digest
+MOTIVO_CADENCIA = 'cadencia'
+MOTIVO_SEVERIDADE = 'severidade'
+MOTIVO_RESOLUCAO = 'resolucao'
+
+
+class DigestAlertas:
+    """
+    Controla o modo digest de um incidente
+
+    A janela de abertura recebe o relatório completo e serve de referência.
+    As janelas seguintes são acumuladas em digest_janelas e enviadas juntas quando:
+    - o intervalo desde o último e-mail atinge intervalo_minutos (cadência)
+    - o nível da janela muda em relação à última janela em alarme (severidade)
+    - o incidente é resolvido
+    """
+
+    def __init__(self, historico: HistoricoJanelas, intervalo_minutos: int = 120):
+        """
+        Inicializa o digest
+
+        Args:
+            historico: Histórico de janelas (onde as janelas são acumuladas)
+            intervalo_minutos: Cadência máxima entre e-mails do incidente
+        """
+        self.historico = historico
+        self.intervalo = timedelta(minutes=intervalo_minutos)
+
+    def registrar_abertura(self, fim_janela: datetime, nivel_alarme: str):
+        """
+        Registra a janela que já recebeu o relatório completo (referência da cadência)
+
+        Args:
+            fim_janela: Fim da janela
+            nivel_alarme: Nível da janela
+        """
+        self.historico.acumular_digest(fim_janela, nivel_alarme, enviada=True)
+
+    def acumular(self, fim_janela: datetime, nivel_alarme: str, resolvido: bool = False) -> Optional[str]:
+        """
+        Acumula a janela e indica se o digest deve ser enviado agora
+
+        Args:
+            fim_janela: Fim da janela (já registrada no histórico)
+            nivel_alarme: Nível da janela
+            resolvido: Se o incidente foi resolvido nesta janela
+
+        Returns:
+            Motivo do envio (cadencia, severidade, resolucao) ou None para continuar acumulando
+        """
+        anterior = self.historico.ultima_janela_digest(apenas_alarme=True)
+        self.historico.acumular_digest(fim_janela, nivel_alarme)
+
+        if resolvido:
+            return MOTIVO_RESOLUCAO
+
+        if (anterior and nivel_alarme != 'Normal'
+                and SEVERIDADE.get(nivel_alarme, 0) != SEVERIDADE.get(anterior['nivel_alarme'], 0)):
+            return MOTIVO_SEVERIDADE
+
+        referencia = self.historico.ultimo_digest_enviado()
+        if referencia is None:
+            pendentes = self.historico.carregar_digest_pendente()
+            referencia = pendentes['fim_janela'].iloc[0] if len(pendentes) else None
+
+        if referencia and fim_janela - datetime.strptime(referencia, '%Y-%m-%d %H:%M') >= self.intervalo:
+            return MOTIVO_CADENCIA
+
+        return None
+
+    def montar(self, top_n: int = 10) -> Optional[Dict]:
+        """
+        Monta o conteúdo do digest a partir das janelas pendentes
+
+        Args:
+            top_n: Tamanho dos rankings combinados
+
+        Returns:
+            Dict com chaves, tendencia, ranking_negadas, ranking_n2, totais e nivel_maximo
+            (None se não houver janelas pendentes)
+        """
+        janelas = self.historico.carregar_digest_pendente()
+        if len(janelas) == 0:
+            return None
+
+        chaves = janelas['fim_janela'].tolist()
+        origens = self.historico.somar_origens(chaves)
+
+        tendencia = pd.DataFrame({
+            'Janela (fim)': janelas['fim_janela'],
+            'Transações': janelas['total_transacoes'].astype(int),
+            'Negadas (%)': janelas['percentual_negadas'].map(lambda v: f"{v:.2f}%"),
+            'N2 (%)': janelas['percentual_n2'].map(lambda v: f"{v:.2f}%"),
+            'Valor Negado (R$)': janelas['valor_negado'].map(lambda v: f"{v:.2f}"),
+            'Nível': janelas['nivel_alarme'],
+        })
+
+        total = int(janelas['total_transacoes'].sum())
+        negadas = int(janelas['transacoes_negadas'].sum())
+        n2 = int(janelas['transacoes_n2'].sum())
+        niveis = janelas['nivel_alarme'].tolist()
+
+        return {
+            'chaves': chaves,
+            'tendencia': tendencia,
+            'ranking_negadas': self._ranking(origens, 'negadas', 'Total Negadas', top_n),
+            'ranking_n2': self._ranking(origens, 'n2', 'Total N2', top_n),
+            'totais': {
+                'janelas': len(chaves),
+                'inicio': chaves[0],
+                'fim': chaves[-1],
+                'total_transacoes': total,
+                'transacoes_negadas': negadas,
+                'percentual_negadas': round(negadas / total * 100, 2) if total else 0.0,
+                'transacoes_n2': n2,
+                'percentual_n2': round(n2 / total * 100, 2) if total else 0.0,
+                'valor_negado': round(float(janelas['valor_negado'].sum()), 2),
+            },
+            'nivel_maximo': max(niveis, key=lambda n: SEVERIDADE.get(n, 0)),
+        }
+
+    @staticmethod
+    def _ranking(origens: pd.DataFrame, coluna: str, titulo: str, top_n: int) -> pd.DataFrame:
+        """
+        Ranking combinado de origens (mesmo formato de RecargaAnalyzer.gerar_ranking_*)
+        """
+        if len(origens) == 0:
+            return pd.DataFrame()
+
+        combinado = origens[origens[coluna] > 0].sort_values(coluna, ascending=False).head(top_n)
+        if len(combinado) == 0:
+            return pd.DataFrame()
+
+        ranking = pd.DataFrame({'Origem': combinado['origem'].values, titulo: combinado[coluna].astype(int).values})
+        ranking.index = ranking.index + 1  # Começar do 1
+        return ranking
+
+    def confirmar_envio(self, chaves: List[str]):
+        """
+        Marca as janelas do digest como enviadas
+
+        Args:
+            chaves: Retornadas em montar()['chaves']
+        """
+        self.historico.marcar_digest_enviado(chaves)
+        logger.info(f"Digest enviado: {len(chaves)} janela(s) ({chaves[0]} a {chaves[-1]})")
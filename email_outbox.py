@@ -0,0 +1,423 @@
+"""
+Módulo de Caixa de Saída de E-mails
+Fila em disco (.eml + metadados) drenada por um worker que mantém uma conexão
+SMTP autenticada, envia em lotes e reenvia com backoff em caso de falha
+
+Uso (CLI):
+    python3 email_outbox.py listar
+    python3 email_outbox.py drenar
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import smtplib
+import logging
+import argparse
+import threading
+from datetime import datetime
+from email.message import Message
+from email.utils import formatdate, make_msgid
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CaixaSaida:
+    """
+    Fila persistente de e-mails
+
+    Cada mensagem é gravada como <id>.eml com um arquivo <id>.json ao lado
+    (destinatários, tentativas, próxima tentativa, último erro). O .json é
+    gravado por último: mensagem sem metadados ainda não está pronta.
+    Mensagens que esgotam as tentativas vão para <diretorio>/falhas/ e nunca
+    são apagadas automaticamente.
+    """
+
+    def __init__(self, diretorio: str, smtp_server: str, smtp_port: int, smtp_user: str, smtp_password: str,
+                 usar_tls: bool = True, max_tentativas: int = 10, backoff_base_s: int = 30,
+                 backoff_max_s: int = 1800, tamanho_lote: int = 20, timeout_s: int = 30,
+                 ao_enviar: Optional[Callable[[str, datetime], None]] = None):
+        """
+        Inicializa a caixa de saída
+
+        Args:
+            diretorio: Diretório da fila
+            smtp_server: Servidor SMTP
+            smtp_port: Porta SMTP
+            smtp_user: Usuário de autenticação
+            smtp_password: Senha de autenticação
+            usar_tls: Faz STARTTLS antes do login (desative para servidores locais de teste)
+            max_tentativas: Tentativas antes de mover a mensagem para falhas/
+            backoff_base_s: Espera após a primeira falha (dobra a cada nova falha)
+            backoff_max_s: Espera máxima entre tentativas
+            tamanho_lote: Mensagens enviadas por sessão SMTP antes de renovar a conexão
+            timeout_s: Timeout das operações SMTP
+            ao_enviar: Chamado com (id da mensagem, horário) quando o SMTP aceita a mensagem
+        """
+        self.diretorio = diretorio
+        self.dir_falhas = os.path.join(diretorio, "falhas")
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.smtp_user = smtp_user
+        self.smtp_password = smtp_password
+        self.usar_tls = usar_tls
+        self.max_tentativas = max_tentativas
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.tamanho_lote = max(1, tamanho_lote)
+        self.timeout_s = timeout_s
+        self.ao_enviar = ao_enviar
+
+        self._conexao: Optional[smtplib.SMTP] = None
+        self._enviadas_na_sessao = 0
+        self._lock = threading.Lock()
+        self._sinal = threading.Event()
+        self._parar = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        os.makedirs(self.dir_falhas, exist_ok=True)
+
+    # ===== FILA =====
+
+    def enfileirar(self, msg: Message, destinatarios: List[str]) -> str:
+        """
+        Grava uma mensagem na fila e acorda o worker
+
+        Args:
+            msg: Mensagem MIME montada
+            destinatarios: Lista de e-mails destino (envelope)
+
+        Returns:
+            Identificador da mensagem na fila
+        """
+        # Message-ID e Date fixados na fila: reenvios não geram mensagens "diferentes"
+        if not msg['Message-ID']:
+            msg['Message-ID'] = make_msgid()
+        if not msg['Date']:
+            msg['Date'] = formatdate(localtime=True)
+
+        id_msg = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+        caminho_eml = os.path.join(self.diretorio, f"{id_msg}.eml")
+
+        tmp_path = f"{caminho_eml}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(msg.as_bytes())
+        os.replace(tmp_path, caminho_eml)
+
+        self._salvar_meta(id_msg, {
+            'destinatarios': list(destinatarios),
+            'remetente': msg['From'] or self.smtp_user,
+            'assunto': str(msg['Subject'] or ''),
+            'criado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'tentativas': 0,
+            'proxima_tentativa': 0.0,
+            'ultimo_erro': None,
+        })
+
+        logger.info(f"E-mail enfileirado ({id_msg}): {msg['Subject']}")
+        self._sinal.set()
+        return id_msg
+
+    def _caminho_meta(self, id_msg: str) -> str:
+        """
+        Caminho do arquivo de metadados de uma mensagem
+        """
+        return os.path.join(self.diretorio, f"{id_msg}.json")
+
+    def _salvar_meta(self, id_msg: str, meta: Dict):
+        """
+        Persiste os metadados de forma atômica (arquivo temporário + rename)
+        """
+        caminho = self._caminho_meta(id_msg)
+        tmp_path = f"{caminho}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, caminho)
+
+    def _carregar_meta(self, id_msg: str) -> Optional[Dict]:
+        """
+        Lê os metadados de uma mensagem (None se ilegíveis)
+        """
+        try:
+            with open(self._caminho_meta(id_msg), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao ler metadados de {id_msg}: {e}")
+            return None
+
+    def listar(self) -> List[Dict]:
+        """
+        Lista as mensagens na fila, da mais antiga para a mais nova
+
+        Returns:
+            Lista de dicts de metadados com a chave 'id'
+        """
+        itens = []
+        for nome in sorted(os.listdir(self.diretorio)):
+            if not nome.endswith('.json'):
+                continue
+            id_msg = nome[:-5]
+            if not os.path.exists(os.path.join(self.diretorio, f"{id_msg}.eml")):
+                continue
+            meta = self._carregar_meta(id_msg)
+            if meta is not None:
+                itens.append(dict(meta, id=id_msg))
+        return itens
+
+    def _remover(self, id_msg: str):
+        """
+        Remove uma mensagem enviada da fila
+        """
+        for extensao in ('.json', '.eml'):
+            caminho = os.path.join(self.diretorio, f"{id_msg}{extensao}")
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+    def _registrar_falha(self, id_msg: str, meta: Dict, erro: Exception, permanente: bool = False):
+        """
+        Agenda nova tentativa com backoff exponencial (ou move para falhas/)
+        """
+        meta['tentativas'] = meta.get('tentativas', 0) + 1
+        meta['ultimo_erro'] = str(erro)
+
+        if permanente or meta['tentativas'] >= self.max_tentativas:
+            self._salvar_meta(id_msg, meta)
+            for extensao in ('.eml', '.json'):
+                os.replace(os.path.join(self.diretorio, f"{id_msg}{extensao}"),
+                           os.path.join(self.dir_falhas, f"{id_msg}{extensao}"))
+            logger.error(f"E-mail {id_msg} movido para falhas/ após {meta['tentativas']} tentativa(s): {erro}")
+            return
+
+        espera = min(self.backoff_max_s, self.backoff_base_s * (2 ** (meta['tentativas'] - 1)))
+        meta['proxima_tentativa'] = time.time() + espera
+        self._salvar_meta(id_msg, meta)
+        logger.warning(f"Falha ao enviar e-mail {id_msg} (tentativa {meta['tentativas']}), "
+                       f"nova tentativa em {espera}s: {erro}")
+
+    # ===== CONEXÃO =====
+
+    def _conectar(self) -> smtplib.SMTP:
+        """
+        Retorna a conexão SMTP autenticada, reabrindo se caiu ou se o lote acabou
+        """
+        if self._conexao is not None and self._enviadas_na_sessao >= self.tamanho_lote:
+            self._desconectar()
+
+        if self._conexao is not None:
+            try:
+                if self._conexao.noop()[0] == 250:
+                    return self._conexao
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._desconectar()
+
+        logger.info(f"Conectando ao servidor SMTP: {self.smtp_server}:{self.smtp_port}")
+        conexao = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout_s)
+        try:
+            conexao.ehlo()
+            if self.usar_tls:
+                conexao.starttls()
+                conexao.ehlo()
+            if self.smtp_password and conexao.has_extn('auth'):
+                conexao.login(self.smtp_user, self.smtp_password)
+        except Exception:
+            conexao.close()
+            raise
+
+        self._conexao = conexao
+        self._enviadas_na_sessao = 0
+        return conexao
+
+    def _desconectar(self):
+        """
+        Encerra a conexão SMTP atual (se houver)
+        """
+        if self._conexao is None:
+            return
+        try:
+            self._conexao.quit()
+        except Exception:
+            try:
+                self._conexao.close()
+            except Exception:
+                pass
+        self._conexao = None
+
+    # ===== ENVIO =====
+
+    def drenar(self, limite_s: Optional[float] = None, ignorar_backoff: bool = False) -> Dict:
+        """
+        Envia as mensagens prontas da fila pela conexão compartilhada
+
+        Args:
+            limite_s: Tempo máximo de drenagem em segundos (None = sem limite)
+            ignorar_backoff: Envia também mensagens com nova tentativa agendada
+
+        Returns:
+            Dict com enviadas, falhas e pendentes
+        """
+        with self._lock:
+            resumo = {'enviadas': 0, 'falhas': 0, 'pendentes': 0}
+            inicio = time.time()
+            agora = time.time()
+
+            prontas = [(item.pop('id'), item) for item in self.listar()
+                       if ignorar_backoff or item.get('proxima_tentativa', 0) <= agora]
+
+            for posicao, (id_msg, meta) in enumerate(prontas):
+                if limite_s is not None and time.time() - inicio > limite_s:
+                    break
+
+                try:
+                    with open(os.path.join(self.diretorio, f"{id_msg}.eml"), 'rb') as f:
+                        conteudo = f.read()
+                except OSError as e:
+                    logger.error(f"Erro ao ler e-mail {id_msg} da fila: {e}")
+                    continue
+
+                try:
+                    conexao = self._conectar()
+                except Exception as e:
+                    # Servidor indisponível: adiar esta e as demais mensagens prontas
+                    for restante_id, restante_meta in prontas[posicao:]:
+                        self._registrar_falha(restante_id, restante_meta, e)
+                        resumo['falhas'] += 1
+                    break
+
+                try:
+                    conexao.sendmail(meta.get('remetente') or self.smtp_user, meta['destinatarios'], conteudo)
+                    entregue_em = datetime.now()
+                    self._enviadas_na_sessao += 1
+                    self._remover(id_msg)
+                    resumo['enviadas'] += 1
+                    logger.info(f"E-mail enviado ({id_msg}) para {len(meta['destinatarios'])} destinatário(s)")
+                    self._notificar_envio(id_msg, entregue_em)
+
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                    self._registrar_falha(id_msg, meta, e, permanente=True)
+                    resumo['falhas'] += 1
+
+                except Exception as e:
+                    self._desconectar()
+                    self._registrar_falha(id_msg, meta, e)
+                    resumo['falhas'] += 1
+
+            resumo['pendentes'] = len(self.listar())
+            return resumo
+
+    def _notificar_envio(self, id_msg: str, momento: datetime):
+        """
+        Repassa a entrega ao callback ao_enviar (falha no callback não afeta a fila)
+        """
+        if self.ao_enviar is None:
+            return
+        try:
+            self.ao_enviar(id_msg, momento)
+        except Exception as e:
+            logger.error(f"Erro no callback de envio de {id_msg}: {e}")
+
+    # ===== WORKER =====
+
+    def iniciar_worker(self, intervalo_s: float = 5.0):
+        """
+        Inicia a thread que drena a fila sempre que uma mensagem é enfileirada
+
+        Args:
+            intervalo_s: Intervalo de verificação de reenvios agendados
+        """
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        self._parar.clear()
+        self._sinal.set()  # Drena imediatamente o que sobrou de execuções anteriores
+
+        def _loop():
+            while not self._parar.is_set():
+                self._sinal.wait(intervalo_s)
+                self._sinal.clear()
+                try:
+                    self.drenar()
+                except Exception as e:
+                    logger.error(f"Erro no worker da caixa de saída: {e}")
+
+        self._worker = threading.Thread(target=_loop, name="email-outbox", daemon=True)
+        self._worker.start()
+
+    def parar_worker(self, timeout_s: float = 60.0, ignorar_backoff: bool = False) -> Dict:
+        """
+        Para o worker, faz uma última drenagem e fecha a conexão
+
+        Mensagens que não puderam ser enviadas continuam na fila para a próxima execução.
+
+        Args:
+            timeout_s: Tempo máximo para a última drenagem
+            ignorar_backoff: Envia também mensagens com nova tentativa agendada
+
+        Returns:
+            Resumo da última drenagem
+        """
+        if self._worker is not None:
+            self._parar.set()
+            self._sinal.set()
+            self._worker.join(timeout_s)
+            self._worker = None
+
+        try:
+            return self.drenar(limite_s=timeout_s, ignorar_backoff=ignorar_backoff)
+        finally:
+            with self._lock:
+                self._desconectar()
+
+
+def criar_caixa_saida() -> CaixaSaida:
+    """
+    Cria a caixa de saída com as configurações do config.py
+    """
+    import config
+
+    return CaixaSaida(
+        diretorio=getattr(config, 'EMAIL_OUTBOX_DIR', None) or os.path.join(config.BASE_DIR, "outbox"),
+        smtp_server=config.EMAIL_SMTP_SERVER,
+        smtp_port=config.EMAIL_SMTP_PORT,
+        smtp_user=config.EMAIL_USER,
+        smtp_password=config.EMAIL_PASSWORD,
+        usar_tls=getattr(config, 'EMAIL_USAR_TLS', True),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI de inspeção e drenagem da caixa de saída
+    """
+    parser = argparse.ArgumentParser(description="Caixa de saída de e-mails da alarmística")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('listar', help="Lista as mensagens pendentes")
+    sub.add_parser('drenar', help="Envia as mensagens pendentes")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    caixa = criar_caixa_saida()
+
+    if args.comando == 'listar':
+        itens = caixa.listar()
+        for item in itens:
+            print(f"{item['id']}  tentativas={item['tentativas']}  {item['assunto']}"
+                  + (f"  erro={item['ultimo_erro']}" if item.get('ultimo_erro') else ""))
+        print(f"\n{len(itens)} mensagem(ns) pendente(s)", file=sys.stderr)
+        return 0
+
+    # Drenagem manual ignora o backoff agendado
+    resumo = caixa.parar_worker(ignorar_backoff=True)
+    print(f"{resumo['enviadas']} enviada(s), {resumo['falhas']} falha(s), {resumo['pendentes']} pendente(s)",
+          file=sys.stderr)
+    return 0 if resumo['pendentes'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,27 +3,86 @@ Módulo de Envio de E-mails
 Envia alertas de recargas com formatação HTML
 """
 
+import io
 import os
+import base64
+import shutil
 import smtplib
 import logging
+import zipfile
+import tempfile
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
-from email import encoders
-from typing import List, Dict, Optional
+from email.utils import make_msgid
+from typing import List, Dict, Optional, Tuple
+import html
 import pandas as pd
 from datetime import datetime
+from inline_charts import gerar_grafico_inline
+from comparativo import tabela_comparativa, acrescentar_deltas
+from email_template import (ESTILO_EMAIL, TEMPLATE_RELATORIO, TEMPLATE_DIGEST, TEMPLATE_RESUMO, LIMITES_LINHAS_PADRAO, LIMITE_BYTES_PADRAO,
+                            OrcamentoBytes, compilar, renderizar_tabela)
 
 logger = logging.getLogger(__name__)
 
 
+# Tipos MIME dos anexos conhecidos (demais: application/octet-stream)
+TIPOS_ANEXO = {
+    '.xlsx': ('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    '.png': ('image', 'png'),
+    '.zip': ('application', 'zip'),
+    '.csv': ('text', 'csv'),
+}
+
+# Bloco de leitura múltiplo de 57 bytes: cada bloco vira linhas completas de 76 caracteres em base64
+BLOCO_BASE64 = 57 * 1024
+
+
+def _codificar_base64(caminho: str) -> str:
+    """
+    Codifica um arquivo em base64 (linhas de 76 caracteres) lendo em blocos
+
+    O binário é lido bloco a bloco e o texto codificado vai para um único
+    buffer. Não é streaming de ponta a ponta: o pacote email guarda o payload
+    como string, então o texto base64 inteiro (~1,37x o arquivo) fica em
+    memória enquanto a mensagem existir (e, durante o getvalue(), também a
+    cópia do buffer), limitado por EMAIL_LIMITE_ANEXOS_MB.
+
+    Args:
+        caminho: Arquivo a codificar
+
+    Returns:
+        Texto base64 pronto para o payload MIME
+    """
+    buffer = io.StringIO()
+    with open(caminho, 'rb') as f:
+        while True:
+            bloco = f.read(BLOCO_BASE64)
+            if not bloco:
+                break
+            buffer.write(base64.encodebytes(bloco).decode('ascii'))
+    return buffer.getvalue()
+
+
+def _tamanho_base64(tamanho: int) -> int:
+    """
+    Tamanho aproximado (bytes) de um arquivo depois de codificado em base64 com quebras de linha
+    """
+    codificado = (tamanho + 2) // 3 * 4
+    return codificado + codificado // 76 + 1
+
+
 class EmailSender:
     """
     Envia e-mails formatados com alertas de recargas
     """
 
-    def __init__(self, smtp_server: str, smtp_port: int, smtp_user: str, smtp_password: str):
+    def __init__(self, smtp_server: str, smtp_port: int, smtp_user: str, smtp_password: str,
+                 graficos_inline: Optional[str] = 'html', usar_tls: bool = True, outbox=None,
+                 limites_linhas: Optional[Dict[str, Optional[int]]] = None,
+                 limite_bytes: Optional[int] = LIMITE_BYTES_PADRAO,
+                 limite_anexos_mb: Optional[float] = 10.0, compactar_anexos: bool = False):
         """
         Inicializa o sender de e-mail
 
@@ -32,11 +91,31 @@ class EmailSender:
             smtp_port: Porta SMTP (587 para TLS, 465 para SSL)
             smtp_user: Usuário de autenticação
             smtp_password: Senha de autenticação
+            graficos_inline: Gráficos de ranking no corpo do e-mail:
+                             'html' (tabela CSS, compatível com Outlook), 'svg' ou None
+            usar_tls: Faz STARTTLS antes do login (desative para servidores locais de teste)
+            outbox: CaixaSaida opcional; quando definida, as mensagens são enfileiradas
+                    em disco e enviadas pelo worker em vez de enviadas na hora
+            limites_linhas: Máximo de linhas por seção do relatório (resumo, ranking_negadas,
+                            ranking_n2, codigos, negadas); seções omitidas usam o padrão
+            limite_bytes: Tamanho máximo do corpo HTML do relatório (None = sem limite)
+            limite_anexos_mb: Tamanho máximo somado dos anexos já codificados; o que
+                              exceder é substituído pelo caminho local no corpo (None = sem limite)
+            compactar_anexos: Junta os anexos em um único .zip antes de enviar
         """
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.smtp_user = smtp_user
         self.smtp_password = smtp_password
+        self.graficos_inline = graficos_inline
+        self.usar_tls = usar_tls
+        self.outbox = outbox
+        self.limites_linhas = dict(LIMITES_LINHAS_PADRAO, **(limites_linhas or {}))
+        self.limite_bytes = limite_bytes
+        self.limite_anexos_mb = limite_anexos_mb
+        self.compactar_anexos = compactar_anexos
+        # Id na caixa de saída da última mensagem enfileirada (None = enviada direto ao SMTP)
+        self.ultimo_enfileirado: Optional[str] = None
 
     def enviar_alerta(self,
                      destinatarios: List[str],
@@ -48,7 +127,9 @@ class EmailSender:
                      ranking_n2: pd.DataFrame,
                      nivel_alarme: str,
                      periodo_analise: str,
-                     excel_path: Optional[str] = None) -> bool:
+                     excel_path: Optional[str] = None,
+                     anexos: Optional[List[str]] = None,
+                     em_resposta_a: Optional[str] = None) -> bool:
         """
         Envia e-mail de alerta com tabelas formatadas e anexos
 
@@ -63,10 +144,13 @@ class EmailSender:
             nivel_alarme: 'Crítico' ou 'Alerta'
             periodo_analise: Período analisado (ex: "14h às 14h30")
             excel_path: Caminho do arquivo Excel
+            anexos: Outros arquivos a anexar (ex: gráficos PNG), na ordem de prioridade
+            em_resposta_a: Message-ID do resumo imediato; o relatório segue como resposta na mesma conversa
 
         Returns:
             True se enviou com sucesso
         """
+        zip_temporario = None
         try:
             # Definir assunto baseado no nível
             if nivel_alarme == 'Crítico':
@@ -76,11 +160,28 @@ class EmailSender:
                 assunto = "Alerta! - Recargas Negadas Geral!"
                 cor_titulo = "#ffc107"  # Amarelo
 
-            # Criar mensagem
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = assunto
+            # Decidir o que vai anexado e o que vira link para o arquivo local (Excel tem prioridade)
+            arquivos = [c for c in [excel_path] + list(anexos or []) if c and os.path.exists(c)]
+            anexar, links = None, None
+            if self.compactar_anexos and arquivos:
+                zip_temporario = self._compactar_anexos(arquivos)
+                if zip_temporario:
+                    anexar, links = self._planejar_anexos([zip_temporario])
+                    # O zip temporário é removido após o envio: se não couber, cita os originais
+                    if links:
+                        anexar, links = [], arquivos
+            if anexar is None:
+                anexar, links = self._planejar_anexos(arquivos)
+
+            # Criar mensagem ('mixed': corpo HTML + anexos; em 'alternative' os clientes
+            # exibem só a última parte, o que fazia os gráficos "substituírem" o corpo)
+            msg = MIMEMultipart('mixed')
+            msg['Subject'] = f"Re: {assunto}" if em_resposta_a else assunto
             msg['From'] = self.smtp_user
             msg['To'] = ', '.join(destinatarios)
+            if em_resposta_a:
+                msg['In-Reply-To'] = em_resposta_a
+                msg['References'] = em_resposta_a
 
             # Gerar corpo HTML
             html_body = self._gerar_html(
@@ -92,34 +193,406 @@ class EmailSender:
                 ranking_n2,
                 nivel_alarme,
                 cor_titulo,
-                periodo_analise
+                periodo_analise,
+                links_anexos=links
             )
 
             # Anexar HTML
             msg.attach(MIMEText(html_body, 'html'))
 
-            # Gráficos removidos a pedido do usuário (apareciam corrompidos)
-
-            # Anexar Excel
-            if excel_path and os.path.exists(excel_path):
+            # Anexos codificados em blocos
+            for caminho in anexar:
                 try:
-                    with open(excel_path, 'rb') as f:
-                        attachment = MIMEBase('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                        attachment.set_payload(f.read())
-                        encoders.encode_base64(attachment)
-                        attachment.add_header('Content-Disposition', f'attachment; filename={os.path.basename(excel_path)}')
-                        msg.attach(attachment)
-
-                    logger.info(f"Excel anexado: {os.path.basename(excel_path)}")
+                    msg.attach(self._criar_anexo(caminho))
+                    logger.info(f"Anexado: {os.path.basename(caminho)}")
                 except Exception as e:
-                    logger.error(f"Erro ao anexar Excel: {e}")
+                    logger.error(f"Erro ao anexar {os.path.basename(caminho)}: {e}")
 
             # Enviar e-mail
+            return self._enviar_mensagem(msg, destinatarios)
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar e-mail: {e}")
+            return False
+
+        finally:
+            if zip_temporario:
+                shutil.rmtree(os.path.dirname(zip_temporario), ignore_errors=True)
+
+    def enviar_resumo_imediato(self,
+                               destinatarios: List[str],
+                               resultado_analise: Dict,
+                               periodo_analise: str,
+                               top_n: int = 10) -> Optional[str]:
+        """
+        Envia o resumo do alarme montado apenas com o resultado da análise
+
+        Primeira fase do alerta: não depende de gráficos, Excel nem das tabelas
+        do relatório, então sai logo após a análise. O relatório completo é
+        enviado depois com enviar_alerta(..., em_resposta_a=<Message-ID>).
+
+        Args:
+            destinatarios: Lista de e-mails destino
+            resultado_analise: Resultado da análise
+            periodo_analise: Período analisado (ex: "14h às 14h30")
+            top_n: Origens listadas no ranking
+
+        Returns:
+            Message-ID do resumo (None se falhou)
+        """
+        try:
+            nivel = resultado_analise.get('nivel_alarme', 'Normal')
+            if nivel == 'Crítico':
+                assunto = "Crítico! - Recargas Negadas Servidor!"
+                cor_titulo = "#dc3545"  # Vermelho
+            else:
+                assunto = "Alerta! - Recargas Negadas Geral!"
+                cor_titulo = "#ffc107"  # Amarelo
+
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = assunto
+            msg['From'] = self.smtp_user
+            msg['To'] = ', '.join(destinatarios)
+            msg['Message-ID'] = make_msgid(domain=self.smtp_user.rpartition('@')[2] or None)
+
+            html_body = self._gerar_html_resumo(resultado_analise, cor_titulo, periodo_analise, top_n)
+            msg.attach(MIMEText(html_body, 'html'))
+
+            if self._enviar_mensagem(msg, destinatarios):
+                return msg['Message-ID']
+            return None
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar resumo imediato: {e}")
+            return None
+
+    def _planejar_anexos(self, arquivos: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Separa os arquivos que cabem no limite de anexos dos que viram link local
+
+        Args:
+            arquivos: Caminhos em ordem de prioridade
+
+        Returns:
+            Tupla (arquivos a anexar, arquivos a citar pelo caminho local)
+        """
+        if self.limite_anexos_mb is None:
+            return list(arquivos), []
+
+        limite = self.limite_anexos_mb * 1024 * 1024
+        usados = 0
+        anexar, links = [], []
+
+        for caminho in arquivos:
+            tamanho = _tamanho_base64(os.path.getsize(caminho))
+            if usados + tamanho <= limite:
+                anexar.append(caminho)
+                usados += tamanho
+            else:
+                links.append(caminho)
+                logger.warning(f"{os.path.basename(caminho)} excede o limite de anexos "
+                               f"({self.limite_anexos_mb} MB) - enviado como caminho local")
+
+        return anexar, links
+
+    def _compactar_anexos(self, arquivos: List[str]) -> Optional[str]:
+        """
+        Junta os anexos em um zip temporário (gravado em disco, sem carregar os arquivos em memória)
+
+        Args:
+            arquivos: Caminhos a compactar
+
+        Returns:
+            Caminho do zip (o chamador remove o diretório temporário) ou None em caso de erro
+        """
+        diretorio = None
+        try:
+            base = os.path.splitext(os.path.basename(arquivos[0]))[0]
+            diretorio = tempfile.mkdtemp(prefix='anexos_')
+            destino = os.path.join(diretorio, f"{base}.zip")
+            with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                for caminho in arquivos:
+                    zf.write(caminho, arcname=os.path.basename(caminho))
+            return destino
+        except Exception as e:
+            logger.error(f"Erro ao compactar anexos, enviando sem compactar: {e}")
+            if diretorio:
+                shutil.rmtree(diretorio, ignore_errors=True)
+            return None
+
+    def _criar_anexo(self, caminho: str) -> MIMEBase:
+        """
+        Cria a parte MIME de um anexo com o conteúdo codificado em blocos
+
+        Args:
+            caminho: Arquivo a anexar
+
+        Returns:
+            Parte MIME pronta
+        """
+        tipo, subtipo = TIPOS_ANEXO.get(os.path.splitext(caminho)[1].lower(), ('application', 'octet-stream'))
+        anexo = MIMEBase(tipo, subtipo)
+        anexo.set_payload(_codificar_base64(caminho))
+        anexo['Content-Transfer-Encoding'] = 'base64'
+        anexo.add_header('Content-Disposition', 'attachment', filename=os.path.basename(caminho))
+        return anexo
+
+    def enviar_atualizacao(self,
+                           destinatarios: List[str],
+                           resultado_analise: Dict,
+                           estado_alarme: Dict,
+                           periodo_analise: str) -> bool:
+        """
+        Envia e-mail leve (sem anexos) de incidente em andamento ou resolvido
+
+        Args:
+            destinatarios: Lista de e-mails destino
+            resultado_analise: Resultado da análise da janela atual
+            estado_alarme: Retorno de MaquinaEstadoAlarme.atualizar()
+            periodo_analise: Período analisado (ex: "14h às 14h30")
+
+        Returns:
+            True se enviou com sucesso
+        """
+        try:
+            resolvido = estado_alarme.get('enviar_resolucao', False)
+            incidente = estado_alarme.get('incidente', {})
+            nivel = resultado_analise.get('nivel_alarme', 'Normal')
+
+            if resolvido:
+                assunto = "Resolvido - Recargas Normalizadas"
+                cor_titulo = "#28a745"  # Verde
+            else:
+                assunto = f"Atualização - Incidente de Recargas em Andamento ({nivel})"
+                cor_titulo = "#dc3545" if incidente.get('severidade_maxima') == 'Crítico' else "#ffc107"
+
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = assunto
+            msg['From'] = self.smtp_user
+            msg['To'] = ', '.join(destinatarios)
+
+            html_body = self._gerar_html_atualizacao(resultado_analise, estado_alarme, cor_titulo, periodo_analise)
+            msg.attach(MIMEText(html_body, 'html'))
+
+            return self._enviar_mensagem(msg, destinatarios)
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar atualização: {e}")
+            return False
+
+    def enviar_alerta_volume(self,
+                             destinatarios: List[str],
+                             avaliacao: Dict,
+                             periodo_analise: str) -> bool:
+        """
+        Envia e-mail curto de queda de volume (ou de volume normalizado)
+
+        Args:
+            destinatarios: Lista de e-mails destino
+            avaliacao: Retorno de ModeloVolume.verificar()
+            periodo_analise: Período analisado (ex: "14h às 14h30")
+
+        Returns:
+            True se enviou com sucesso
+        """
+        try:
+            nivel = avaliacao.get('nivel_volume', 'Normal')
+            if nivel == 'Crítico':
+                assunto = "Crítico! - Queda de Volume de Recargas"
+                cor_titulo = "#dc3545"
+            elif nivel == 'Alerta':
+                assunto = "Alerta! - Queda de Volume de Recargas"
+                cor_titulo = "#ffc107"
+            else:
+                assunto = "Normalizado - Volume de Recargas"
+                cor_titulo = "#28a745"
+
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = assunto
+            msg['From'] = self.smtp_user
+            msg['To'] = ', '.join(destinatarios)
+
+            msg.attach(MIMEText(self._gerar_html_volume(avaliacao, cor_titulo, periodo_analise), 'html'))
+
+            return self._enviar_mensagem(msg, destinatarios)
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar alerta de volume: {e}")
+            return False
+
+    def enviar_alerta_portal(self,
+                             destinatarios: List[str],
+                             avaliacao: Dict,
+                             periodo_analise: str) -> bool:
+        """
+        Envia e-mail curto de portal GWCelWeb degradado (ou normalizado)
+
+        Args:
+            destinatarios: Lista de e-mails destino
+            avaliacao: Retorno de TelemetriaPortal.verificar()
+            periodo_analise: Período analisado (ex: "14h às 14h30")
+
+        Returns:
+            True se enviou com sucesso
+        """
+        try:
+            if avaliacao.get('nivel') == 'Degradado':
+                assunto = "Alerta! - Portal GWCelWeb Degradado"
+                cor_titulo = "#ffc107"
+            else:
+                assunto = "Normalizado - Portal GWCelWeb"
+                cor_titulo = "#28a745"
+
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = assunto
+            msg['From'] = self.smtp_user
+            msg['To'] = ', '.join(destinatarios)
+
+            msg.attach(MIMEText(self._gerar_html_portal(avaliacao, cor_titulo, periodo_analise), 'html'))
+
+            return self._enviar_mensagem(msg, destinatarios)
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar alerta de portal: {e}")
+            return False
+
+    def enviar_alerta_roteado(self,
+                              particao: Dict,
+                              periodo_analise: str) -> bool:
+        """
+        Envia alerta reduzido com apenas os dados de uma rota (sem anexos)
+
+        Args:
+            particao: Item retornado por roteamento_alertas.particionar_por_rotas()
+            periodo_analise: Período analisado (ex: "14h às 14h30")
+
+        Returns:
+            True se enviou com sucesso
+        """
+        try:
+            nivel = particao['nivel_alarme']
+            cor_titulo = "#dc3545" if nivel == 'Crítico' else "#ffc107"
+
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = f"{nivel}! - Recargas Negadas - {particao['rota']}"
+            msg['From'] = self.smtp_user
+            msg['To'] = ', '.join(particao['destinatarios'])
+
+            html_body = self._gerar_html_roteado(particao, cor_titulo, periodo_analise)
+            msg.attach(MIMEText(html_body, 'html'))
+
+            return self._enviar_mensagem(msg, particao['destinatarios'])
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar alerta da rota {particao.get('rota')}: {e}")
+            return False
+
+    def enviar_digest(self,
+                      destinatarios: List[str],
+                      digest: Dict,
+                      motivo: str) -> bool:
+        """
+        Envia o e-mail consolidado de várias janelas do incidente (modo digest)
+
+        Args:
+            destinatarios: Lista de e-mails destino
+            digest: Retorno de DigestAlertas.montar()
+            motivo: 'cadencia', 'severidade' ou 'resolucao'
+
+        Returns:
+            True se enviou com sucesso
+        """
+        try:
+            totais = digest['totais']
+            nivel = digest['nivel_maximo']
+
+            if motivo == 'resolucao':
+                titulo = "Incidente de Recargas Resolvido - Consolidado"
+                cor_titulo = "#28a745"  # Verde
+            else:
+                titulo = f"Incidente de Recargas em Andamento - Consolidado ({nivel})"
+                cor_titulo = "#dc3545" if nivel == 'Crítico' else "#ffc107"
+
+            descricao_motivo = {
+                'cadencia': 'cadência do digest',
+                'severidade': 'mudança de severidade',
+                'resolucao': 'incidente resolvido',
+            }.get(motivo, motivo)
+
+            template = compilar(TEMPLATE_DIGEST)
+            orcamento = OrcamentoBytes(None if self.limite_bytes is None else self.limite_bytes - template.bytes_estaticos)
+            limite_ranking = self.limites_linhas['ranking_negadas']
+
+            campos = {
+                'cor_titulo': cor_titulo,
+                'titulo': titulo,
+                'janelas': str(totais['janelas']),
+                'inicio': totais['inicio'],
+                'fim': totais['fim'],
+                'motivo': descricao_motivo,
+                'negadas': str(totais['transacoes_negadas']),
+                'percentual_negadas': f"{totais['percentual_negadas']:.2f}",
+                'n2': str(totais['transacoes_n2']),
+                'percentual_n2': f"{totais['percentual_n2']:.2f}",
+                'valor_negado': f"{totais['valor_negado']:.2f}",
+                'total': str(totais['total_transacoes']),
+            }
+            orcamento.consumir(sum(len(v.encode('utf-8')) for v in campos.values()))
+
+            campos['tendencia'] = renderizar_tabela(digest['tendencia'], "Tendência por Janela", None, orcamento)
+            campos['ranking_negadas'] = renderizar_tabela(digest['ranking_negadas'], "Ranking Combinado - Recargas Negadas",
+                                                          limite_ranking, orcamento)
+            campos['ranking_n2'] = renderizar_tabela(digest['ranking_n2'], "Ranking Combinado - Erros N2 (Servidor)",
+                                                     limite_ranking, orcamento)
+            for campo, ranking, cor in (('grafico_negadas', digest['ranking_negadas'], '#ffc107'),
+                                        ('grafico_n2', digest['ranking_n2'], '#dc3545')):
+                grafico = gerar_grafico_inline(ranking, cor, self.graficos_inline)
+                if orcamento.cabe(len(grafico.encode('utf-8'))):
+                    orcamento.consumir(len(grafico.encode('utf-8')))
+                    campos[campo] = grafico
+
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = f"{'Resolvido' if motivo == 'resolucao' else nivel} - Recargas Negadas - " \
+                             f"Consolidado de {totais['janelas']} janela(s)"
+            msg['From'] = self.smtp_user
+            msg['To'] = ', '.join(destinatarios)
+            msg.attach(MIMEText(template.renderizar(campos), 'html'))
+
+            return self._enviar_mensagem(msg, destinatarios)
+
+        except Exception as e:
+            logger.error(f"Erro ao enviar digest: {e}")
+            return False
+
+    def _enviar_mensagem(self, msg: MIMEMultipart, destinatarios: List[str]) -> bool:
+        """
+        Envia uma mensagem pronta via SMTP (STARTTLS + login), ou a enfileira na outbox
+
+        Args:
+            msg: Mensagem MIME montada
+            destinatarios: Lista de e-mails destino
+
+        Returns:
+            True se enviou (ou enfileirou) com sucesso
+        """
+        self.ultimo_enfileirado = None
+        if self.outbox is not None:
+            try:
+                self.ultimo_enfileirado = self.outbox.enfileirar(msg, destinatarios)
+                return True
+            except Exception as e:
+                logger.error(f"Erro ao enfileirar e-mail, tentando envio direto: {e}")
+
+        try:
             logger.info(f"Conectando ao servidor SMTP: {self.smtp_server}:{self.smtp_port}")
 
             with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
+                server.ehlo()
+                if self.usar_tls:
+                    server.starttls()
+                    server.ehlo()
+                if self.smtp_password and server.has_extn('auth'):
+                    server.login(self.smtp_user, self.smtp_password)
                 server.send_message(msg)
 
             logger.info(f"E-mail enviado com sucesso para {len(destinatarios)} destinatário(s)")
@@ -135,6 +608,225 @@ class EmailSender:
             logger.error(f"Erro ao enviar e-mail: {e}")
             return False
 
+    def _gerar_html_atualizacao(self,
+                                resultado: Dict,
+                                estado_alarme: Dict,
+                                cor_titulo: str,
+                                periodo_analise: str) -> str:
+        """
+        Gera HTML curto com as métricas da janela e a variação desde a anterior
+
+        Args:
+            resultado: Resultado da análise
+            estado_alarme: Retorno de MaquinaEstadoAlarme.atualizar()
+            cor_titulo: Cor do título
+            periodo_analise: Período analisado
+
+        Returns:
+            HTML formatado
+        """
+        incidente = estado_alarme.get('incidente', {})
+        delta = estado_alarme.get('delta', {})
+
+        def _linha(rotulo: str, chave: str) -> str:
+            valor = resultado.get(chave, 0.0)
+            variacao = delta.get(chave)
+            texto_variacao = f"{variacao:+.2f} p.p." if variacao is not None else "-"
+            return (f"<tr><td style='padding: 6px 12px;'>{rotulo}</td>"
+                    f"<td style='padding: 6px 12px;'><strong>{valor:.2f}%</strong></td>"
+                    f"<td style='padding: 6px 12px; color: #718096;'>{texto_variacao}</td></tr>")
+
+        if estado_alarme.get('enviar_resolucao'):
+            titulo = "Incidente de Recargas Resolvido"
+        else:
+            titulo = "Incidente de Recargas em Andamento"
+
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head><meta charset="UTF-8"></head>
+        <body style="font-family: Arial, sans-serif; color: #333; max-width: 700px; margin: 0 auto; padding: 20px;">
+            <h2 style="color: {cor_titulo};">{titulo}</h2>
+            <p style="font-size: 13px;"><strong>Período analisado:</strong> {periodo_analise}<br>
+            <strong>Nível na janela:</strong> {resultado.get('nivel_alarme', 'Normal')}<br>
+            <strong>Incidente aberto em:</strong> {incidente.get('aberto_em') or '-'}
+            ({incidente.get('janelas_incidente', 0)} janela(s), severidade máxima: {incidente.get('severidade_maxima', '-')})</p>
+            <table style="border-collapse: collapse;">
+                <tr style="background-color: #4a5568; color: white;">
+                    <th style="padding: 6px 12px; text-align: left;">Métrica</th>
+                    <th style="padding: 6px 12px; text-align: left;">Janela atual</th>
+                    <th style="padding: 6px 12px; text-align: left;">Variação</th>
+                </tr>
+                {_linha('Recargas Negadas', 'percentual_negadas')}
+                {_linha('Erro N2 (Servidor)', 'percentual_n2')}
+                {_linha('Valor Negado', 'percentual_valor_negado')}
+            </table>
+            <p style="font-size: 12px; color: #718096;">Total de transações: {resultado.get('total_transacoes', 0)}.
+            O relatório completo (Excel) é enviado apenas na abertura e no escalonamento do incidente.</p>
+        </body>
+        </html>
+        """
+
+    def _gerar_html_volume(self, avaliacao: Dict, cor_titulo: str, periodo_analise: str) -> str:
+        """
+        Gera HTML curto com volume observado x esperado e origens ausentes/em queda
+
+        Args:
+            avaliacao: Retorno de ModeloVolume.verificar()
+            cor_titulo: Cor do título
+            periodo_analise: Período analisado
+
+        Returns:
+            HTML formatado
+        """
+        def _linhas(origens: List[Dict]) -> str:
+            return ''.join(f"<tr><td style='padding: 4px 12px;'>{html.escape(o['origem'])}</td>"
+                           f"<td style='padding: 4px 12px;'>{o['observado']}</td>"
+                           f"<td style='padding: 4px 12px;'>{o['esperado']:.0f}</td></tr>" for o in origens)
+
+        secoes = ''
+        for titulo, origens in (("Origens sem tráfego", avaliacao.get('origens_ausentes', [])),
+                                ("Origens com queda", avaliacao.get('origens_em_queda', []))):
+            if origens:
+                secoes += f"""
+            <h3 style="color: #2d3748;">{titulo} ({len(origens)})</h3>
+            <table style="border-collapse: collapse;">
+                <tr style="background-color: #4a5568; color: white;">
+                    <th style="padding: 4px 12px; text-align: left;">Origem</th>
+                    <th style="padding: 4px 12px; text-align: left;">Transações</th>
+                    <th style="padding: 4px 12px; text-align: left;">Esperado</th>
+                </tr>
+                {_linhas(origens[:30])}
+            </table>"""
+
+        esperado = avaliacao.get('total_esperado')
+        texto_esperado = f"{esperado:.0f}" if esperado is not None else "-"
+        z = avaliacao.get('z_total')
+        texto_z = f" (z = {z:+.1f})" if z is not None else ""
+
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head><meta charset="UTF-8"></head>
+        <body style="font-family: Arial, sans-serif; color: #333; max-width: 700px; margin: 0 auto; padding: 20px;">
+            <h2 style="color: {cor_titulo};">Volume de Recargas: {html.escape(avaliacao.get('nivel_volume', 'Normal'))}</h2>
+            <p style="font-size: 13px;"><strong>Período analisado:</strong> {html.escape(periodo_analise)}<br>
+            <strong>Transações na janela:</strong> {avaliacao.get('total', 0)}<br>
+            <strong>Esperado para o horário:</strong> {texto_esperado}{texto_z}</p>
+            {secoes}
+            <p style="font-size: 12px; color: #718096;">Volume esperado aprendido por meia hora da semana e origem
+            a partir das janelas anteriores. Percentuais de negadas não detectam paradas de tráfego.</p>
+        </body>
+        </html>
+        """
+
+    def _gerar_html_portal(self, avaliacao: Dict, cor_titulo: str, periodo_analise: str) -> str:
+        """
+        Gera HTML curto com as etapas do portal acima da linha de base
+
+        Args:
+            avaliacao: Retorno de TelemetriaPortal.verificar()
+            cor_titulo: Cor do título
+            periodo_analise: Período analisado
+
+        Returns:
+            HTML formatado
+        """
+        lentas = avaliacao.get('etapas_lentas', [])
+        secao = ''
+        if lentas:
+            linhas = ''.join(f"<tr><td style='padding: 4px 12px;'>{html.escape(e['descricao'])}</td>"
+                             f"<td style='padding: 4px 12px;'>{e['segundos']:.1f}</td>"
+                             f"<td style='padding: 4px 12px;'>{e['mediana']:.1f}</td>"
+                             f"<td style='padding: 4px 12px;'>{e['limite_s']:.1f}</td></tr>" for e in lentas)
+            secao = f"""
+            <h3 style="color: #2d3748;">Etapas lentas</h3>
+            <table style="border-collapse: collapse;">
+                <tr style="background-color: #4a5568; color: white;">
+                    <th style="padding: 4px 12px; text-align: left;">Etapa</th>
+                    <th style="padding: 4px 12px; text-align: left;">Segundos</th>
+                    <th style="padding: 4px 12px; text-align: left;">Mediana</th>
+                    <th style="padding: 4px 12px; text-align: left;">Limite</th>
+                </tr>
+                {linhas}
+            </table>"""
+
+        falha = avaliacao.get('etapa_falha')
+        texto_falha = f"<strong>Timeout na etapa:</strong> {html.escape(falha)}<br>" if falha else ""
+        tamanho = avaliacao.get('export_bytes')
+        texto_tamanho = f"<strong>Tamanho do export:</strong> {tamanho / 1024:.0f} KB<br>" if tamanho else ""
+
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head><meta charset="UTF-8"></head>
+        <body style="font-family: Arial, sans-serif; color: #333; max-width: 700px; margin: 0 auto; padding: 20px;">
+            <h2 style="color: {cor_titulo};">Portal GWCelWeb: {html.escape(avaliacao.get('nivel', 'Normal'))}</h2>
+            <p style="font-size: 13px;"><strong>Período analisado:</strong> {html.escape(periodo_analise)}<br>
+            {texto_falha}{texto_tamanho}<strong>Execuções degradadas seguidas:</strong> {avaliacao.get('degradadas_seguidas', 0)}</p>
+            {secao}
+            <p style="font-size: 12px; color: #718096;">Tempos medidos do clique/navegação até o elemento esperado,
+            comparados com a mediana das execuções anteriores. Lentidão do portal costuma anteceder erros N2.</p>
+        </body>
+        </html>
+        """
+
+    def _gerar_html_roteado(self, particao: Dict, cor_titulo: str, periodo_analise: str) -> str:
+        """
+        Gera HTML do alerta de uma rota: resumo, rankings e códigos da rota
+
+        Args:
+            particao: Métricas e tabelas da rota
+            cor_titulo: Cor do título
+            periodo_analise: Período analisado
+
+        Returns:
+            HTML formatado
+        """
+        resumo = pd.DataFrame({
+            'Métrica': ['Total de Transações', 'Recargas Negadas', 'Erro N2 (Servidor)', 'Valor Negado (R$)'],
+            'Valor': [
+                particao['total_transacoes'],
+                f"{particao['transacoes_negadas']} ({particao['percentual_negadas']:.2f}%)",
+                f"{particao['transacoes_n2']} ({particao['percentual_n2']:.2f}%)",
+                f"{particao['valor_negado']:.2f}",
+            ],
+        })
+
+        ranking_negadas = particao.get('ranking_negadas')
+        ranking_n2 = particao.get('ranking_n2')
+
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            {ESTILO_EMAIL}
+        </head>
+        <body>
+            <h2 style="color: {cor_titulo};">Alarmística de Recargas - {particao['rota']}</h2>
+            <p style="font-size: 13px; color: #666;"><strong>Período analisado:</strong> {periodo_analise}<br>
+            <strong>Nível para as origens desta rota:</strong> {particao['nivel_alarme']}</p>
+
+            <div class="secao">{self._tabela_para_html(resumo, "Resumo")}</div>
+            <div class="secao">
+                {self._tabela_para_html(ranking_negadas, "Ranking de Origens - Recargas Negadas")}
+                {gerar_grafico_inline(ranking_negadas, '#ffc107', self.graficos_inline)}
+            </div>
+            <div class="secao">
+                {self._tabela_para_html(ranking_n2, "Ranking de Origens - Erros N2 (Servidor)")}
+                {gerar_grafico_inline(ranking_n2, '#dc3545', self.graficos_inline)}
+            </div>
+            <div class="secao">{self._tabela_para_html(particao.get('tabela_codigos'), "Códigos de Resposta")}</div>
+
+            <div class="footer">
+                <p>Este e-mail contém apenas as origens e códigos roteados para este grupo.<br>
+                Sistema de Alarmística Automática - Equipe de Monitoramento</p>
+            </div>
+        </body>
+        </html>
+        """
+
     def _gerar_html(self,
                     resultado: Dict,
                     tabela_resumo: pd.DataFrame,
@@ -144,7 +836,8 @@ class EmailSender:
                     ranking_n2: pd.DataFrame,
                     nivel_alarme: str,
                     cor_titulo: str,
-                    periodo_analise: str) -> str:
+                    periodo_analise: str,
+                    links_anexos: Optional[List[str]] = None) -> str:
         """
         Gera HTML formatado para o e-mail
 
@@ -158,126 +851,165 @@ class EmailSender:
             nivel_alarme: Nível do alarme
             cor_titulo: Cor do título
             periodo_analise: Período analisado (ex: "14h às 14h30")
+            links_anexos: Arquivos grandes demais para anexar (citados pelo caminho local)
 
         Returns:
             HTML formatado
         """
-        # Saudação e texto inicial
-        saudacao = f"""
-        <div style="margin-bottom: 20px;">
-            <p style="font-size: 14px; color: #333;">Caros, boa tarde.</p>
-            <p style="font-size: 14px; color: #333;">Segue o report de recargas negadas.</p>
-            <p style="font-size: 13px; color: #666; font-style: italic;"><strong>Período analisado:</strong> {periodo_analise}</p>
-        </div>
+        template = compilar(TEMPLATE_RELATORIO)
+        campos = {
+            'cor_titulo': cor_titulo,
+            'periodo': periodo_analise,
+            'timestamp': str(resultado['timestamp_analise']),
+            'total': str(resultado['total_transacoes']),
+            'anexos': self._html_links_anexos(links_anexos),
+            'grupos': self._html_grupos_co_falha(resultado.get('grupos_co_falha')),
+        }
+
+        # Orçamento do corpo: limite menos o que é fixo (template + campos curtos, período aparece duas vezes)
+        fixos = template.bytes_estaticos + sum(len(v.encode('utf-8')) for v in campos.values()) \
+            + len(periodo_analise.encode('utf-8'))
+        orcamento = OrcamentoBytes(None if self.limite_bytes is None else self.limite_bytes - fixos)
+        limites = self.limites_linhas
+
+        # Seções em ordem de prioridade: o que não couber é truncado nas últimas
+        comparativo = resultado.get('comparativo')
+        campos['resumo'] = renderizar_tabela(tabela_resumo, "Resumo Geral", limites['resumo'], orcamento)
+        campos['comparativo'] = self._html_comparativo(resultado, orcamento)
+        campos['ranking_negadas'] = renderizar_tabela(
+            acrescentar_deltas(ranking_negadas, comparativo, 'Total Negadas', 'negadas'),
+            "Ranking de Origens - Todas as Recargas Negadas", limites['ranking_negadas'], orcamento)
+        campos['ranking_n2'] = renderizar_tabela(
+            acrescentar_deltas(ranking_n2, comparativo, 'Total N2', 'n2'),
+            "Ranking de Origens - Erros N2 (Servidor)", limites['ranking_n2'], orcamento)
+        campos['codigos'] = renderizar_tabela(tabela_codigos, "Distribuição de Códigos de Resposta",
+                                              limites['codigos'], orcamento)
+
+        # Gráficos inline em HTML/CSS (ou SVG) - leves, sem PNG nem matplotlib (omitidos se não couberem)
+        graficos = (('grafico_negadas', ranking_negadas, '#ffc107', limites['ranking_negadas']),
+                    ('grafico_n2', ranking_n2, '#dc3545', limites['ranking_n2']))
+        for campo, ranking, cor, max_linhas in graficos:
+            if ranking is not None and max_linhas:
+                ranking = ranking.head(max_linhas)
+            grafico = gerar_grafico_inline(ranking, cor, self.graficos_inline)
+            tamanho = len(grafico.encode('utf-8'))
+            if orcamento.cabe(tamanho):
+                orcamento.consumir(tamanho)
+                campos[campo] = grafico
+
+        campos['negadas'] = renderizar_tabela(tabela_negadas, "Recargas Negadas (Amostra)", limites['negadas'], orcamento)
+
+        return template.renderizar(campos)
+
+    def _gerar_html_resumo(self, resultado: Dict, cor_titulo: str, periodo_analise: str, top_n: int) -> str:
+        """
+        Gera HTML do resumo imediato: métricas da janela e top origens do agregado
+
+        Args:
+            resultado: Resultado da análise
+            cor_titulo: Cor do título
+            periodo_analise: Período analisado
+            top_n: Origens listadas no ranking
+
+        Returns:
+            HTML formatado
         """
+        ranking = None
+        agregado = resultado.get('agregado_origem')
+        if agregado is not None and len(agregado) > 0:
+            top = agregado[agregado['negadas'] > 0].nlargest(top_n, 'negadas')
+            ranking = pd.DataFrame({
+                'Origem': top['Origem'].astype(str).values,
+                'Total Negadas': top['negadas'].astype(int).values,
+                'Total N2': top['n2'].astype(int).values,
+                'Valor Negado (R$)': top['valor_negado'].astype(float).values,
+            })
+            ranking = acrescentar_deltas(ranking, resultado.get('comparativo'), 'Total Negadas', 'negadas')
 
-        # Converter tabelas para HTML
-        html_resumo = self._tabela_para_html(tabela_resumo, "Resumo Geral")
-        html_ranking_negadas = self._tabela_para_html(ranking_negadas, "Ranking de Origens - Todas as Recargas Negadas")
-        html_ranking_n2 = self._tabela_para_html(ranking_n2, "Ranking de Origens - Erros N2 (Servidor)")
-        html_codigos = self._tabela_para_html(tabela_codigos, "Distribuição de Códigos de Resposta")
-        html_negadas = self._tabela_para_html(tabela_negadas, "Recargas Negadas (Amostra)", max_rows=50)
+        return compilar(TEMPLATE_RESUMO).renderizar({
+            'cor_titulo': cor_titulo,
+            'periodo': html.escape(periodo_analise),
+            'nivel': html.escape(resultado.get('nivel_alarme', 'Normal')),
+            'negadas': str(resultado.get('transacoes_negadas', 0)),
+            'total': str(resultado.get('total_transacoes', 0)),
+            'percentual_negadas': f"{resultado.get('percentual_negadas', 0.0):.2f}",
+            'n2': str(resultado.get('transacoes_n2', 0)),
+            'percentual_n2': f"{resultado.get('percentual_n2', 0.0):.2f}",
+            'valor_negado': f"{resultado.get('valor_negado', 0.0):.2f}",
+            'percentual_valor_negado': f"{resultado.get('percentual_valor_negado', 0.0):.2f}",
+            'comparativo': self._html_comparativo(resultado),
+            'ranking': renderizar_tabela(ranking, "Top Origens - Recargas Negadas", top_n),
+            'grupos': self._html_grupos_co_falha(resultado.get('grupos_co_falha')),
+            'timestamp': str(resultado.get('timestamp_analise', '')),
+        })
 
-        # Gráficos REMOVIDOS do inline - serão apenas anexos
-        # Os gráficos continuam sendo enviados como anexos no e-mail
+    def _html_comparativo(self, resultado: Dict, orcamento: Optional[OrcamentoBytes] = None) -> str:
+        """
+        Seção com a variação da janela contra a janela anterior, ontem e a semana passada
 
-        # HTML completo
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    max-width: 1200px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin-bottom: 30px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }}
-                th {{
-                    background-color: #4a5568;
-                    color: white;
-                    padding: 12px;
-                    text-align: left;
-                    font-weight: bold;
-                }}
-                td {{
-                    padding: 10px 12px;
-                    border-bottom: 1px solid #e2e8f0;
-                }}
-                tr:nth-child(even) {{
-                    background-color: #f7fafc;
-                }}
-                tr:hover {{
-                    background-color: #edf2f7;
-                }}
-                .secao {{
-                    margin-bottom: 40px;
-                }}
-                .titulo-secao {{
-                    color: #2d3748;
-                    border-bottom: 2px solid #4a5568;
-                    padding-bottom: 10px;
-                    margin-bottom: 15px;
-                }}
-                .footer {{
-                    margin-top: 40px;
-                    padding-top: 20px;
-                    border-top: 1px solid #e2e8f0;
-                    font-size: 12px;
-                    color: #718096;
-                    text-align: center;
-                }}
-            </style>
-        </head>
-        <body>
-            <h1 style="color: {cor_titulo}; text-align: center; margin-bottom: 30px;">
-                Alarmística de Recargas - NOC
-            </h1>
+        Args:
+            resultado: Resultado da análise (com 'comparativo' de comparativo.montar_comparativo)
+            orcamento: Orçamento de bytes do corpo (consumido aqui)
 
-            {saudacao}
+        Returns:
+            HTML da seção (vazio se não houver histórico para comparar)
+        """
+        tabela = tabela_comparativa(resultado, resultado.get('comparativo'))
+        if len(tabela) == 0:
+            return ''
+        return renderizar_tabela(tabela, "Comparativo com Janelas Anteriores", None, orcamento)
 
-            <div class="secao">
-                {html_resumo}
-            </div>
+    def _html_grupos_co_falha(self, grupos: Optional[List[Dict]]) -> str:
+        """
+        Seção com os grupos de origens que falham juntas (possível causa comum)
 
-            <div class="secao">
-                {html_ranking_negadas}
-            </div>
+        Args:
+            grupos: resultado['grupos_co_falha'] (co_falhas.agrupar_co_falhas)
 
-            <div class="secao">
-                {html_ranking_n2}
-            </div>
+        Returns:
+            HTML da seção (vazio se não houver grupos)
+        """
+        if not grupos:
+            return ''
 
+        linhas = ''.join(
+            f"<tr><td>{i}</td><td>{html.escape(', '.join(g['origens']))}</td>"
+            f"<td>{g['correlacao_media']:.2f}</td><td>{g['janelas']}</td></tr>"
+            for i, g in enumerate(grupos, 1)
+        )
+        return f"""
             <div class="secao">
-                {html_codigos}
+                <h3 class="titulo-secao">Origens Falhando em Conjunto</h3>
+                <p style="font-size: 12px; color: #718096;">Origens do ranking cujas taxas de negadas variam juntas
+                nas últimas janelas - possível causa comum (gateway, integrador).</p>
+                <table border="0" class="tabela">
+                    <tr><th>Grupo</th><th>Origens</th><th>Correlação média</th><th>Janelas em comum</th></tr>
+                    {linhas}
+                </table>
             </div>
+        """
 
-            <div class="secao">
-                {html_negadas}
-            </div>
+    def _html_links_anexos(self, links: Optional[List[str]]) -> str:
+        """
+        Seção com os arquivos que não foram anexados por excederem o limite
 
-            <div class="footer">
-                <p>
-                    <strong>Análise realizada em:</strong> {resultado['timestamp_analise']}<br>
-                    <strong>Período analisado:</strong> {periodo_analise}<br>
-                    <strong>Total de transações analisadas:</strong> {resultado['total_transacoes']}<br>
-                    Sistema de Alarmística Automática - Equipe de Monitoramento (Janelas de 30 minutos)
-                </p>
-            </div>
-        </body>
-        </html>
+        Args:
+            links: Caminhos locais dos arquivos
+
+        Returns:
+            HTML da seção (vazio se não houver)
         """
+        if not links:
+            return ""
 
-        return html
+        itens = ''.join(
+            f'<li><a href="file://{html.escape(os.path.abspath(c))}">{html.escape(os.path.basename(c))}</a> '
+            f'({os.path.getsize(c) / (1024 * 1024):.1f} MB) - {html.escape(os.path.abspath(c))}</li>'
+            for c in links if os.path.exists(c)
+        )
+        return (f'<div class="secao"><h3 class="titulo-secao">Arquivos não anexados (tamanho)</h3>'
+                f'<p style="font-size: 13px;">Disponíveis no servidor da alarmística '
+                f'(após a retenção, no arquivo compactado da categoria output):</p><ul>{itens}</ul></div>')
 
     def _tabela_para_html(self, df: pd.DataFrame, titulo: str, max_rows: int = None) -> str:
         """
@@ -291,28 +1023,7 @@ class EmailSender:
         Returns:
             HTML da tabela
         """
-        if df is None or len(df) == 0:
-            return f"""
-            <h3 class="titulo-secao">{titulo}</h3>
-            <p style="color: #718096;">Nenhum dado disponível</p>
-            """
-
-        # Limitar linhas se necessário
-        if max_rows and len(df) > max_rows:
-            df_display = df.head(max_rows)
-            nota = f"<p style='color: #718096; font-size: 12px;'>* Exibindo {max_rows} de {len(df)} registros</p>"
-        else:
-            df_display = df
-            nota = ""
-
-        # Converter para HTML
-        html_table = df_display.to_html(index=False, border=0, classes='tabela')
-
-        return f"""
-        <h3 class="titulo-secao">{titulo}</h3>
-        {html_table}
-        {nota}
-        """
+        return renderizar_tabela(df, titulo, max_rows)
 
     def testar_conexao(self) -> bool:
         """
@@ -325,7 +1036,8 @@ class EmailSender:
             logger.info(f"Testando conexão SMTP: {self.smtp_server}:{self.smtp_port}")
 
             with smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=10) as server:
-                server.starttls()
+                if self.usar_tls:
+                    server.starttls()
                 server.login(self.smtp_user, self.smtp_password)
 
             logger.info("Conexão SMTP testada com sucesso!")
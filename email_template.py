@@ -0,0 +1,411 @@
+"""
+Módulo de Templates de E-mail
+Templates HTML compilados uma única vez (partes estáticas em cache) e
+renderização de tabelas linha a linha com limites de linhas e de bytes
+
+Uso (benchmark):
+    python3 email_template.py [linhas]
+"""
+
+import re
+import sys
+import html
+import time
+import logging
+import pandas as pd
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Folha de estilo comum aos e-mails com tabelas (relatório completo e alertas roteados)
+ESTILO_EMAIL = """
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            line-height: 1.6;
+            color: #333;
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        table {
+            border-collapse: collapse;
+            width: 100%;
+            margin-bottom: 30px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+        th {
+            background-color: #4a5568;
+            color: white;
+            padding: 12px;
+            text-align: left;
+            font-weight: bold;
+        }
+        td {
+            padding: 10px 12px;
+            border-bottom: 1px solid #e2e8f0;
+        }
+        tr:nth-child(even) {
+            background-color: #f7fafc;
+        }
+        tr:hover {
+            background-color: #edf2f7;
+        }
+        .secao {
+            margin-bottom: 40px;
+        }
+        .titulo-secao {
+            color: #2d3748;
+            border-bottom: 2px solid #4a5568;
+            padding-bottom: 10px;
+            margin-bottom: 15px;
+        }
+        .footer {
+            margin-top: 40px;
+            padding-top: 20px;
+            border-top: 1px solid #e2e8f0;
+            font-size: 12px;
+            color: #718096;
+            text-align: center;
+        }
+    </style>
+"""
+
+# Relatório completo do NOC: campos entre {{ }} são preenchidos a cada alerta
+TEMPLATE_RELATORIO = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+""" + ESTILO_EMAIL + """
+        </head>
+        <body>
+            <h1 style="color: {{cor_titulo}}; text-align: center; margin-bottom: 30px;">
+                Alarmística de Recargas - NOC
+            </h1>
+
+            <div style="margin-bottom: 20px;">
+                <p style="font-size: 14px; color: #333;">Caros, boa tarde.</p>
+                <p style="font-size: 14px; color: #333;">Segue o report de recargas negadas.</p>
+                <p style="font-size: 13px; color: #666; font-style: italic;"><strong>Período analisado:</strong> {{periodo}}</p>
+            </div>
+
+            <div class="secao">
+                {{resumo}}
+                {{comparativo}}
+            </div>
+
+            <div class="secao">
+                {{ranking_negadas}}
+                {{grafico_negadas}}
+            </div>
+
+            <div class="secao">
+                {{ranking_n2}}
+                {{grafico_n2}}
+            </div>
+
+            {{grupos}}
+
+            <div class="secao">
+                {{codigos}}
+            </div>
+
+            <div class="secao">
+                {{negadas}}
+            </div>
+
+            {{anexos}}
+
+            <div class="footer">
+                <p>
+                    <strong>Análise realizada em:</strong> {{timestamp}}<br>
+                    <strong>Período analisado:</strong> {{periodo}}<br>
+                    <strong>Total de transações analisadas:</strong> {{total}}<br>
+                    Sistema de Alarmística Automática - Equipe de Monitoramento (Janelas de 30 minutos)
+                </p>
+            </div>
+        </body>
+        </html>
+        """
+
+# Digest do incidente: várias janelas consolidadas em um e-mail
+TEMPLATE_DIGEST = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+""" + ESTILO_EMAIL + """
+        </head>
+        <body>
+            <h1 style="color: {{cor_titulo}}; text-align: center; margin-bottom: 30px;">
+                {{titulo}}
+            </h1>
+
+            <div style="margin-bottom: 20px;">
+                <p style="font-size: 13px; color: #666;"><strong>Janelas consolidadas:</strong> {{janelas}} ({{inicio}} a {{fim}})<br>
+                <strong>Motivo do envio:</strong> {{motivo}}<br>
+                <strong>No período:</strong> {{negadas}} negadas ({{percentual_negadas}}%), {{n2}} N2 ({{percentual_n2}}%),
+                R$ {{valor_negado}} negados em {{total}} transações</p>
+            </div>
+
+            <div class="secao">
+                {{tendencia}}
+            </div>
+
+            <div class="secao">
+                {{ranking_negadas}}
+                {{grafico_negadas}}
+            </div>
+
+            <div class="secao">
+                {{ranking_n2}}
+                {{grafico_n2}}
+            </div>
+
+            <div class="footer">
+                <p>Modo digest: janelas de 30 minutos acumuladas e enviadas por cadência, mudança de severidade ou resolução.<br>
+                Sistema de Alarmística Automática - Equipe de Monitoramento</p>
+            </div>
+        </body>
+        </html>
+        """
+
+# Resumo imediato: montado só com o resultado da análise, enviado antes do relatório completo
+TEMPLATE_RESUMO = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+""" + ESTILO_EMAIL + """
+        </head>
+        <body>
+            <h1 style="color: {{cor_titulo}}; text-align: center; margin-bottom: 30px;">
+                Alarmística de Recargas - NOC
+            </h1>
+
+            <div style="margin-bottom: 20px;">
+                <p style="font-size: 13px; color: #666;"><strong>Período analisado:</strong> {{periodo}}<br>
+                <strong>Nível:</strong> {{nivel}}<br>
+                <strong>Negadas:</strong> {{negadas}} de {{total}} ({{percentual_negadas}}%)<br>
+                <strong>Erro N2 (Servidor):</strong> {{n2}} ({{percentual_n2}}%)<br>
+                <strong>Valor negado:</strong> R$ {{valor_negado}} ({{percentual_valor_negado}}% do valor)</p>
+            </div>
+
+            <div class="secao">
+                {{comparativo}}
+            </div>
+
+            <div class="secao">
+                {{ranking}}
+            </div>
+
+            {{grupos}}
+
+            <div class="footer">
+                <p>O relatório completo (gráficos e Excel) segue em resposta a este e-mail.<br>
+                <strong>Análise realizada em:</strong> {{timestamp}}<br>
+                Sistema de Alarmística Automática - Equipe de Monitoramento</p>
+            </div>
+        </body>
+        </html>
+        """
+
+# Limites padrão de linhas por seção do relatório (None = sem limite)
+LIMITES_LINHAS_PADRAO = {
+    'resumo': None,
+    'ranking_negadas': 20,
+    'ranking_n2': 20,
+    'codigos': 20,
+    'negadas': 50,
+}
+
+# Abaixo do corte de ~102 KB do Gmail e dos limites usuais de gateways para o corpo HTML
+LIMITE_BYTES_PADRAO = 95_000
+
+_CAMPO = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+class TemplateCompilado:
+    """
+    Template dividido uma única vez em partes estáticas e nomes de campos
+    """
+
+    def __init__(self, texto: str):
+        """
+        Compila o template
+
+        Args:
+            texto: Template com campos no formato {{nome}}
+        """
+        partes = _CAMPO.split(texto)
+        self.estaticos: List[str] = partes[0::2]
+        self.campos: List[str] = partes[1::2]
+        self.bytes_estaticos = sum(len(p.encode('utf-8')) for p in self.estaticos)
+
+    def renderizar(self, valores: Dict[str, str]) -> str:
+        """
+        Preenche os campos (campos ausentes ficam vazios)
+
+        Args:
+            valores: Dict campo -> texto já em HTML
+
+        Returns:
+            HTML final
+        """
+        saida = [self.estaticos[0]]
+        for campo, estatico in zip(self.campos, self.estaticos[1:]):
+            saida.append(valores.get(campo, ''))
+            saida.append(estatico)
+        return ''.join(saida)
+
+
+@lru_cache(maxsize=None)
+def compilar(texto: str) -> TemplateCompilado:
+    """
+    Compila um template (em cache: cada texto é compilado uma vez por processo)
+    """
+    return TemplateCompilado(texto)
+
+
+class OrcamentoBytes:
+    """
+    Bytes ainda disponíveis para o corpo da mensagem
+    """
+
+    def __init__(self, limite: Optional[int]):
+        """
+        Args:
+            limite: Bytes disponíveis (None = sem limite)
+        """
+        self.restante = limite
+
+    def cabe(self, tamanho: int) -> bool:
+        """
+        Indica se um trecho de tamanho bytes cabe no orçamento
+        """
+        return self.restante is None or tamanho <= self.restante
+
+    def consumir(self, tamanho: int):
+        """
+        Desconta um trecho já incluído
+        """
+        if self.restante is not None:
+            self.restante -= tamanho
+
+
+def _formatar_celula(valor) -> str:
+    """
+    Converte um valor de célula em texto HTML escapado
+    """
+    if valor is None or (isinstance(valor, float) and valor != valor):
+        return ''
+    if isinstance(valor, float):
+        return f"{valor:.2f}"
+    if isinstance(valor, pd.Timestamp):
+        return '' if pd.isna(valor) else valor.strftime('%Y-%m-%d %H:%M:%S')
+    return html.escape(str(valor))
+
+
+def renderizar_tabela(df: pd.DataFrame, titulo: str, max_linhas: Optional[int] = None,
+                      orcamento: Optional[OrcamentoBytes] = None) -> str:
+    """
+    Renderiza uma seção de tabela linha a linha, parando no limite de linhas ou de bytes
+
+    Args:
+        df: DataFrame a converter
+        titulo: Título da seção
+        max_linhas: Máximo de linhas (None = todas)
+        orcamento: Orçamento de bytes compartilhado entre as seções (consumido aqui)
+
+    Returns:
+        HTML da seção
+    """
+    titulo_html = f'\n        <h3 class="titulo-secao">{html.escape(titulo)}</h3>\n'
+
+    if df is None or len(df) == 0:
+        secao = titulo_html + '        <p style="color: #718096;">Nenhum dado disponível</p>\n'
+        if orcamento is not None:
+            orcamento.consumir(len(secao.encode('utf-8')))
+        return secao
+
+    cabecalho = ('<table border="0" class="dataframe tabela">\n  <thead>\n    <tr style="text-align: right;">\n'
+                 + ''.join(f'      <th>{html.escape(str(c))}</th>\n' for c in df.columns)
+                 + '    </tr>\n  </thead>\n  <tbody>\n')
+    rodape = '  </tbody>\n</table>\n'
+    reserva_nota = 120  # espaço para a nota de truncamento
+
+    partes = [titulo_html, cabecalho]
+    usados = len(titulo_html.encode('utf-8')) + len(cabecalho.encode('utf-8')) + len(rodape) + reserva_nota
+    if orcamento is not None and not orcamento.cabe(usados):
+        return ''
+
+    total = len(df)
+    limite = total if max_linhas is None else min(total, max_linhas)
+    exibidas = 0
+
+    for linha in df.head(limite).itertuples(index=False, name=None):
+        tr = '    <tr>\n' + ''.join(f'      <td>{_formatar_celula(v)}</td>\n' for v in linha) + '    </tr>\n'
+        tamanho = len(tr.encode('utf-8'))
+        if orcamento is not None and not orcamento.cabe(usados + tamanho):
+            break
+        partes.append(tr)
+        usados += tamanho
+        exibidas += 1
+
+    partes.append(rodape)
+    if exibidas < total:
+        partes.append(f"        <p style='color: #718096; font-size: 12px;'>* Exibindo {exibidas} de {total} registros</p>\n")
+
+    secao = ''.join(partes)
+    if orcamento is not None:
+        orcamento.consumir(len(secao.encode('utf-8')))
+    return secao
+
+
+def _benchmark(linhas: int = 20000):
+    """
+    Compara o renderizador com DataFrame.to_html em rankings grandes
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    ranking = pd.DataFrame({
+        'Origem': [f"ORIG{i:05d}" for i in range(linhas)],
+        'Total Negadas': rng.integers(1, 500, linhas),
+    })
+    negadas = pd.DataFrame({
+        'Origem': ranking['Origem'],
+        'Telefone': rng.integers(11_900_000_000, 11_999_999_999, linhas).astype(str),
+        'Valor': rng.choice([10.0, 15.0, 20.0, 30.0, 50.0], linhas),
+        'Estado Transação': 'Negada Servidor',
+        'Cod Resp': 'N2',
+        'Data/Hora Origem': pd.Timestamp('2026-01-01 14:00') + pd.to_timedelta(rng.integers(0, 1800, linhas), unit='s'),
+    })
+
+    inicio = time.perf_counter()
+    antigo = ''.join(df.to_html(index=False, border=0, classes='tabela')
+                     for df in (ranking, ranking, ranking, negadas.head(50)))
+    t_antigo = time.perf_counter() - inicio
+
+    template = compilar(TEMPLATE_RELATORIO)
+    inicio = time.perf_counter()
+    orcamento = OrcamentoBytes(LIMITE_BYTES_PADRAO - template.bytes_estaticos)
+    valores = {
+        'ranking_negadas': renderizar_tabela(ranking, "Ranking", LIMITES_LINHAS_PADRAO['ranking_negadas'], orcamento),
+        'ranking_n2': renderizar_tabela(ranking, "Ranking N2", LIMITES_LINHAS_PADRAO['ranking_n2'], orcamento),
+        'codigos': renderizar_tabela(ranking, "Códigos", LIMITES_LINHAS_PADRAO['codigos'], orcamento),
+        'negadas': renderizar_tabela(negadas, "Negadas", LIMITES_LINHAS_PADRAO['negadas'], orcamento),
+    }
+    novo = template.renderizar(valores)
+    t_novo = time.perf_counter() - inicio
+
+    print(f"Rankings com {linhas} linhas")
+    print(f"  to_html (sem limites):     {t_antigo * 1000:8.1f} ms  {len(antigo.encode('utf-8')) / 1024:9.1f} KB")
+    print(f"  template + orçamento:      {t_novo * 1000:8.1f} ms  {len(novo.encode('utf-8')) / 1024:9.1f} KB")
+
+
+if __name__ == "__main__":
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,259 @@
+"""
+Módulo de Estado de Alarme
+Máquina de estados persistente com histerese para incidentes de recargas
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Estados do incidente
+ESTADO_NORMAL = 'Normal'
+ESTADO_ABERTO = 'Aberto'
+ESTADO_EM_ANDAMENTO = 'Em andamento'
+ESTADO_ESCALADO = 'Escalado'
+ESTADO_RESOLVIDO = 'Resolvido'
+
+ESTADOS_ATIVOS = (ESTADO_ABERTO, ESTADO_EM_ANDAMENTO, ESTADO_ESCALADO)
+
+# Severidade de cada nível de alarme (para detectar escalonamento)
+SEVERIDADE = {'Normal': 0, 'Alerta': 1, 'Crítico': 2}
+
+
+class MaquinaEstadoAlarme:
+    """
+    Controla o ciclo de vida de um incidente entre execuções
+
+    Transições:
+    - Normal/Resolvido → Aberto: janela com Alerta ou Crítico
+    - Aberto/Em andamento/Escalado → Escalado: severidade acima da máxima do incidente
+    - Aberto/Em andamento/Escalado → Em andamento: incidente continua
+    - Aberto/Em andamento/Escalado → Resolvido: métricas abaixo de threshold × fator_histerese
+      por janelas_para_resolver janelas seguidas
+
+    Só as transições para Aberto e Escalado pedem o relatório completo (gráficos + Excel).
+    Janelas Em andamento geram apenas uma atualização leve com a variação das métricas.
+
+    As transições notificadas (Aberto, Escalado, Resolvido) ficam pendentes até
+    confirmar(), chamado após o envio: se o e-mail falhar, a próxima janela
+    repete a transição em vez de seguir como Em andamento.
+    """
+
+    def __init__(self, caminho_estado: str, fator_histerese: float = 0.8, janelas_para_resolver: int = 2):
+        """
+        Inicializa a máquina de estados
+
+        Args:
+            caminho_estado: Arquivo JSON onde o estado é persistido
+            fator_histerese: Fração do threshold abaixo da qual a métrica conta como normalizada
+            janelas_para_resolver: Janelas seguidas abaixo da histerese para resolver o incidente
+        """
+        self.caminho_estado = caminho_estado
+        self.fator_histerese = fator_histerese
+        self.janelas_para_resolver = max(1, janelas_para_resolver)
+        self.estado = self._carregar()
+        self.pendente = False
+
+    def _estado_inicial(self) -> Dict:
+        """
+        Estado usado quando não há arquivo persistido
+
+        Returns:
+            Dicionário de estado vazio (Normal)
+        """
+        return {
+            'estado': ESTADO_NORMAL,
+            'nivel_atual': 'Normal',
+            'severidade_maxima': 'Normal',
+            'aberto_em': None,
+            'atualizado_em': None,
+            'janelas_incidente': 0,
+            'janelas_abaixo': 0,
+            'ultimas_metricas': {},
+        }
+
+    def _carregar(self) -> Dict:
+        """
+        Carrega o estado persistido (ou o estado inicial se não existir/corrompido)
+
+        Returns:
+            Dicionário de estado
+        """
+        estado = self._estado_inicial()
+
+        if not os.path.exists(self.caminho_estado):
+            return estado
+
+        try:
+            with open(self.caminho_estado, 'r', encoding='utf-8') as f:
+                estado.update(json.load(f))
+        except Exception as e:
+            logger.error(f"Erro ao carregar estado de alarme, reiniciando como Normal: {e}")
+
+        return estado
+
+    def _salvar(self):
+        """
+        Persiste o estado de forma atômica (arquivo temporário + rename)
+        """
+        diretorio = os.path.dirname(self.caminho_estado)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        tmp_path = f"{self.caminho_estado}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.estado, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.caminho_estado)
+
+    def _abaixo_histerese(self, resultado: Dict, threshold_negadas: float, threshold_n2: float,
+                          threshold_valor_negadas: Optional[float]) -> bool:
+        """
+        Verifica se todas as métricas estão abaixo da faixa de histerese
+
+        Args:
+            resultado: Resultado da análise
+            threshold_negadas: Threshold de negadas
+            threshold_n2: Threshold de N2
+            threshold_valor_negadas: Threshold de valor negado (None = ignorado)
+
+        Returns:
+            True se a janela conta como normalizada
+        """
+        fator = self.fator_histerese
+
+        if resultado.get('percentual_negadas', 0) >= threshold_negadas * fator:
+            return False
+        if resultado.get('percentual_n2', 0) >= threshold_n2 * fator:
+            return False
+        if (threshold_valor_negadas is not None
+                and resultado.get('percentual_valor_negado', 0) >= threshold_valor_negadas * fator):
+            return False
+
+        return True
+
+    def atualizar(self, resultado: Dict, threshold_negadas: float, threshold_n2: float,
+                  threshold_valor_negadas: Optional[float] = None) -> Dict:
+        """
+        Aplica o resultado da janela atual à máquina de estados
+
+        Persiste na hora, exceto as transições notificadas, que aguardam confirmar()
+
+        Args:
+            resultado: Resultado de RecargaAnalyzer.analisar()
+            threshold_negadas: Threshold de negadas da janela
+            threshold_n2: Threshold de N2 da janela
+            threshold_valor_negadas: Threshold de valor negado (None = desativado)
+
+        Returns:
+            Dict com 'estado', 'estado_anterior', 'transicao', 'gerar_relatorio',
+            'enviar_atualizacao', 'enviar_resolucao', 'pendente', 'delta' e 'incidente'
+        """
+        anterior = self.estado['estado']
+        nivel = resultado.get('nivel_alarme', 'Normal')
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        metricas = {
+            'percentual_negadas': resultado.get('percentual_negadas', 0.0),
+            'percentual_n2': resultado.get('percentual_n2', 0.0),
+            'percentual_valor_negado': resultado.get('percentual_valor_negado', 0.0),
+            'total_transacoes': resultado.get('total_transacoes', 0),
+        }
+        ultimas = self.estado.get('ultimas_metricas') or {}
+        delta = {chave: round(valor - ultimas[chave], 2) for chave, valor in metricas.items() if chave in ultimas}
+
+        if anterior not in ESTADOS_ATIVOS:
+            if nivel != 'Normal':
+                novo = ESTADO_ABERTO
+                self.estado.update({
+                    'aberto_em': agora,
+                    'severidade_maxima': nivel,
+                    'janelas_incidente': 1,
+                    'janelas_abaixo': 0,
+                })
+            else:
+                novo = ESTADO_NORMAL
+
+        elif SEVERIDADE.get(nivel, 0) > SEVERIDADE.get(self.estado['severidade_maxima'], 0):
+            novo = ESTADO_ESCALADO
+            self.estado['severidade_maxima'] = nivel
+            self.estado['janelas_incidente'] += 1
+            self.estado['janelas_abaixo'] = 0
+
+        elif nivel == 'Normal' and self._abaixo_histerese(resultado, threshold_negadas, threshold_n2,
+                                                          threshold_valor_negadas):
+            self.estado['janelas_incidente'] += 1
+            self.estado['janelas_abaixo'] += 1
+            if self.estado['janelas_abaixo'] >= self.janelas_para_resolver:
+                novo = ESTADO_RESOLVIDO
+            else:
+                novo = ESTADO_EM_ANDAMENTO
+
+        else:
+            # Ainda em alarme, ou normalizado dentro da faixa de histerese
+            novo = ESTADO_EM_ANDAMENTO
+            self.estado['janelas_incidente'] += 1
+            self.estado['janelas_abaixo'] = 0
+
+        incidente = {
+            'aberto_em': self.estado.get('aberto_em'),
+            'severidade_maxima': self.estado.get('severidade_maxima'),
+            'janelas_incidente': self.estado.get('janelas_incidente', 0),
+        }
+
+        self.estado.update({
+            'estado': novo,
+            'nivel_atual': nivel,
+            'atualizado_em': agora,
+            'ultimas_metricas': metricas,
+        })
+
+        if novo in (ESTADO_NORMAL, ESTADO_RESOLVIDO):
+            self.estado.update({
+                'aberto_em': None,
+                'severidade_maxima': 'Normal',
+                'janelas_incidente': 0,
+                'janelas_abaixo': 0,
+            })
+
+        self.pendente = novo in (ESTADO_ABERTO, ESTADO_ESCALADO, ESTADO_RESOLVIDO)
+        if not self.pendente:
+            self._persistir()
+
+        transicao = novo != anterior and not (anterior == ESTADO_RESOLVIDO and novo == ESTADO_NORMAL)
+
+        logger.info(f"Estado do alarme: {anterior} → {novo}"
+                   f"{' (transição)' if transicao else ''}")
+
+        return {
+            'estado': novo,
+            'estado_anterior': anterior,
+            'transicao': transicao,
+            'gerar_relatorio': novo in (ESTADO_ABERTO, ESTADO_ESCALADO),
+            'enviar_atualizacao': novo == ESTADO_EM_ANDAMENTO,
+            'enviar_resolucao': novo == ESTADO_RESOLVIDO,
+            'pendente': self.pendente,
+            'delta': delta,
+            'incidente': incidente,
+        }
+
+    def confirmar(self):
+        """
+        Persiste a transição pendente (chamado após o envio da notificação)
+        """
+        if self.pendente:
+            self._persistir()
+            self.pendente = False
+
+    def _persistir(self):
+        """
+        Salva o estado, registrando a falha no log
+        """
+        try:
+            self._salvar()
+        except Exception as e:
+            logger.error(f"Erro ao salvar estado de alarme: {e}")
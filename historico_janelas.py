@@ -0,0 +1,484 @@
+"""
+Módulo de Histórico de Janelas
+Persiste os agregados de cada janela de 30 minutos em SQLite
+"""
+
+import os
+import sqlite3
+import logging
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Média e percentis do valor negado gravados por origem, código e bucket (colunas de RecargaAnalyzer._agregar_valor)
+COLUNAS_VALOR_NEGADO = ['valor_negado_medio', 'valor_negado_p50', 'valor_negado_p90', 'valor_negado_p95']
+
+
+class HistoricoJanelas:
+    """
+    Armazena os agregados de cada janela analisada (sem dados linha a linha)
+
+    Tabelas:
+    - janelas: métricas gerais da janela (contagens, percentuais, valores, alarme)
+    - janelas_origem: contagens, valores e percentis do valor negado por origem
+    - janelas_codigo: contagens, valores e percentis do valor negado por código de resposta
+    - janelas_bucket: contagens, valores e percentis do valor negado por bucket de tempo
+    - digest_janelas: janelas em alarme acumuladas para o e-mail consolidado (modo digest)
+    - execucoes: marcos de tempo de cada execução (latência de detecção)
+
+    Todas as tabelas são indexadas pelo fim da janela (texto ISO 'YYYY-MM-DD HH:MM').
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Inicializa o histórico (cria o banco e as tabelas se necessário)
+
+        Args:
+            db_path: Caminho do arquivo SQLite
+        """
+        self.db_path = db_path
+        diretorio = os.path.dirname(db_path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self._criar_tabelas()
+
+    def _criar_tabelas(self):
+        """
+        Cria as tabelas do histórico
+        """
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS janelas (
+                    fim_janela TEXT PRIMARY KEY,
+                    inicio_janela TEXT,
+                    periodo_dia TEXT,
+                    total_transacoes INTEGER,
+                    transacoes_negadas INTEGER,
+                    transacoes_n2 INTEGER,
+                    percentual_negadas REAL,
+                    percentual_n2 REAL,
+                    valor_total REAL,
+                    valor_negado REAL,
+                    percentual_valor_negado REAL,
+                    valor_negado_medio REAL,
+                    valor_negado_p50 REAL,
+                    valor_negado_p90 REAL,
+                    valor_negado_p95 REAL,
+                    nivel_alarme TEXT,
+                    registrado_em TEXT
+                );
+
+                CREATE TABLE IF NOT EXISTS janelas_origem (
+                    fim_janela TEXT,
+                    origem TEXT,
+                    total INTEGER,
+                    negadas INTEGER,
+                    n2 INTEGER,
+                    valor_total REAL,
+                    valor_negado REAL,
+                    valor_negado_medio REAL,
+                    valor_negado_p50 REAL,
+                    valor_negado_p90 REAL,
+                    valor_negado_p95 REAL,
+                    PRIMARY KEY (fim_janela, origem)
+                );
+
+                CREATE TABLE IF NOT EXISTS janelas_codigo (
+                    fim_janela TEXT,
+                    cod_resp TEXT,
+                    quantidade INTEGER,
+                    valor_negado REAL,
+                    valor_negado_medio REAL,
+                    valor_negado_p50 REAL,
+                    valor_negado_p90 REAL,
+                    valor_negado_p95 REAL,
+                    PRIMARY KEY (fim_janela, cod_resp)
+                );
+
+                CREATE TABLE IF NOT EXISTS janelas_bucket (
+                    fim_janela TEXT,
+                    bucket TEXT,
+                    total INTEGER,
+                    negadas INTEGER,
+                    n2 INTEGER,
+                    valor_total REAL,
+                    valor_negado REAL,
+                    valor_negado_medio REAL,
+                    valor_negado_p50 REAL,
+                    valor_negado_p90 REAL,
+                    valor_negado_p95 REAL,
+                    PRIMARY KEY (fim_janela, bucket)
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_janelas_origem_origem
+                    ON janelas_origem (origem, fim_janela);
+
+                CREATE TABLE IF NOT EXISTS digest_janelas (
+                    fim_janela TEXT PRIMARY KEY,
+                    nivel_alarme TEXT,
+                    acumulada_em TEXT,
+                    digest_enviado_em TEXT
+                );
+
+                CREATE TABLE IF NOT EXISTS execucoes (
+                    iniciada_em TEXT PRIMARY KEY,
+                    fim_janela TEXT,
+                    arquivo_disponivel TEXT,
+                    decisao TEXT,
+                    primeira_notificacao TEXT,
+                    relatorio_enviado TEXT,
+                    canal_primeira_notificacao TEXT,
+                    nivel_alarme TEXT
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_execucoes_fim_janela
+                    ON execucoes (fim_janela);
+            """)
+
+    @staticmethod
+    def chave_janela(momento: datetime) -> str:
+        """
+        Converte o fim da janela para a chave usada no banco
+
+        Args:
+            momento: Data/hora do fim da janela
+
+        Returns:
+            Texto 'YYYY-MM-DD HH:MM'
+        """
+        return momento.strftime('%Y-%m-%d %H:%M')
+
+    def registrar_janela(self, resultado: Dict, inicio_janela: datetime, fim_janela: datetime,
+                         periodo_dia: str = None) -> bool:
+        """
+        Grava (ou substitui) os agregados de uma janela
+
+        Args:
+            resultado: Resultado de RecargaAnalyzer.analisar()
+            inicio_janela: Início da janela analisada
+            fim_janela: Fim da janela analisada
+            periodo_dia: Período do dia ('manha', 'tarde', ...)
+
+        Returns:
+            True se gravou com sucesso
+        """
+        if not resultado:
+            return False
+
+        chave = self.chave_janela(fim_janela)
+
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO janelas VALUES
+                    (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    chave,
+                    self.chave_janela(inicio_janela),
+                    periodo_dia,
+                    int(resultado.get('total_transacoes', 0)),
+                    int(resultado.get('transacoes_negadas', 0)),
+                    int(resultado.get('transacoes_n2', 0)),
+                    float(resultado.get('percentual_negadas', 0.0)),
+                    float(resultado.get('percentual_n2', 0.0)),
+                    float(resultado.get('valor_total', 0.0)),
+                    float(resultado.get('valor_negado', 0.0)),
+                    float(resultado.get('percentual_valor_negado', 0.0)),
+                    float(resultado.get('valor_negado_medio', 0.0)),
+                    float(resultado.get('valor_negado_p50', 0.0)),
+                    float(resultado.get('valor_negado_p90', 0.0)),
+                    float(resultado.get('valor_negado_p95', 0.0)),
+                    resultado.get('nivel_alarme', 'Normal'),
+                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                ))
+
+                agregado_origem = resultado.get('agregado_origem')
+                self.conn.execute("DELETE FROM janelas_origem WHERE fim_janela = ?", (chave,))
+                if agregado_origem is not None and len(agregado_origem) > 0:
+                    colunas = ['Origem', 'total', 'negadas', 'n2', 'valor_total', 'valor_negado'] + COLUNAS_VALOR_NEGADO
+                    self.conn.executemany(
+                        "INSERT INTO janelas_origem VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (chave, str(origem), int(total), int(negadas), int(n2),
+                             float(valor_total), float(valor_negado), *(float(v) for v in percentis))
+                            for origem, total, negadas, n2, valor_total, valor_negado, *percentis
+                            in agregado_origem[colunas].itertuples(index=False)
+                        ]
+                    )
+
+                agregado_codigo = resultado.get('agregado_codigo')
+                self.conn.execute("DELETE FROM janelas_codigo WHERE fim_janela = ?", (chave,))
+                if agregado_codigo is not None and len(agregado_codigo) > 0:
+                    colunas = ['Cod Resp', 'total', 'valor_negado'] + COLUNAS_VALOR_NEGADO
+                    self.conn.executemany(
+                        "INSERT INTO janelas_codigo VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (chave, str(codigo), int(total), float(valor_negado), *(float(v) for v in percentis))
+                            for codigo, total, valor_negado, *percentis
+                            in agregado_codigo[colunas].itertuples(index=False)
+                        ]
+                    )
+
+                agregado_bucket = resultado.get('agregado_bucket')
+                self.conn.execute("DELETE FROM janelas_bucket WHERE fim_janela = ?", (chave,))
+                if agregado_bucket is not None and len(agregado_bucket) > 0:
+                    colunas = ['bucket', 'total', 'negadas', 'n2', 'valor_total', 'valor_negado'] + COLUNAS_VALOR_NEGADO
+                    self.conn.executemany(
+                        "INSERT INTO janelas_bucket VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (chave, pd.Timestamp(bucket).strftime('%Y-%m-%d %H:%M'), int(total), int(negadas), int(n2),
+                             float(valor_total), float(valor_negado), *(float(v) for v in percentis))
+                            for bucket, total, negadas, n2, valor_total, valor_negado, *percentis
+                            in agregado_bucket[colunas].itertuples(index=False)
+                        ]
+                    )
+
+            logger.info(f"Janela registrada no histórico: {chave}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro ao registrar janela no histórico: {e}")
+            return False
+
+    def carregar_janelas(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Carrega as métricas gerais das janelas em um intervalo
+
+        Args:
+            inicio: Fim de janela mínimo (None = sem limite)
+            fim: Fim de janela máximo (None = sem limite)
+
+        Returns:
+            DataFrame ordenado por fim_janela
+        """
+        sql, params = self._filtro_intervalo("SELECT * FROM janelas", inicio, fim)
+        return pd.read_sql_query(sql + " ORDER BY fim_janela", self.conn, params=params)
+
+    def carregar_origens(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                         origens: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Carrega os agregados por origem em um intervalo
+
+        Args:
+            inicio: Fim de janela mínimo (None = sem limite)
+            fim: Fim de janela máximo (None = sem limite)
+            origens: Filtrar apenas estas origens (None = todas)
+
+        Returns:
+            DataFrame com uma linha por (fim_janela, origem)
+        """
+        sql, params = self._filtro_intervalo("SELECT * FROM janelas_origem", inicio, fim)
+        if origens:
+            sql += (" AND" if params else " WHERE") + f" origem IN ({','.join('?' * len(origens))})"
+            params = params + [str(o) for o in origens]
+        return pd.read_sql_query(sql + " ORDER BY fim_janela", self.conn, params=params)
+
+    def carregar_buckets(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Carrega os agregados por bucket de tempo em um intervalo
+
+        Args:
+            inicio: Fim de janela mínimo (None = sem limite)
+            fim: Fim de janela máximo (None = sem limite)
+
+        Returns:
+            DataFrame com uma linha por (fim_janela, bucket)
+        """
+        sql, params = self._filtro_intervalo("SELECT * FROM janelas_bucket", inicio, fim)
+        return pd.read_sql_query(sql + " ORDER BY fim_janela, bucket", self.conn, params=params)
+
+    def janela_mais_proxima(self, alvo: datetime, tolerancia_min: int = 5) -> Optional[Dict]:
+        """
+        Janela registrada cujo fim é o mais próximo de um horário, dentro da tolerância
+
+        Consulta por intervalo na chave primária (fim_janela): lê apenas as
+        poucas janelas da faixa, sem varrer o histórico.
+
+        Args:
+            alvo: Fim de janela procurado
+            tolerancia_min: Diferença máxima em minutos (execuções atrasadas/adiantadas)
+
+        Returns:
+            Dict com as colunas da tabela janelas, ou None se não houver janela na faixa
+        """
+        margem = timedelta(minutes=tolerancia_min)
+        linha = self.conn.execute("""
+            SELECT * FROM janelas
+            WHERE fim_janela BETWEEN ? AND ?
+            ORDER BY ABS(julianday(fim_janela) - julianday(?))
+            LIMIT 1
+        """, (self.chave_janela(alvo - margem), self.chave_janela(alvo + margem),
+              alvo.strftime('%Y-%m-%d %H:%M:%S'))).fetchone()
+        return dict(linha) if linha else None
+
+    # ===== DIGEST =====
+
+    def acumular_digest(self, fim_janela: datetime, nivel_alarme: str, enviada: bool = False):
+        """
+        Inclui uma janela no digest
+
+        Args:
+            fim_janela: Fim da janela (já registrada com registrar_janela)
+            nivel_alarme: Nível da janela
+            enviada: Marca a janela como já coberta por um e-mail (ex: relatório de abertura)
+        """
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO digest_janelas VALUES (?, ?, ?, ?)",
+                (self.chave_janela(fim_janela), nivel_alarme, agora, agora if enviada else None)
+            )
+
+    def carregar_digest_pendente(self) -> pd.DataFrame:
+        """
+        Janelas acumuladas e ainda não enviadas, com as métricas gerais de cada uma
+
+        Returns:
+            DataFrame ordenado por fim_janela
+        """
+        return pd.read_sql_query("""
+            SELECT j.* FROM digest_janelas d
+            JOIN janelas j ON j.fim_janela = d.fim_janela
+            WHERE d.digest_enviado_em IS NULL
+            ORDER BY j.fim_janela
+        """, self.conn)
+
+    def ultima_janela_digest(self, apenas_alarme: bool = False) -> Optional[Dict]:
+        """
+        Última janela incluída no digest (pendente ou enviada)
+
+        Args:
+            apenas_alarme: Ignora janelas com nível Normal (incidente ainda não resolvido)
+
+        Returns:
+            Dict com fim_janela, nivel_alarme e digest_enviado_em, ou None
+        """
+        filtro = "WHERE nivel_alarme != 'Normal' " if apenas_alarme else ""
+        linha = self.conn.execute(
+            f"SELECT * FROM digest_janelas {filtro}ORDER BY fim_janela DESC LIMIT 1"
+        ).fetchone()
+        return dict(linha) if linha else None
+
+    def ultimo_digest_enviado(self) -> Optional[str]:
+        """
+        Fim da última janela já coberta por um e-mail ('YYYY-MM-DD HH:MM' ou None)
+        """
+        linha = self.conn.execute(
+            "SELECT MAX(fim_janela) FROM digest_janelas WHERE digest_enviado_em IS NOT NULL"
+        ).fetchone()
+        return linha[0] if linha else None
+
+    def marcar_digest_enviado(self, chaves: List[str]):
+        """
+        Marca janelas do digest como enviadas
+
+        Args:
+            chaves: fim_janela ('YYYY-MM-DD HH:MM') das janelas enviadas
+        """
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE digest_janelas SET digest_enviado_em = ? WHERE fim_janela = ?",
+                [(agora, chave) for chave in chaves]
+            )
+
+    def somar_origens(self, chaves: List[str]) -> pd.DataFrame:
+        """
+        Soma os agregados por origem de um conjunto de janelas
+
+        Args:
+            chaves: fim_janela das janelas a combinar
+
+        Returns:
+            DataFrame com origem, total, negadas, n2, valor_total e valor_negado
+        """
+        if not chaves:
+            return pd.DataFrame(columns=['origem', 'total', 'negadas', 'n2', 'valor_total', 'valor_negado'])
+
+        return pd.read_sql_query(f"""
+            SELECT origem, SUM(total) AS total, SUM(negadas) AS negadas, SUM(n2) AS n2,
+                   SUM(valor_total) AS valor_total, SUM(valor_negado) AS valor_negado
+            FROM janelas_origem
+            WHERE fim_janela IN ({','.join('?' * len(chaves))})
+            GROUP BY origem
+        """, self.conn, params=list(chaves))
+
+    # ===== EXECUÇÕES =====
+
+    def registrar_execucao(self, marcos: Dict) -> bool:
+        """
+        Grava os marcos de tempo de uma execução
+
+        Args:
+            marcos: Dict com iniciada_em, fim_janela e os marcos de etapa
+                    (texto 'YYYY-MM-DD HH:MM:SS.fff' ou None)
+
+        Returns:
+            True se gravou com sucesso
+        """
+        colunas = ['iniciada_em', 'fim_janela', 'arquivo_disponivel', 'decisao', 'primeira_notificacao',
+                   'relatorio_enviado', 'canal_primeira_notificacao', 'nivel_alarme']
+        try:
+            with self.conn:
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO execucoes ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                    [marcos.get(c) for c in colunas]
+                )
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro ao registrar execução no histórico: {e}")
+            return False
+
+    def carregar_execucoes(self, inicio: Optional[datetime] = None, fim: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Carrega os marcos das execuções cujas janelas terminam no intervalo
+
+        Args:
+            inicio: Fim de janela mínimo (None = sem limite)
+            fim: Fim de janela máximo (None = sem limite)
+
+        Returns:
+            DataFrame ordenado por fim_janela
+        """
+        sql, params = self._filtro_intervalo("SELECT * FROM execucoes", inicio, fim)
+        return pd.read_sql_query(sql + " ORDER BY fim_janela", self.conn, params=params)
+
+    def _filtro_intervalo(self, sql: str, inicio: Optional[datetime], fim: Optional[datetime]):
+        """
+        Acrescenta o filtro de intervalo por fim_janela a uma consulta
+
+        Args:
+            sql: Consulta base (sem WHERE)
+            inicio: Limite inferior (inclusivo)
+            fim: Limite superior (inclusivo)
+
+        Returns:
+            Tupla (sql, params)
+        """
+        condicoes = []
+        params = []
+        if inicio is not None:
+            condicoes.append("fim_janela >= ?")
+            params.append(self.chave_janela(inicio))
+        if fim is not None:
+            condicoes.append("fim_janela <= ?")
+            params.append(self.chave_janela(fim))
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        return sql, params
+
+    def fechar(self):
+        """
+        Fecha a conexão com o banco
+        """
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.error(f"Erro ao fechar histórico: {e}")
@@ -0,0 +1,163 @@
+"""
+Módulo de Gráficos Inline
+Gera gráficos de barras em HTML/CSS ou SVG puro para o corpo do e-mail (sem matplotlib)
+"""
+
+import html
+import logging
+import pandas as pd
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Colunas de valor reconhecidas nos rankings, em ordem de prioridade
+COLUNAS_VALOR = ['Total Negadas', 'Total N2']
+
+
+def _extrair_serie(df_ranking: pd.DataFrame) -> Optional[Tuple[List[str], List[float], str]]:
+    """
+    Extrai rótulos e valores de um DataFrame de ranking
+
+    Args:
+        df_ranking: DataFrame com coluna 'Origem' e uma coluna de valores
+
+    Returns:
+        Tupla (origens, valores, nome da coluna) ou None se não houver dados
+    """
+    if df_ranking is None or len(df_ranking) == 0 or 'Origem' not in df_ranking.columns:
+        return None
+
+    coluna = next((c for c in COLUNAS_VALOR if c in df_ranking.columns), None)
+    if coluna is None:
+        numericas = [c for c in df_ranking.columns if c != 'Origem' and pd.api.types.is_numeric_dtype(df_ranking[c])]
+        if not numericas:
+            return None
+        coluna = numericas[0]
+
+    origens = [str(o) for o in df_ranking['Origem'].tolist()]
+    valores = [float(v) for v in df_ranking[coluna].tolist()]
+    return origens, valores, coluna
+
+
+def _formatar_numero(valor: float) -> str:
+    """
+    Formata o rótulo da barra (inteiro quando possível)
+
+    Args:
+        valor: Valor da barra
+
+    Returns:
+        Texto do rótulo
+    """
+    return f"{int(valor)}" if float(valor).is_integer() else f"{valor:.2f}"
+
+
+def gerar_barras_html(df_ranking: pd.DataFrame, cor: str = '#ffc107', largura_max_px: int = 400) -> str:
+    """
+    Gera gráfico de barras horizontais em tabela HTML com CSS inline
+
+    Usa apenas <table>/<td> com largura e bgcolor em pixels, o que renderiza no
+    Outlook (que não suporta SVG nem imagens inline de forma confiável).
+
+    Args:
+        df_ranking: DataFrame de ranking (Origem + Total Negadas/Total N2)
+        cor: Cor das barras
+        largura_max_px: Largura da maior barra em pixels
+
+    Returns:
+        HTML do gráfico (string vazia se não houver dados)
+    """
+    serie = _extrair_serie(df_ranking)
+    if serie is None:
+        return ""
+
+    origens, valores, _ = serie
+    maximo = max(valores) if valores and max(valores) > 0 else 1.0
+
+    linhas = []
+    for origem, valor in zip(origens, valores):
+        largura = max(1, int(round(valor / maximo * largura_max_px))) if valor > 0 else 0
+        barra = (f'<td width="{largura}" height="14" bgcolor="{cor}" style="background-color: {cor}; '
+                 f'border: 1px solid #333; padding: 0; font-size: 1px; line-height: 1px;">&nbsp;</td>'
+                 if largura > 0 else '')
+        linhas.append(
+            f'<tr>'
+            f'<td style="padding: 2px 8px; border: none; font-size: 12px; white-space: nowrap;">{html.escape(origem)}</td>'
+            f'<td style="padding: 2px 8px; border: none;">'
+            f'<table role="presentation" cellpadding="0" cellspacing="0" style="border-collapse: collapse; width: auto; margin: 0; box-shadow: none;"><tr>'
+            f'{barra}'
+            f'<td style="padding: 0 0 0 6px; border: none; font-size: 12px; white-space: nowrap;"><strong>{_formatar_numero(valor)}</strong></td>'
+            f'</tr></table></td>'
+            f'</tr>'
+        )
+
+    return ('<table style="border-collapse: collapse; width: auto; margin-bottom: 15px; box-shadow: none;">'
+            + ''.join(linhas) + '</table>')
+
+
+def gerar_barras_svg(df_ranking: pd.DataFrame, cor: str = '#ffc107', largura: int = 600,
+                     altura_barra: int = 18, largura_rotulo: int = 120) -> str:
+    """
+    Gera gráfico de barras horizontais em SVG inline
+
+    Indicado para clientes de e-mail com suporte a SVG (webmail, Apple Mail).
+
+    Args:
+        df_ranking: DataFrame de ranking (Origem + Total Negadas/Total N2)
+        cor: Cor das barras
+        largura: Largura total do SVG em pixels
+        altura_barra: Altura de cada barra em pixels
+        largura_rotulo: Espaço reservado para o nome da origem
+
+    Returns:
+        Markup SVG (string vazia se não houver dados)
+    """
+    serie = _extrair_serie(df_ranking)
+    if serie is None:
+        return ""
+
+    origens, valores, _ = serie
+    maximo = max(valores) if valores and max(valores) > 0 else 1.0
+    espaco = 4
+    area_barras = largura - largura_rotulo - 50
+    altura = len(origens) * (altura_barra + espaco) + espaco
+
+    elementos = []
+    for i, (origem, valor) in enumerate(zip(origens, valores)):
+        y = espaco + i * (altura_barra + espaco)
+        w = max(0.0, valor / maximo * area_barras)
+        texto_y = y + altura_barra * 0.75
+        elementos.append(
+            f'<text x="{largura_rotulo - 6}" y="{texto_y:.1f}" font-size="12" text-anchor="end">{html.escape(origem)}</text>'
+            f'<rect x="{largura_rotulo}" y="{y}" width="{w:.1f}" height="{altura_barra}" '
+            f'fill="{cor}" fill-opacity="0.8" stroke="#000" stroke-width="0.5"/>'
+            f'<text x="{largura_rotulo + w + 4:.1f}" y="{texto_y:.1f}" font-size="12" font-weight="bold">{_formatar_numero(valor)}</text>'
+        )
+
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{largura}" height="{altura}" '
+            f'viewBox="0 0 {largura} {altura}" font-family="Arial, sans-serif">'
+            + ''.join(elementos) + '</svg>')
+
+
+def gerar_grafico_inline(df_ranking: pd.DataFrame, cor: str = '#ffc107', formato: str = 'html') -> str:
+    """
+    Gera o gráfico inline no formato escolhido
+
+    Args:
+        df_ranking: DataFrame de ranking
+        cor: Cor das barras
+        formato: 'html' (tabela CSS, compatível com Outlook), 'svg' ou None (desativado)
+
+    Returns:
+        Markup do gráfico (string vazia se desativado ou sem dados)
+    """
+    try:
+        if formato == 'html':
+            return gerar_barras_html(df_ranking, cor)
+        if formato == 'svg':
+            return gerar_barras_svg(df_ranking, cor)
+        return ""
+    except Exception as e:
+        logger.error(f"Erro ao gerar gráfico inline: {e}")
+        return ""
@@ -0,0 +1,308 @@
+"""
+Módulo de Otimização de Thresholds
+Avalia uma grade de combinações (threshold de negadas x threshold de N2) por
+período do dia sobre as janelas do histórico, em um único cálculo vetorizado
+
+Uso:
+    python3 otimizador_thresholds.py [--dias 365] [--incidentes incidentes.csv]
+                                     [--negadas 5:25:0.5] [--n2 2:20:0.5] [--top 10] [--saida grade.csv]
+
+O CSV de incidentes conhecidos tem as colunas 'inicio' e 'fim' ('YYYY-MM-DD HH:MM').
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from historico_janelas import HistoricoJanelas
+
+logger = logging.getLogger(__name__)
+
+
+DURACAO_JANELA_H = 0.5
+
+# Elementos (janelas x combinações) por bloco: limita a memória do broadcast
+ELEMENTOS_POR_BLOCO = 8_000_000
+
+
+def grade(texto: str) -> np.ndarray:
+    """
+    Converte 'inicio:fim:passo' (fim inclusivo) em um array de thresholds
+
+    Args:
+        texto: Ex: '5:25:0.5'
+
+    Returns:
+        Array de thresholds
+    """
+    inicio, fim, passo = (float(v) for v in texto.split(':'))
+    return np.round(np.arange(inicio, fim + passo / 2, passo), 4)
+
+
+def rotular_incidentes(fins: np.ndarray, incidentes: Optional[pd.DataFrame]) -> np.ndarray:
+    """
+    Índice do incidente conhecido que cada janela intersecta (-1 = nenhum)
+
+    Args:
+        fins: Fim de cada janela (datetime64)
+        incidentes: DataFrame com 'inicio' e 'fim'
+
+    Returns:
+        Array de inteiros do tamanho de fins
+    """
+    rotulos = np.full(len(fins), -1, dtype=np.int64)
+    if incidentes is None or len(incidentes) == 0:
+        return rotulos
+
+    inicios_janela = fins - np.timedelta64(30, 'm')
+    inicio_inc = pd.to_datetime(incidentes['inicio']).to_numpy()
+    fim_inc = pd.to_datetime(incidentes['fim']).to_numpy()
+
+    # Janela (a, b] intersecta incidente [c, d] se a < d e b > c
+    intersecta = (inicios_janela[:, None] < fim_inc[None, :]) & (fins[:, None] > inicio_inc[None, :])
+    tem = intersecta.any(axis=1)
+    rotulos[tem] = intersecta[tem].argmax(axis=1)
+    return rotulos
+
+
+def avaliar_grade(negadas: np.ndarray, n2: np.ndarray, fins: np.ndarray, incidente: np.ndarray,
+                  th_negadas: np.ndarray, th_n2: np.ndarray, n_incidentes: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Avalia todas as combinações de thresholds de uma vez (janelas em blocos)
+
+    Uma janela alarma na combinação (i, j) se negadas >= th_negadas[i] ou
+    n2 >= th_n2[j] (mesma regra de RecargaAnalyzer). Um episódio é uma
+    sequência de janelas em alarme consecutivas (30 minutos de distância).
+
+    Args:
+        negadas: % de negadas por janela (ordenado por fim)
+        n2: % de N2 por janela
+        fins: Fim de cada janela (datetime64)
+        incidente: Índice do incidente de cada janela (-1 = fora de incidente)
+        th_negadas: Thresholds de negadas avaliados
+        th_n2: Thresholds de N2 avaliados
+        n_incidentes: Total de incidentes conhecidos no período
+
+    Returns:
+        Dict de matrizes (len(th_negadas) x len(th_n2)): janelas_alarme,
+        episodios, janelas_em_incidente, janelas_fora_incidente e incidentes_detectados
+    """
+    forma = (len(th_negadas), len(th_n2))
+    janelas_alarme = np.zeros(forma, dtype=np.int64)
+    episodios = np.zeros(forma, dtype=np.int64)
+    em_incidente = np.zeros(forma, dtype=np.int64)
+    detectados = np.zeros((max(n_incidentes, 1),) + forma, dtype=bool)
+
+    # Janela imediatamente anterior (30 min antes) existe? Sem ela, alarme conta como novo episódio
+    continua = np.zeros(len(fins), dtype=bool)
+    continua[1:] = (fins[1:] - fins[:-1]) == np.timedelta64(30, 'm')
+
+    bloco = max(1, ELEMENTOS_POR_BLOCO // max(1, forma[0] * forma[1]))
+    anterior = np.zeros(forma, dtype=bool)
+
+    for inicio in range(0, len(negadas), bloco):
+        fatia = slice(inicio, inicio + bloco)
+        alarme = (negadas[fatia, None, None] >= th_negadas[None, :, None]) | \
+                 (n2[fatia, None, None] >= th_n2[None, None, :])
+
+        janelas_alarme += alarme.sum(axis=0)
+
+        # Alarme na janela anterior contígua (a primeira do bloco usa o fim do bloco anterior)
+        previo = np.concatenate([anterior[None], alarme[:-1]], axis=0) & continua[fatia, None, None]
+        episodios += (alarme & ~previo).sum(axis=0)
+        anterior = alarme[-1]
+
+        rotulos = incidente[fatia]
+        dentro = rotulos >= 0
+        if dentro.any():
+            em_incidente += alarme[dentro].sum(axis=0)
+            np.logical_or.at(detectados, rotulos[dentro], alarme[dentro])
+
+    return {
+        'janelas_alarme': janelas_alarme,
+        'episodios': episodios,
+        'janelas_em_incidente': em_incidente,
+        'janelas_fora_incidente': janelas_alarme - em_incidente,
+        'incidentes_detectados': detectados[:n_incidentes].sum(axis=0),
+    }
+
+
+def tabela_grade(avaliacao: Dict[str, np.ndarray], th_negadas: np.ndarray, th_n2: np.ndarray,
+                 n_janelas: int, n_incidentes: int) -> pd.DataFrame:
+    """
+    Converte as matrizes de avaliar_grade() em uma tabela (uma linha por combinação)
+    """
+    ii, jj = np.meshgrid(np.arange(len(th_negadas)), np.arange(len(th_n2)), indexing='ij')
+    tabela = pd.DataFrame({
+        'threshold_negadas': th_negadas[ii.ravel()],
+        'threshold_n2': th_n2[jj.ravel()],
+        'janelas_alarme': avaliacao['janelas_alarme'].ravel(),
+        'episodios': avaliacao['episodios'].ravel(),
+        'horas_alarme': avaliacao['janelas_alarme'].ravel() * DURACAO_JANELA_H,
+        'horas_fora_incidente': avaliacao['janelas_fora_incidente'].ravel() * DURACAO_JANELA_H,
+    })
+    tabela['%_janelas_alarme'] = np.round(tabela['janelas_alarme'] * 100 / max(n_janelas, 1), 2)
+
+    if n_incidentes:
+        tabela['incidentes_detectados'] = avaliacao['incidentes_detectados'].ravel()
+        tabela['recall_incidentes'] = np.round(tabela['incidentes_detectados'] / n_incidentes, 3)
+    return tabela
+
+
+def recomendar(tabela: pd.DataFrame, recall_minimo: float = 1.0, taxa_alarme_max: float = 2.0) -> Optional[pd.Series]:
+    """
+    Escolhe a combinação recomendada
+
+    Com incidentes: a de menor tempo em alarme fora de incidentes entre as que
+    detectam pelo menos recall_minimo dos incidentes. Sem incidentes: a mais
+    sensível (menores thresholds) com no máximo taxa_alarme_max % das janelas em alarme.
+
+    Returns:
+        Linha da tabela, ou None se nenhuma combinação atende
+    """
+    if 'recall_incidentes' in tabela.columns:
+        candidatas = tabela[tabela['recall_incidentes'] >= recall_minimo]
+        ordem = ['horas_fora_incidente', 'episodios', 'threshold_negadas', 'threshold_n2']
+        crescente = [True, True, True, True]
+    else:
+        candidatas = tabela[tabela['%_janelas_alarme'] <= taxa_alarme_max]
+        ordem = ['threshold_negadas', 'threshold_n2']
+        crescente = [True, True]
+
+    if len(candidatas) == 0:
+        return None
+    return candidatas.sort_values(ordem, ascending=crescente).iloc[0]
+
+
+def otimizar(janelas: pd.DataFrame, th_negadas: np.ndarray, th_n2: np.ndarray,
+             incidentes: Optional[pd.DataFrame] = None) -> Dict[str, Tuple[pd.DataFrame, int]]:
+    """
+    Avalia a grade separadamente para cada período do dia
+
+    Args:
+        janelas: Retorno de HistoricoJanelas.carregar_janelas()
+        th_negadas: Thresholds de negadas
+        th_n2: Thresholds de N2
+        incidentes: Incidentes conhecidos ('inicio', 'fim')
+
+    Returns:
+        Dict período -> (tabela da grade, janelas do período)
+    """
+    fins_todos = pd.to_datetime(janelas['fim_janela'], format='%Y-%m-%d %H:%M').to_numpy()
+    rotulos = rotular_incidentes(fins_todos, incidentes)
+    n_incidentes = 0 if incidentes is None else len(incidentes)
+
+    resultados = {}
+    for periodo in sorted(janelas['periodo_dia'].dropna().unique()):
+        mascara = (janelas['periodo_dia'] == periodo).to_numpy()
+        ordem = np.argsort(fins_todos[mascara], kind='stable')
+        fins = fins_todos[mascara][ordem]
+        negadas = janelas['percentual_negadas'].to_numpy(dtype=float)[mascara][ordem]
+        n2 = janelas['percentual_n2'].to_numpy(dtype=float)[mascara][ordem]
+        incidente = rotulos[mascara][ordem]
+
+        # Recall por período: só os incidentes que tocam janelas do período
+        presentes = np.unique(incidente[incidente >= 0])
+        remapeado = np.full(max(n_incidentes, 1), -1, dtype=np.int64)
+        remapeado[presentes] = np.arange(len(presentes))
+        incidente = np.where(incidente >= 0, remapeado[np.maximum(incidente, 0)], -1)
+
+        avaliacao = avaliar_grade(negadas, n2, fins, incidente, th_negadas, th_n2, len(presentes))
+        resultados[periodo] = (tabela_grade(avaliacao, th_negadas, th_n2, len(fins), len(presentes)), len(fins))
+
+    return resultados
+
+
+def _formatar(linha: pd.Series) -> str:
+    """
+    Resumo de uma combinação em uma linha
+    """
+    texto = (f"negadas >= {linha['threshold_negadas']:g}% | N2 >= {linha['threshold_n2']:g}% -> "
+             f"{int(linha['janelas_alarme'])} janelas ({linha['horas_alarme']:g} h), {int(linha['episodios'])} episódios")
+    if 'recall_incidentes' in linha.index:
+        texto += (f", {int(linha['incidentes_detectados'])} incidentes detectados "
+                  f"(recall {linha['recall_incidentes']:.0%}), {linha['horas_fora_incidente']:g} h fora de incidentes")
+    return texto
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI do otimizador
+    """
+    parser = argparse.ArgumentParser(description="Varredura de thresholds por período sobre o histórico de janelas")
+    parser.add_argument('--dias', type=int, default=365, help="Dias de histórico (padrão: 365)")
+    parser.add_argument('--negadas', type=grade, default=grade('5:25:0.5'), help="Grade de negadas 'ini:fim:passo'")
+    parser.add_argument('--n2', type=grade, default=grade('2:20:0.5'), help="Grade de N2 'ini:fim:passo'")
+    parser.add_argument('--incidentes', default=None, help="CSV de incidentes conhecidos (inicio, fim)")
+    parser.add_argument('--recall-minimo', type=float, default=1.0, help="Fração mínima de incidentes detectados")
+    parser.add_argument('--taxa-alarme-max', type=float, default=2.0,
+                        help="Sem incidentes: %% máximo de janelas em alarme (padrão: 2)")
+    parser.add_argument('--top', type=int, default=10, help="Combinações listadas por período")
+    parser.add_argument('--saida', default=None, help="CSV com a grade completa de todos os períodos")
+    parser.add_argument('--db', default=None, help="Banco do histórico (padrão: HISTORICO_DB_PATH)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    import config
+    db_path = args.db or getattr(config, 'HISTORICO_DB_PATH',
+                                 os.path.join(config.BASE_DIR, "historico", "historico_janelas.db"))
+    atuais = getattr(config, 'THRESHOLDS_POR_PERIODO', {})
+
+    historico = HistoricoJanelas(db_path)
+    try:
+        janelas = historico.carregar_janelas(inicio=datetime.now() - timedelta(days=args.dias))
+    finally:
+        historico.fechar()
+
+    if len(janelas) == 0:
+        print("Nenhuma janela no histórico para o período", file=sys.stderr)
+        return 1
+
+    incidentes = pd.read_csv(args.incidentes) if args.incidentes else None
+
+    inicio = time.perf_counter()
+    resultados = otimizar(janelas, args.negadas, args.n2, incidentes)
+    duracao = time.perf_counter() - inicio
+    combinacoes = len(args.negadas) * len(args.n2)
+    print(f"{len(janelas)} janelas x {combinacoes} combinações por período avaliadas em {duracao:.2f}s\n")
+
+    grades = []
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        for periodo, (tabela, n_janelas) in resultados.items():
+            print(f"=== {periodo} ({n_janelas} janelas) ===")
+
+            atual = atuais.get(periodo)
+            if atual:
+                linha = tabela[np.isclose(tabela['threshold_negadas'], atual['threshold_negadas'])
+                               & np.isclose(tabela['threshold_n2'], atual['threshold_n2'])]
+                if len(linha):
+                    print("Atual:       " + _formatar(linha.iloc[0]))
+
+            escolhida = recomendar(tabela, args.recall_minimo, args.taxa_alarme_max)
+            print("Recomendada: " + (_formatar(escolhida) if escolhida is not None else "nenhuma atende ao critério"))
+
+            # Períodos sem incidente no CSV não têm recall: ordena pela taxa de alarmes
+            if 'recall_incidentes' in tabela.columns:
+                colunas_ordem, crescente = ['recall_incidentes', 'horas_fora_incidente'], [False, True]
+            else:
+                colunas_ordem, crescente = ['%_janelas_alarme'], [True]
+            print(tabela.sort_values(colunas_ordem, ascending=crescente).head(args.top).to_string(index=False))
+            print()
+            grades.append(tabela.assign(periodo=periodo))
+
+    if args.saida:
+        pd.concat(grades, ignore_index=True).to_csv(args.saida, index=False)
+        print(f"Grade completa salva em {args.saida}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Módulo de Política de Espera do Portal
+Timeouts das esperas por condição do GWCelWeb calibrados pela latência
+registrada na telemetria do portal (percentil x margem, limitado), no lugar
+das pausas fixas: a execução segue assim que a condição é atendida e tolera
+períodos de lentidão sem falhar.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+from telemetria_portal import ETAPAS_PORTAL, TelemetriaPortal
+
+logger = logging.getLogger(__name__)
+
+
+# Timeouts usados enquanto a etapa não tem amostras suficientes (segundos).
+# 'interacao' cobre as esperas curtas do formulário (campo clicável, valor aplicado).
+TIMEOUTS_PADRAO = {
+    'login': 10,
+    'menu': 10,
+    'transacoes': 10,
+    'pesquisa': 60,
+    'download': 60,
+    'interacao': 5,
+}
+
+
+class PoliticaEspera:
+    """
+    Timeout por etapa do portal = percentil da latência registrada x margem
+
+    O timeout calibrado fica entre minimo_s e maximo_s e é o limite da espera.
+    Se a condição não é atendida nele, a espera de uma etapa do portal ganha
+    uma única extensão de extensao_s (tolera um pico pouco acima do percentil;
+    a latência real entra na telemetria e recalibra as próximas execuções).
+    """
+
+    def __init__(self, margem: float = 1.5, percentil: float = 99, minimo_s: float = 5.0,
+                 maximo_s: float = 120.0, min_amostras: int = 20, extensao_s: float = 10.0,
+                 intervalo_s: float = 0.25):
+        """
+        Inicializa a política com os timeouts padrão
+
+        Args:
+            margem: Multiplicador do percentil
+            percentil: Percentil da latência usado como base (0-100)
+            minimo_s: Timeout mínimo de uma etapa do portal
+            maximo_s: Timeout calibrado máximo
+            min_amostras: Amostras da etapa para substituir o timeout padrão
+            extensao_s: Extensão única após o timeout de uma etapa do portal (0 = sem extensão)
+            intervalo_s: Intervalo entre as verificações da condição
+        """
+        self.margem = margem
+        self.percentil = percentil
+        self.minimo_s = minimo_s
+        self.maximo_s = maximo_s
+        self.min_amostras = min_amostras
+        self.extensao_s = extensao_s
+        self.intervalo_s = intervalo_s
+        self.timeouts: Dict[str, float] = dict(TIMEOUTS_PADRAO)
+        self.calibradas: Dict[str, int] = {}
+
+    def calibrar(self, historico: pd.DataFrame):
+        """
+        Recalcula os timeouts das etapas a partir das medições do portal
+
+        Args:
+            historico: Retorno de TelemetriaPortal.carregar() (colunas <etapa>_s)
+        """
+        for etapa in ETAPAS_PORTAL:
+            coluna = f"{etapa}_s"
+            if coluna not in historico.columns:
+                continue
+            valores = historico[coluna].dropna().to_numpy(dtype=float)
+            if len(valores) < self.min_amostras:
+                continue
+            base = float(np.percentile(valores, self.percentil))
+            self.timeouts[etapa] = min(max(base * self.margem, self.minimo_s), self.maximo_s)
+            self.calibradas[etapa] = len(valores)
+
+    def calibrar_banco(self, db_path: str, amostras: int = 336):
+        """
+        Calibra com as últimas execuções gravadas no banco do histórico
+
+        Args:
+            db_path: Banco SQLite da telemetria do portal
+            amostras: Execuções consideradas
+        """
+        telemetria = TelemetriaPortal(db_path)
+        try:
+            self.calibrar(telemetria.carregar(limite=amostras))
+        finally:
+            telemetria.fechar()
+
+    def timeout(self, etapa: str) -> float:
+        """
+        Timeout atual da etapa (padrão de 'interacao' para etapas desconhecidas)
+        """
+        return self.timeouts.get(etapa, TIMEOUTS_PADRAO['interacao'])
+
+    def aguardar(self, driver, etapa: str, condicao: Callable):
+        """
+        Aguarda a condição com o timeout da etapa (mais uma extensão de extensao_s nas etapas do portal)
+
+        Args:
+            driver: WebDriver
+            etapa: Etapa de ETAPAS_PORTAL ou 'interacao'
+            condicao: Condição do WebDriverWait (ex: EC.presence_of_element_located(...))
+
+        Returns:
+            Retorno da condição
+
+        Raises:
+            TimeoutException: Condição não atendida nem após a extensão
+        """
+        timeout = self.timeout(etapa)
+        try:
+            return WebDriverWait(driver, timeout, poll_frequency=self.intervalo_s).until(condicao)
+        except TimeoutException:
+            if etapa not in ETAPAS_PORTAL or self.extensao_s <= 0:
+                raise
+            logger.warning(f"Portal lento: {etapa} acima de {timeout:.0f}s, aguardando mais {self.extensao_s:.0f}s")
+            return WebDriverWait(driver, self.extensao_s, poll_frequency=self.intervalo_s).until(condicao)
+
+    def resumo(self) -> str:
+        """
+        Timeouts por etapa para o log (ex: "login 6s (p99), pesquisa 60s (padrão)")
+        """
+        return ', '.join(
+            f"{etapa} {self.timeouts[etapa]:.0f}s ({'p' + format(self.percentil, 'g') if etapa in self.calibradas else 'padrão'})"
+            for etapa in ETAPAS_PORTAL
+        )
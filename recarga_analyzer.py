@@ -9,6 +9,8 @@ import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 
+from cubo_recargas import CuboRecargas, estados_negados
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,11 +21,13 @@ class RecargaAnalyzer:
     Níveis de Alarme:
     - Alerta: ≥10% de recargas negadas (qualquer tipo)
     - Crítico: ≥10% de recargas com código N2 (erro no servidor)
+    - Alerta (opcional): percentual do VALOR (R$) negado ≥ threshold_valor_negadas
 
     Análise feita em janelas de 30 minutos
     """
 
-    def __init__(self, threshold_negadas: float = 10.0, threshold_n2: float = 10.0, periodo_texto: str = None):
+    def __init__(self, threshold_negadas: float = 10.0, threshold_n2: float = 10.0, periodo_texto: str = None,
+                 threshold_valor_negadas: Optional[float] = None, bucket_minutos: int = 5):
         """
         Inicializa o analisador
 
@@ -31,25 +35,31 @@ class RecargaAnalyzer:
             threshold_negadas: Percentual mínimo de negadas para Alerta (padrão: 10%)
             threshold_n2: Percentual mínimo de N2 para Crítico (padrão: 10%)
             periodo_texto: Texto descritivo do período analisado
+            threshold_valor_negadas: Percentual mínimo do VALOR (R$) negado para Alerta
+                                     (None = dimensão desativada)
+            bucket_minutos: Tamanho do bucket de tempo para agregações de valor
         """
         self.threshold_negadas = threshold_negadas
         self.threshold_n2 = threshold_n2
+        self.threshold_valor_negadas = threshold_valor_negadas
+        self.bucket_minutos = bucket_minutos
         self.periodo_texto = periodo_texto or "Período não especificado"
         self.df = None
         self.resultado_analise = {}
 
-    def carregar_arquivo(self, caminho_arquivo: str) -> bool:
+    def carregar_arquivo(self, caminho_arquivo) -> bool:
         """
         Carrega arquivo Excel de transações
 
         Args:
-            caminho_arquivo: Caminho completo do arquivo
+            caminho_arquivo: Caminho completo do arquivo, ou objeto binário já aberto
+                             (ex: BytesIO de GerenciadorRetencao.abrir_arquivado)
 
         Returns:
             True se carregou com sucesso, False caso contrário
         """
         try:
-            if not os.path.exists(caminho_arquivo):
+            if isinstance(caminho_arquivo, (str, os.PathLike)) and not os.path.exists(caminho_arquivo):
                 logger.error(f"Arquivo não encontrado: {caminho_arquivo}")
                 return False
 
@@ -112,8 +122,12 @@ class RecargaAnalyzer:
             # Análise de estados
             estado_counts = self.df['Estado Transação'].value_counts()
 
+            # Impacto financeiro (Valor) - agregações por origem, código e bucket de tempo
+            impacto = self._calcular_impacto_financeiro(negadas_mask, n2_mask)
+
             # Determinar nível de alarme
-            nivel_alarme = self._determinar_nivel_alarme(perc_negadas, perc_n2)
+            nivel_alarme = self._determinar_nivel_alarme(perc_negadas, perc_n2,
+                                                         impacto['percentual_valor_negado'])
 
             # Montar resultado
             self.resultado_analise = {
@@ -131,10 +145,12 @@ class RecargaAnalyzer:
                 'df_negadas': negadas,
                 'df_n2': n2_transacoes
             }
+            self.resultado_analise.update(impacto)
 
             logger.info(f"Análise concluída: {total} transações, "
                        f"{perc_negadas:.2f}% negadas, "
                        f"{perc_n2:.2f}% N2, "
+                       f"R$ {impacto['valor_negado']:.2f} negados, "
                        f"Alarme: {nivel_alarme}")
 
             return self.resultado_analise
@@ -143,13 +159,162 @@ class RecargaAnalyzer:
             logger.error(f"Erro durante análise: {e}")
             return {}
 
-    def _determinar_nivel_alarme(self, perc_negadas: float, perc_n2: float) -> str:
+    def _calcular_impacto_financeiro(self, negadas_mask: pd.Series, n2_mask: pd.Series) -> Dict:
+        """
+        Calcula o impacto financeiro (coluna Valor) das recargas negadas
+
+        Monta um único frame base com as flags de negada/N2 e o valor numérico,
+        e agrega totais, médias e percentis por Origem, por Cod Resp e por
+        bucket de tempo a partir dele (sem novos filtros sobre self.df), além
+        do cruzamento Origem x Cod Resp usado no roteamento de alertas e do
+        cubo Origem x Cod Resp x Estado x bucket usado nos rankings.
+
+        Args:
+            negadas_mask: Máscara booleana das transações negadas
+            n2_mask: Máscara booleana das transações com código N2
+
+        Returns:
+            Dicionário com totais de valor e DataFrames agregados
+        """
+        valores = self.converter_valor(self.df['Valor'])
+
+        base = pd.DataFrame({
+            'Origem': self.df['Origem'],
+            'Cod Resp': self.df['Cod Resp'].astype(str),
+            'negada': negadas_mask.astype(int),
+            'n2': n2_mask.astype(int),
+            'valor': valores,
+            'valor_negado': valores.where(negadas_mask, 0.0),
+        })
+
+        if 'Data/Hora Origem' in self.df.columns and pd.api.types.is_datetime64_any_dtype(self.df['Data/Hora Origem']):
+            base['bucket'] = self.df['Data/Hora Origem'].dt.floor(f"{self.bucket_minutos}min")
+        else:
+            base['bucket'] = pd.NaT
+
+        valor_total = float(base['valor'].sum())
+        valor_negado = float(base['valor_negado'].sum())
+        valores_negados = base.loc[negadas_mask.values, 'valor']
+
+        if len(valores_negados) > 0:
+            p50, p90, p95 = (float(v) for v in valores_negados.quantile([0.5, 0.9, 0.95]).values)
+            medio = float(valores_negados.mean())
+        else:
+            p50 = p90 = p95 = medio = 0.0
+
+        perc_valor = (valor_negado / valor_total) * 100 if valor_total > 0 else 0.0
+
+        return {
+            'valor_total': round(valor_total, 2),
+            'valor_negado': round(valor_negado, 2),
+            'percentual_valor_negado': round(perc_valor, 2),
+            'valor_negado_medio': round(medio, 2),
+            'valor_negado_p50': round(p50, 2),
+            'valor_negado_p90': round(p90, 2),
+            'valor_negado_p95': round(p95, 2),
+            'agregado_origem': self._agregar_valor(base, 'Origem'),
+            'agregado_codigo': self._agregar_valor(base, 'Cod Resp'),
+            'agregado_bucket': self._agregar_valor(base.dropna(subset=['bucket']), 'bucket'),
+            'cubo': CuboRecargas.construir(base['Origem'], base['Cod Resp'], self.df['Estado Transação'],
+                                           base['bucket'], base['valor']),
+            'agregado_origem_codigo': base.groupby(['Origem', 'Cod Resp'], sort=False).agg(
+                total=('negada', 'size'),
+                negadas=('negada', 'sum'),
+                n2=('n2', 'sum'),
+                valor_total=('valor', 'sum'),
+                valor_negado=('valor_negado', 'sum'),
+            ).reset_index(),
+        }
+
+    @staticmethod
+    def _agregar_valor(base: pd.DataFrame, chave: str) -> pd.DataFrame:
+        """
+        Agrega contagens e valores do frame base por uma dimensão
+
+        Args:
+            base: Frame base montado em _calcular_impacto_financeiro
+            chave: Coluna de agrupamento ('Origem', 'Cod Resp' ou 'bucket')
+
+        Returns:
+            DataFrame com total, negadas, n2, valores e percentis por chave
+        """
+        colunas = ['total', 'negadas', 'n2', 'valor_total', 'valor_negado',
+                   'valor_negado_medio', 'valor_negado_p50', 'valor_negado_p90', 'valor_negado_p95']
+        if len(base) == 0:
+            return pd.DataFrame(columns=[chave] + colunas)
+
+        agregado = base.groupby(chave, sort=False).agg(
+            total=('negada', 'size'),
+            negadas=('negada', 'sum'),
+            n2=('n2', 'sum'),
+            valor_total=('valor', 'sum'),
+            valor_negado=('valor_negado', 'sum'),
+        )
+        agregado['valor_negado_medio'] = (agregado['valor_negado'] / agregado['negadas'].where(agregado['negadas'] > 0)).fillna(0.0)
+
+        negadas = base[base['negada'] == 1]
+        if len(negadas) > 0:
+            quantis = negadas.groupby(chave, sort=False)['valor'].quantile([0.5, 0.9, 0.95]).unstack()
+            quantis.columns = ['valor_negado_p50', 'valor_negado_p90', 'valor_negado_p95']
+            agregado = agregado.join(quantis)
+        else:
+            agregado[['valor_negado_p50', 'valor_negado_p90', 'valor_negado_p95']] = 0.0
+
+        agregado = agregado.fillna(0.0)
+        agregado[colunas] = agregado[colunas].round(2)
+
+        # Buckets de tempo em ordem cronológica, demais dimensões por valor negado
+        if chave == 'bucket':
+            agregado = agregado.sort_index()
+        else:
+            agregado = agregado.sort_values('valor_negado', ascending=False)
+
+        return agregado.reset_index()[[chave] + colunas]
+
+    @staticmethod
+    def converter_valor(serie: pd.Series) -> pd.Series:
+        """
+        Converte a coluna Valor para float (aceita número ou texto "R$ 1.234,56")
+
+        Args:
+            serie: Coluna Valor original
+
+        Returns:
+            Série float (valores inválidos viram 0.0)
+        """
+        if pd.api.types.is_numeric_dtype(serie):
+            return serie.astype(float).fillna(0.0)
+
+        texto = serie.astype(str).str.replace('R$', '', regex=False).str.strip()
+        formato_br = texto.str.contains(',', regex=False)
+        texto = texto.where(~formato_br,
+                            texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+        return pd.to_numeric(texto, errors='coerce').fillna(0.0)
+
+    @staticmethod
+    def _formatar_reais(valor: float) -> str:
+        """
+        Formata valor em reais no padrão brasileiro (R$ 1.234,56)
+
+        Args:
+            valor: Valor numérico
+
+        Returns:
+            Texto formatado
+        """
+        texto = f"{valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+        return f"R$ {texto}"
+
+    def _determinar_nivel_alarme(self, perc_negadas: float, perc_n2: float,
+                                 perc_valor_negado: Optional[float] = None) -> str:
         """
         Determina o nível de alarme baseado nos percentuais
 
         Args:
             perc_negadas: Percentual de transações negadas
             perc_n2: Percentual de transações com código N2
+            perc_valor_negado: Percentual do valor (R$) negado (usado apenas se
+                               threshold_valor_negadas estiver configurado)
 
         Returns:
             'Crítico', 'Alerta' ou 'Normal'
@@ -162,6 +327,11 @@ class RecargaAnalyzer:
         if perc_negadas >= self.threshold_negadas:
             return 'Alerta'
 
+        # Alerta ponderado por valor (opcional)
+        if (self.threshold_valor_negadas is not None and perc_valor_negado is not None
+                and perc_valor_negado >= self.threshold_valor_negadas):
+            return 'Alerta'
+
         return 'Normal'
 
     def gerar_tabela_resumo(self) -> pd.DataFrame:
@@ -191,6 +361,11 @@ class RecargaAnalyzer:
                 'Métrica': 'Recargas com Erro N2 (Servidor)',
                 'Valor': f"{self.resultado_analise['transacoes_n2']} ({self.resultado_analise['percentual_n2']:.2f}%)"
             },
+            {
+                'Métrica': 'Valor Negado (R$)',
+                'Valor': f"{self._formatar_reais(self.resultado_analise.get('valor_negado', 0.0))} "
+                         f"({self.resultado_analise.get('percentual_valor_negado', 0.0):.2f}% do valor)"
+            },
             {
                 'Métrica': 'Nível de Alarme',
                 'Valor': self.resultado_analise['nivel_alarme']
@@ -199,6 +374,36 @@ class RecargaAnalyzer:
 
         return resumo
 
+    def gerar_tabela_impacto_financeiro(self, top_n: int = 10) -> pd.DataFrame:
+        """
+        Gera ranking de origens por valor (R$) negado
+
+        Args:
+            top_n: Quantidade de origens a mostrar
+
+        Returns:
+            DataFrame com valor negado, médio e percentis por origem
+        """
+        if not self.resultado_analise or self.resultado_analise.get('agregado_origem') is None:
+            return pd.DataFrame()
+
+        agregado = self.resultado_analise['agregado_origem']
+        agregado = agregado[agregado['negadas'] > 0].head(top_n)
+
+        if len(agregado) == 0:
+            return pd.DataFrame()
+
+        tabela = pd.DataFrame({
+            'Origem': agregado['Origem'].values,
+            'Negadas': agregado['negadas'].astype(int).values,
+            'Valor Negado': [self._formatar_reais(v) for v in agregado['valor_negado']],
+            'Valor Médio': [self._formatar_reais(v) for v in agregado['valor_negado_medio']],
+            'P90': [self._formatar_reais(v) for v in agregado['valor_negado_p90']],
+        })
+        tabela.index = tabela.index + 1  # Começar do 1
+
+        return tabela
+
     def gerar_tabela_codigos(self, top_n: int = 10) -> pd.DataFrame:
         """
         Gera tabela com distribuição de códigos de resposta
@@ -257,35 +462,33 @@ class RecargaAnalyzer:
 
         return df_resultado
 
-    def gerar_ranking_negadas(self, top_n: int = 10) -> pd.DataFrame:
+    def _ranking_cubo(self, coluna: str, top_n: int, **filtros) -> pd.DataFrame:
         """
-        Gera ranking de origens com mais RECARGAS NEGADAS (todas)
+        Ranking de origens por quantidade de transações em uma fatia do cubo da janela
 
         Args:
+            coluna: Nome da coluna de contagem no ranking
             top_n: Quantidade de origens a mostrar
+            **filtros: Filtros de CuboRecargas.fatiar()
 
         Returns:
-            DataFrame com ranking de todas as recargas negadas
+            DataFrame com Origem e a contagem, numerado a partir de 1
         """
-        if not self.resultado_analise or self.resultado_analise.get('df_negadas') is None:
+        cubo = self.resultado_analise.get('cubo') if self.resultado_analise else None
+        if cubo is None:
             return pd.DataFrame()
 
-        df_negadas = self.resultado_analise['df_negadas']
-
-        if len(df_negadas) == 0:
+        por_origem = cubo.fatiar(**filtros).agregar(['origem'])
+        if len(por_origem) == 0:
             return pd.DataFrame()
 
-        # Contar total de negadas por origem
-        negadas_por_origem = df_negadas['Origem'].value_counts()
-
-        # Criar DataFrame de ranking
         ranking = pd.DataFrame({
-            'Origem': negadas_por_origem.index,
-            'Total Negadas': negadas_por_origem.values
+            'Origem': por_origem['origem'].values,
+            coluna: por_origem['quantidade'].values
         })
 
-        # Ordenar por total negadas
-        ranking = ranking.sort_values('Total Negadas', ascending=False).head(top_n)
+        # Ordenar pela contagem
+        ranking = ranking.sort_values(coluna, ascending=False).head(top_n)
 
         # Resetar índice
         ranking = ranking.reset_index(drop=True)
@@ -293,44 +496,30 @@ class RecargaAnalyzer:
 
         return ranking
 
-    def gerar_ranking_n2(self, top_n: int = 10) -> pd.DataFrame:
+    def gerar_ranking_negadas(self, top_n: int = 10) -> pd.DataFrame:
         """
-        Gera ranking de origens com mais erros N2 (Erro Servidor)
-        Filtra DIRETAMENTE do DataFrame original pela coluna 'Cod Resp'
+        Gera ranking de origens com mais RECARGAS NEGADAS (todas)
 
         Args:
             top_n: Quantidade de origens a mostrar
 
         Returns:
-            DataFrame com ranking específico de N2
+            DataFrame com ranking de todas as recargas negadas
         """
-        if self.df is None or len(self.df) == 0:
-            return pd.DataFrame()
-
-        # Filtrar N2 diretamente do DataFrame original (não do df_negadas)
-        # Isso evita qualquer possível duplicação ou inconsistência
-        df_n2 = self.df[self.df['Cod Resp'].astype(str) == 'N2']
-
-        if len(df_n2) == 0:
-            return pd.DataFrame()
+        return self._ranking_cubo('Total Negadas', top_n, estado=estados_negados)
 
-        # Contar N2 por origem
-        n2_por_origem = df_n2['Origem'].value_counts()
-
-        # Criar DataFrame de ranking
-        ranking = pd.DataFrame({
-            'Origem': n2_por_origem.index,
-            'Total N2': n2_por_origem.values
-        })
-
-        # Ordenar por total N2
-        ranking = ranking.sort_values('Total N2', ascending=False).head(top_n)
+    def gerar_ranking_n2(self, top_n: int = 10) -> pd.DataFrame:
+        """
+        Gera ranking de origens com mais erros N2 (Erro Servidor)
+        Filtra pelo código 'Cod Resp' (não pelo estado), como em analisar()
 
-        # Resetar índice
-        ranking = ranking.reset_index(drop=True)
-        ranking.index = ranking.index + 1  # Começar do 1
+        Args:
+            top_n: Quantidade de origens a mostrar
 
-        return ranking
+        Returns:
+            DataFrame com ranking específico de N2
+        """
+        return self._ranking_cubo('Total N2', top_n, cod_resp='N2')
 
     def gerar_tabela_hora_a_hora(self) -> pd.DataFrame:
         """
@@ -339,23 +528,28 @@ class RecargaAnalyzer:
         Returns:
             DataFrame com estatísticas por hora
         """
-        if self.df is None or len(self.df) == 0:
+        cubo = self.resultado_analise.get('cubo') if self.resultado_analise else None
+        if cubo is None:
             return pd.DataFrame()
 
         try:
-            # Criar coluna de hora
-            df_copy = self.df.copy()
-            df_copy['hora_hh'] = df_copy['Data/Hora Origem'].dt.strftime('%H')
+            # Hora x Estado direto do cubo (buckets consolidados por hora; como a contagem
+            # de 'Origem' do pivot original, transações sem origem ficam de fora)
+            por_hora = cubo.reagrupar_tempo(60).fatiar(origem=lambda o: o.notna()).agregar(['bucket', 'estado'])
+            if len(por_hora) == 0:
+                return pd.DataFrame()
+            por_hora['hora_hh'] = pd.DatetimeIndex(por_hora['bucket']).strftime('%H')
 
             # Criar pivot table
             tabela_hora = pd.pivot_table(
-                df_copy,
+                por_hora,
                 index='hora_hh',
-                columns='Estado Transação',
-                values='Origem',
-                aggfunc='count',
+                columns='estado',
+                values='quantidade',
+                aggfunc='sum',
                 fill_value=0
             )
+            tabela_hora.columns.name = 'Estado Transação'
 
             # Adicionar total geral
             tabela_hora['Total Geral'] = tabela_hora.sum(axis=1)
@@ -444,6 +638,12 @@ class RecargaAnalyzer:
             return (f"🚨 CRÍTICO: {perc_n2:.2f}% das recargas estão com erro N2 (Problema no Servidor). "
                    f"Threshold: {self.threshold_n2}%. Ação imediata necessária!")
 
+        elif nivel == 'Alerta' and perc_negadas < self.threshold_negadas:
+            perc_valor = self.resultado_analise.get('percentual_valor_negado', 0)
+            valor = self._formatar_reais(self.resultado_analise.get('valor_negado', 0.0))
+            return (f"⚠️ ALERTA: {perc_valor:.2f}% do valor das recargas foi negado ({valor}). "
+                   f"Threshold: {self.threshold_valor_negadas}%. Necessário entender o problema.")
+
         elif nivel == 'Alerta':
             return (f"⚠️ ALERTA: {perc_negadas:.2f}% das recargas foram negadas. "
                    f"Threshold: {self.threshold_negadas}%. Necessário entender o problema.")
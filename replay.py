@@ -0,0 +1,514 @@
+"""
+Módulo de Replay Histórico
+Reprocessa exports antigos (Transacao*.xlsx, do diretório quente e/ou dos zips
+da retenção) em ordem cronológica pela análise, pela máquina de estados e pelo
+envio de e-mails, contra um servidor SMTP local, e compara as decisões de
+alarme com as de uma execução de referência
+
+Uso:
+    python3 replay.py --saida decisoes.csv [--dir Recargas] [--arquivados] [--de "YYYY-MM-DD HH:MM"]
+                      [--ate "YYYY-MM-DD HH:MM"] [--workers 4] [--relatorio-completo] [--baseline base.csv]
+"""
+
+import os
+import sys
+import glob
+import logging
+import argparse
+import tempfile
+import threading
+import socketserver
+import pandas as pd
+from datetime import datetime, timedelta
+from email import policy
+from email.parser import BytesHeaderParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from recarga_analyzer import RecargaAnalyzer
+from estado_alarme import MaquinaEstadoAlarme
+from email_sender import EmailSender
+from retencao import GerenciadorRetencao
+from roteamento_alertas import particionar_por_rotas, EstadoRotas
+
+logger = logging.getLogger(__name__)
+
+
+# Colunas comparadas com a execução de referência
+COLUNAS_DECISAO = ['nivel_alarme', 'estado', 'emails']
+
+# Thresholds por período quando config.get_thresholds_atuais não aceita o momento (config.py antigo)
+FAIXAS_PERIODO = [(6, 12, 'manha'), (12, 18, 'tarde'), (18, 24, 'noite'), (0, 6, 'madrugada')]
+
+
+# ===== SMTP LOCAL =====
+
+class _SessaoSmtp(socketserver.StreamRequestHandler):
+    """
+    Sessão SMTP mínima: aceita tudo e guarda os cabeçalhos de cada mensagem
+    """
+
+    def _responder(self, texto: str):
+        self.wfile.write((texto + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self._responder('220 replay ESMTP')
+        destinatarios = []
+        dados = None
+
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+
+            if dados is not None:
+                if linha in (b'.\r\n', b'.\n'):
+                    cabecalhos = BytesHeaderParser(policy=policy.default).parsebytes(b''.join(dados))
+                    self.server.registrar(cabecalhos, destinatarios)
+                    dados, destinatarios = None, []
+                    self._responder('250 OK')
+                else:
+                    dados.append(linha[1:] if linha.startswith(b'..') else linha)
+                continue
+
+            comando = linha.decode('utf-8', errors='replace').strip()
+            verbo = comando[:4].upper()
+            if verbo == 'EHLO':
+                self._responder('250-replay')
+                self._responder('250 8BITMIME')
+            elif verbo == 'RCPT':
+                destinatarios.append(comando.split(':', 1)[-1].strip(' <>'))
+                self._responder('250 OK')
+            elif verbo == 'DATA':
+                dados = []
+                self._responder('354 Fim com <CRLF>.<CRLF>')
+            elif verbo == 'QUIT':
+                self._responder('221 Bye')
+                return
+            else:
+                self._responder('250 OK')
+
+
+class ServidorSmtpLocal(socketserver.ThreadingTCPServer):
+    """
+    Servidor SMTP local (127.0.0.1, porta livre) que captura as mensagens do replay
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, porta: int = 0):
+        """
+        Args:
+            porta: Porta local (0 = escolhida pelo sistema)
+        """
+        super().__init__(('127.0.0.1', porta), _SessaoSmtp)
+        self.porta = self.server_address[1]
+        self.mensagens: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def registrar(self, cabecalhos, destinatarios: List[str]):
+        """
+        Guarda assunto e destinatários de uma mensagem recebida
+        """
+        with self._lock:
+            self.mensagens.append({
+                'assunto': str(cabecalhos.get('Subject', '')),
+                'destinatarios': list(destinatarios),
+                'em_resposta_a': cabecalhos.get('In-Reply-To'),
+            })
+
+    def iniciar(self) -> 'ServidorSmtpLocal':
+        """
+        Atende em uma thread em segundo plano
+        """
+        threading.Thread(target=self.serve_forever, name="smtp-replay", daemon=True).start()
+        logger.info(f"SMTP local do replay em 127.0.0.1:{self.porta}")
+        return self
+
+    def parar(self):
+        """
+        Encerra o servidor
+        """
+        self.shutdown()
+        self.server_close()
+
+
+# ===== THRESHOLDS =====
+
+def resolver_thresholds(momento: datetime) -> Dict:
+    """
+    Thresholds que get_thresholds_atuais teria retornado no fim da janela
+
+    Args:
+        momento: Fim da janela
+
+    Returns:
+        Dict no formato de config.get_thresholds_atuais()
+    """
+    import config
+
+    try:
+        return config.get_thresholds_atuais(momento)
+    except TypeError:
+        # config.py anterior ao replay: mesma regra, aplicada à hora do momento
+        periodo = next(nome for inicio, fim, nome in FAIXAS_PERIODO if inicio <= momento.hour < fim)
+        padrao = {
+            'threshold_negadas': config.THRESHOLD_WARNING_NEGADAS,
+            'threshold_n2': config.THRESHOLD_ALERT_N2,
+        }
+        thresholds = getattr(config, 'THRESHOLDS_POR_PERIODO', {}).get(periodo, padrao)
+        return {
+            'periodo': periodo,
+            'threshold_negadas': thresholds['threshold_negadas'],
+            'threshold_n2': thresholds['threshold_n2'],
+            'threshold_valor_negadas': thresholds.get('threshold_valor_negadas',
+                                                      getattr(config, 'THRESHOLD_VALOR_NEGADAS', None)),
+        }
+
+
+# ===== ANÁLISE =====
+
+def listar_exports(diretorio: Optional[str] = None, arquivados: bool = False, arquivo_dir: Optional[str] = None,
+                   categoria: str = 'Recargas', padrao: str = 'Transacao*.xlsx') -> List[Dict]:
+    """
+    Lista os exports a reprocessar
+
+    Args:
+        diretorio: Diretório quente com os exports (None = não usar)
+        arquivados: Inclui os exports compactados pela retenção
+        arquivo_dir: Diretório raiz da retenção (ARQUIVO_DIR)
+        categoria: Categoria da retenção com os exports
+        padrao: Padrão dos nomes de arquivo
+
+    Returns:
+        Lista de fontes ({'nome', 'caminho'} ou {'nome', 'chave', 'arquivo_dir', 'categoria'})
+    """
+    fontes = {}
+
+    if arquivados and arquivo_dir:
+        gerenciador = GerenciadorRetencao(arquivo_dir)
+        for item in gerenciador.listar_arquivados(categoria, padrao):
+            fontes[(item['nome'], item['mtime'], item['tamanho'])] = {
+                'nome': item['nome'], 'chave': item['chave'], 'arquivo_dir': arquivo_dir, 'categoria': categoria
+            }
+
+    # Um arquivo ainda no diretório quente prevalece sobre a sua cópia arquivada
+    # (mesmo nome, horário e tamanho); nomes reaproveitados com outro conteúdo entram os dois
+    if diretorio:
+        for caminho in glob.glob(os.path.join(diretorio, padrao)):
+            nome = os.path.basename(caminho)
+            mtime = datetime.fromtimestamp(os.path.getmtime(caminho)).strftime('%Y-%m-%d %H:%M:%S')
+            fontes[(nome, mtime, os.path.getsize(caminho))] = {'nome': nome, 'caminho': caminho}
+
+    return list(fontes.values())
+
+
+def _fim_janela(analyzer: RecargaAnalyzer, mtime: Optional[float]) -> Optional[datetime]:
+    """
+    Fim da janela de um export: última transação arredondada para o minuto seguinte
+    (ou horário de modificação do arquivo, se o export não tiver datas)
+    """
+    datas = analyzer.df.get('Data/Hora Origem') if analyzer.df is not None else None
+    if datas is not None and pd.api.types.is_datetime64_any_dtype(datas) and datas.notna().any():
+        return datas.max().ceil('min').to_pydatetime()
+    if mtime is not None:
+        return datetime.fromtimestamp(mtime).replace(second=0, microsecond=0)
+    return None
+
+
+def analisar_export(fonte: Dict) -> Optional[Dict]:
+    """
+    Analisa um export com os thresholds vigentes no fim da sua janela (executado nos workers)
+
+    Args:
+        fonte: Item de listar_exports()
+
+    Returns:
+        Dict com 'fonte', 'fim', 'thresholds' e 'resultado', ou None se falhou
+    """
+    try:
+        if 'caminho' in fonte:
+            arquivo = fonte['caminho']
+            mtime = os.path.getmtime(arquivo)
+        else:
+            gerenciador = GerenciadorRetencao(fonte['arquivo_dir'])
+            arquivo = gerenciador.abrir_arquivado(fonte['categoria'], fonte['chave'])
+            mtime = None
+            if arquivo is None:
+                return None
+
+        analyzer = RecargaAnalyzer()
+        if not analyzer.carregar_arquivo(arquivo):
+            return None
+
+        fim = _fim_janela(analyzer, mtime)
+        if fim is None:
+            logger.warning(f"{fonte['nome']}: sem datas nem horário do arquivo - ignorado")
+            return None
+
+        thresholds = resolver_thresholds(fim)
+        analyzer.threshold_negadas = thresholds['threshold_negadas']
+        analyzer.threshold_n2 = thresholds['threshold_n2']
+        analyzer.threshold_valor_negadas = thresholds.get('threshold_valor_negadas')
+        analyzer.periodo_texto = f"{(fim - timedelta(minutes=30)):%H:%M} às {fim:%H:%M}"
+
+        resultado = analyzer.analisar()
+        if not resultado:
+            return None
+
+        return {'fonte': fonte, 'fim': fim, 'thresholds': thresholds, 'resultado': resultado}
+
+    except Exception as e:
+        logger.error(f"Erro ao analisar {fonte.get('nome')}: {e}")
+        return None
+
+
+# ===== REPLAY =====
+
+def reproduzir(fontes: List[Dict], workers: int = 4, de: Optional[datetime] = None, ate: Optional[datetime] = None,
+               relatorio_completo: bool = False, output_dir: Optional[str] = None) -> pd.DataFrame:
+    """
+    Reprocessa os exports: análise em paralelo, alarmística em ordem cronológica
+
+    A máquina de estados e o estado das rotas começam vazios (arquivos
+    temporários) e os e-mails vão para um ServidorSmtpLocal. Sem relatorio_completo, a abertura e o
+    escalonamento enviam apenas o resumo imediato (primeira fase do alerta).
+
+    Args:
+        fontes: Retorno de listar_exports()
+        workers: Processos de análise
+        de: Fim de janela mínimo
+        ate: Fim de janela máximo
+        relatorio_completo: Gera gráficos e Excel e envia o relatório como resposta ao resumo
+        output_dir: Diretório dos relatórios (padrão: temporário)
+
+    Returns:
+        DataFrame com uma linha de decisão por janela
+    """
+    import config
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        analises = [a for a in executor.map(analisar_export, fontes, chunksize=4) if a is not None]
+
+    analises = [a for a in analises if (de is None or a['fim'] >= de) and (ate is None or a['fim'] <= ate)]
+    analises.sort(key=lambda a: a['fim'])
+    logger.info(f"Replay: {len(analises)} janela(s) de {len(fontes)} export(s)")
+
+    smtp = ServidorSmtpLocal().iniciar()
+    temporario = tempfile.TemporaryDirectory(prefix="replay_")
+    output_dir = output_dir or os.path.join(temporario.name, "output")
+
+    try:
+        maquina = MaquinaEstadoAlarme(
+            os.path.join(temporario.name, "estado_alarme.json"),
+            fator_histerese=getattr(config, 'ALARME_FATOR_HISTERESE', 0.8),
+            janelas_para_resolver=getattr(config, 'ALARME_JANELAS_PARA_RESOLVER', 2)
+        )
+        sender = EmailSender(
+            smtp_server='127.0.0.1',
+            smtp_port=smtp.porta,
+            smtp_user=config.EMAIL_USER,
+            smtp_password='',
+            graficos_inline=getattr(config, 'EMAIL_GRAFICOS_INLINE', 'html'),
+            usar_tls=False
+        )
+        destinatarios = config.EMAIL_DESTINATARIOS_NOC
+        rotas = getattr(config, 'ROTAS_ALERTA', [])
+        estado_rotas = EstadoRotas(os.path.join(temporario.name, "estado_rotas.json"))
+
+        decisoes = []
+        for analise in analises:
+            resultado, thresholds, fim = analise['resultado'], analise['thresholds'], analise['fim']
+            periodo_texto = f"{(fim - timedelta(minutes=30)):%d/%m/%Y %H:%M} às {fim:%H:%M}"
+            enviadas_antes = len(smtp.mensagens)
+
+            estado = maquina.atualizar(resultado, thresholds['threshold_negadas'], thresholds['threshold_n2'],
+                                       thresholds.get('threshold_valor_negadas'))
+
+            # Rotas avaliadas em toda janela, com estado próprio (como enviar_alertas_roteados)
+            if rotas:
+                particoes = particionar_por_rotas(resultado.get('agregado_origem_codigo'), rotas,
+                                                  thresholds['threshold_negadas'], thresholds['threshold_n2'])
+                notificadas = set()
+                for particao in particoes:
+                    if (particao['destinatarios'] and estado_rotas.a_notificar(particao)
+                            and sender.enviar_alerta_roteado(particao, periodo_texto)):
+                        notificadas.add(particao['rota'])
+                estado_rotas.atualizar(particoes, notificadas)
+
+            if estado['gerar_relatorio']:
+                message_id = sender.enviar_resumo_imediato(destinatarios, resultado, periodo_texto)
+                if message_id:
+                    maquina.confirmar()
+                if relatorio_completo:
+                    _enviar_relatorio(sender, analise, periodo_texto, output_dir, message_id)
+
+            elif estado['enviar_atualizacao'] or estado['enviar_resolucao']:
+                if sender.enviar_atualizacao(destinatarios, resultado, estado, periodo_texto):
+                    maquina.confirmar()
+
+            enviadas = smtp.mensagens[enviadas_antes:]
+            decisoes.append({
+                'fim_janela': fim.strftime('%Y-%m-%d %H:%M'),
+                'arquivo': analise['fonte']['nome'],
+                'periodo_dia': thresholds['periodo'],
+                'threshold_negadas': thresholds['threshold_negadas'],
+                'threshold_n2': thresholds['threshold_n2'],
+                'total_transacoes': resultado['total_transacoes'],
+                'percentual_negadas': resultado['percentual_negadas'],
+                'percentual_n2': resultado['percentual_n2'],
+                'percentual_valor_negado': resultado.get('percentual_valor_negado', 0.0),
+                'nivel_alarme': resultado['nivel_alarme'],
+                'estado': estado['estado'],
+                'emails': len(enviadas),
+                'assuntos': ' | '.join(m['assunto'] for m in enviadas),
+            })
+
+        return pd.DataFrame(decisoes, columns=['fim_janela', 'arquivo', 'periodo_dia', 'threshold_negadas',
+                                               'threshold_n2', 'total_transacoes', 'percentual_negadas',
+                                               'percentual_n2', 'percentual_valor_negado', 'nivel_alarme',
+                                               'estado', 'emails', 'assuntos'])
+
+    finally:
+        smtp.parar()
+        temporario.cleanup()
+
+
+def _enviar_relatorio(sender: EmailSender, analise: Dict, periodo_texto: str, output_dir: str,
+                      em_resposta_a: Optional[str]):
+    """
+    Segunda fase do alerta no replay: recarrega o export e envia o relatório completo
+    """
+    import config
+    from report_generator import gerar_relatorio_completo
+
+    fonte = analise['fonte']
+    if 'caminho' in fonte:
+        arquivo = fonte['caminho']
+    else:
+        arquivo = GerenciadorRetencao(fonte['arquivo_dir']).abrir_arquivado(fonte['categoria'], fonte['chave'])
+
+    thresholds = analise['thresholds']
+    analyzer = RecargaAnalyzer(thresholds['threshold_negadas'], thresholds['threshold_n2'], periodo_texto,
+                               thresholds.get('threshold_valor_negadas'))
+    if arquivo is None or not analyzer.carregar_arquivo(arquivo) or not analyzer.analisar():
+        logger.error(f"Replay: falha ao recarregar {fonte['nome']} para o relatório completo")
+        return
+
+    relatorio = gerar_relatorio_completo(analyzer, output_dir=output_dir)
+    if not relatorio:
+        return
+
+    sender.enviar_alerta(
+        destinatarios=config.EMAIL_DESTINATARIOS_NOC,
+        resultado_analise=analyzer.resultado_analise,
+        tabela_resumo=relatorio.get('tabela_resumo'),
+        tabela_codigos=relatorio.get('tabela_codigos'),
+        tabela_negadas=relatorio.get('tabela_negadas'),
+        ranking_negadas=relatorio.get('ranking_negadas'),
+        ranking_n2=relatorio.get('ranking_n2'),
+        nivel_alarme=analyzer.resultado_analise['nivel_alarme'],
+        periodo_analise=periodo_texto,
+        excel_path=relatorio.get('excel'),
+        em_resposta_a=em_resposta_a
+    )
+
+
+# ===== COMPARAÇÃO =====
+
+def comparar_decisoes(atual: pd.DataFrame, baseline: pd.DataFrame) -> pd.DataFrame:
+    """
+    Janelas cuja decisão mudou em relação à execução de referência
+
+    Args:
+        atual: Decisões do replay
+        baseline: Decisões de referência (mesmo formato, ex: CSV de um replay anterior)
+
+    Returns:
+        DataFrame com fim_janela, a coluna 'mudanca' e os valores antes/depois de COLUNAS_DECISAO
+    """
+    colunas = ['fim_janela'] + COLUNAS_DECISAO
+    # Comparação como texto antes do merge (o outer join converte inteiros com lacunas em float: 2 != 2.0)
+    juntos = baseline[colunas].astype(str).merge(atual[colunas].astype(str), on='fim_janela', how='outer',
+                                                 suffixes=('_baseline', '_replay'), indicator=True)
+
+    mudou = juntos['_merge'] != 'both'
+    for coluna in COLUNAS_DECISAO:
+        mudou |= (juntos[f"{coluna}_baseline"] != juntos[f"{coluna}_replay"]) & (juntos['_merge'] == 'both')
+
+    diferencas = juntos[mudou].copy()
+    diferencas['mudanca'] = diferencas['_merge'].map({
+        'left_only': 'só na referência',
+        'right_only': 'só no replay',
+        'both': 'decisão diferente',
+    }).astype(str)
+    return diferencas.drop(columns='_merge').sort_values('fim_janela').reset_index(drop=True)
+
+
+def _resumo_decisoes(decisoes: pd.DataFrame) -> str:
+    """
+    Linha de resumo: janelas, janelas em alarme e e-mails enviados
+    """
+    alarmes = int((decisoes['nivel_alarme'] != 'Normal').sum()) if len(decisoes) else 0
+    emails = int(decisoes['emails'].sum()) if len(decisoes) else 0
+    return f"{len(decisoes)} janela(s), {alarmes} em alarme, {emails} e-mail(s)"
+
+
+def _data(texto: str) -> datetime:
+    """
+    Converte 'YYYY-MM-DD HH:MM' para datetime (argparse)
+    """
+    try:
+        return datetime.strptime(texto, '%Y-%m-%d %H:%M')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Data inválida: {texto} (use 'YYYY-MM-DD HH:MM')")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI do replay
+    """
+    parser = argparse.ArgumentParser(description="Replay de exports antigos pela alarmística (SMTP local)")
+    parser.add_argument('--dir', default=None, help="Diretório com os exports (padrão: DOWNLOAD_DIR)")
+    parser.add_argument('--arquivados', action='store_true', help="Inclui os exports compactados pela retenção")
+    parser.add_argument('--de', type=_data, default=None, help="Fim de janela mínimo ('YYYY-MM-DD HH:MM')")
+    parser.add_argument('--ate', type=_data, default=None, help="Fim de janela máximo ('YYYY-MM-DD HH:MM')")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processos de análise")
+    parser.add_argument('--relatorio-completo', action='store_true', help="Gera e envia também gráficos e Excel")
+    parser.add_argument('--saida', default='replay_decisoes.csv', help="CSV com as decisões por janela")
+    parser.add_argument('--baseline', default=None, help="CSV de decisões de referência para comparação")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    import config
+
+    fontes = listar_exports(args.dir or config.DOWNLOAD_DIR, args.arquivados,
+                            getattr(config, 'ARQUIVO_DIR', None))
+    if not fontes:
+        print("Nenhum export encontrado", file=sys.stderr)
+        return 1
+
+    decisoes = reproduzir(fontes, args.workers, args.de, args.ate, args.relatorio_completo)
+    decisoes.to_csv(args.saida, index=False)
+    print(f"Replay: {_resumo_decisoes(decisoes)} -> {args.saida}")
+
+    if args.baseline:
+        baseline = pd.read_csv(args.baseline, dtype={'fim_janela': str})
+        diferencas = comparar_decisoes(decisoes, baseline)
+        print(f"Referência: {_resumo_decisoes(baseline)}")
+        if len(diferencas) == 0:
+            print("Nenhuma decisão mudou")
+            return 0
+        print(f"\n{len(diferencas)} janela(s) com decisão diferente:")
+        with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_rows', None):
+            print(diferencas.to_string(index=False))
+        return 2
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,15 +4,16 @@ Gera gráficos e arquivos Excel formatados
 """
 
 import os
+import time
 import logging
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Backend sem display
-import matplotlib.pyplot as plt
-from openpyxl import load_workbook
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 from datetime import datetime
+from chart_renderer import ChartRenderer
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +33,9 @@ class ReportGenerator:
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
 
+        # Gráficos sem pyplot global, com cache por hash do ranking
+        self.chart_renderer = ChartRenderer(cache_dir=os.path.join(output_dir, ".cache_graficos"))
+
     def gerar_grafico_ranking(self, df_ranking: pd.DataFrame, titulo: str = "Ranking de Origens", cor: str = '#ffc107') -> str:
         """
         Gera gráfico de barras horizontais do ranking de origens
@@ -44,69 +48,59 @@ class ReportGenerator:
         Returns:
             Caminho do arquivo de imagem gerado
         """
-        try:
-            if df_ranking is None or len(df_ranking) == 0:
-                logger.warning("DataFrame vazio, não foi possível gerar gráfico")
-                return None
-
-            # Configurar figura
-            fig, ax = plt.subplots(figsize=(12, 8))
+        return self.gerar_graficos_ranking([(df_ranking, titulo, cor)])[0]
 
-            # Preparar dados - detectar coluna de valores
-            origens = df_ranking['Origem'].values
+    def gerar_graficos_ranking(self, graficos: list) -> list:
+        """
+        Gera vários gráficos de ranking independentes em paralelo
 
-            # Determinar qual coluna de valores usar
-            if 'Total Negadas' in df_ranking.columns:
-                valores = df_ranking['Total Negadas'].values
-                label = 'Total Negadas'
-            elif 'Total N2' in df_ranking.columns:
-                valores = df_ranking['Total N2'].values
-                label = 'Total N2'
-            else:
-                logger.error("Coluna de valores não encontrada no DataFrame")
-                return None
+        Args:
+            graficos: Lista de tuplas (df_ranking, titulo, cor)
 
-            # Posições das barras
-            y_pos = range(len(origens))
+        Returns:
+            Lista de caminhos gerados (None para os que falharam), na mesma ordem
+        """
+        resultados = [None] * len(graficos)
+        pedidos = []
+        indices = []
 
-            # Criar barras
-            bars = ax.barh(y_pos, valores, color=cor, alpha=0.8, edgecolor='black', linewidth=0.5)
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-            # Adicionar valores nas barras
-            for bar in bars:
-                width = bar.get_width()
-                if width > 0:
-                    ax.text(width, bar.get_y() + bar.get_height()/2,
-                           f' {int(width)}', va='center', ha='left', fontsize=10, fontweight='bold')
+            for idx, (df_ranking, titulo, cor) in enumerate(graficos):
+                if df_ranking is None or len(df_ranking) == 0:
+                    logger.warning("DataFrame vazio, não foi possível gerar gráfico")
+                    continue
 
-            # Configurar eixos
-            ax.set_yticks(y_pos)
-            ax.set_yticklabels(origens, fontsize=10)
-            ax.invert_yaxis()  # Top = primeira origem
-            ax.set_xlabel('Quantidade de Transações', fontsize=12, fontweight='bold')
-            ax.set_title(titulo, fontsize=14, fontweight='bold', pad=20)
+                # Determinar qual coluna de valores usar
+                if 'Total Negadas' in df_ranking.columns:
+                    label = 'Total Negadas'
+                elif 'Total N2' in df_ranking.columns:
+                    label = 'Total N2'
+                else:
+                    logger.error("Coluna de valores não encontrada no DataFrame")
+                    continue
 
-            # Grid
-            ax.grid(axis='x', alpha=0.3, linestyle='--')
+                suffix = "negadas" if label == 'Total Negadas' else "n2"
+                filename = f"ranking_{suffix}_{timestamp}.png"
 
-            # Layout ajustado
-            plt.tight_layout()
+                pedidos.append({
+                    'origens': [str(o) for o in df_ranking['Origem'].values],
+                    'valores': df_ranking[label].values,
+                    'titulo': titulo,
+                    'cor': cor,
+                    'caminho': os.path.join(self.output_dir, filename),
+                })
+                indices.append(idx)
 
-            # Salvar
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            suffix = "negadas" if label == 'Total Negadas' else "n2"
-            filename = f"ranking_{suffix}_{timestamp}.png"
-            filepath = os.path.join(self.output_dir, filename)
-
-            plt.savefig(filepath, dpi=150, bbox_inches='tight', facecolor='white')
-            plt.close()
-
-            logger.info(f"Gráfico gerado: {filepath}")
-            return filepath
+            if pedidos:
+                for idx, caminho in zip(indices, self.chart_renderer.renderizar(pedidos)):
+                    resultados[idx] = caminho
 
         except Exception as e:
             logger.error(f"Erro ao gerar gráfico: {e}")
-            return None
+
+        return resultados
 
     def gerar_excel_completo(self,
                             tabela_resumo: pd.DataFrame,
@@ -117,6 +111,10 @@ class ReportGenerator:
         """
         Gera arquivo Excel completo e formatado
 
+        O arquivo é escrito uma única vez em modo streaming (write_only), já
+        com cabeçalho, bordas, larguras de coluna e painel congelado, sem o
+        ciclo gravar → reabrir → formatar → gravar.
+
         Args:
             tabela_resumo: DataFrame com resumo geral
             tabela_codigos: DataFrame com códigos de resposta
@@ -132,30 +130,34 @@ class ReportGenerator:
             filename = f"relatorio_recargas_{timestamp}.xlsx"
             filepath = os.path.join(self.output_dir, filename)
 
-            # Criar Excel com múltiplas abas
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                # Aba 1: Resumo Geral
-                if tabela_resumo is not None and len(tabela_resumo) > 0:
-                    tabela_resumo.to_excel(writer, sheet_name='Resumo Geral', index=False)
-
-                # Aba 2: Ranking Negadas
-                if ranking_negadas is not None and len(ranking_negadas) > 0:
-                    ranking_negadas.to_excel(writer, sheet_name='Ranking Negadas', index=True, index_label='#')
+            # (nome da aba, DataFrame, incluir índice como coluna '#')
+            abas = [
+                ('Resumo Geral', tabela_resumo, False),
+                ('Ranking Negadas', ranking_negadas, True),
+                ('Ranking N2', ranking_n2, True),
+                ('Códigos de Resposta', tabela_codigos, False),
+                ('Recargas Negadas', tabela_negadas, False),
+            ]
+
+            wb = Workbook(write_only=True)
+            estilos = self._criar_estilos_excel()
+            abas_escritas = 0
+
+            for sheet_name, df, incluir_indice in abas:
+                if df is None or len(df) == 0:
+                    continue
 
-                # Aba 3: Ranking N2
-                if ranking_n2 is not None and len(ranking_n2) > 0:
-                    ranking_n2.to_excel(writer, sheet_name='Ranking N2', index=True, index_label='#')
+                if incluir_indice:
+                    df = df.rename_axis('#').reset_index()
 
-                # Aba 4: Códigos de Resposta
-                if tabela_codigos is not None and len(tabela_codigos) > 0:
-                    tabela_codigos.to_excel(writer, sheet_name='Códigos de Resposta', index=False)
+                self._escrever_aba(wb, sheet_name, df, estilos)
+                abas_escritas += 1
 
-                # Aba 5: Recargas Negadas
-                if tabela_negadas is not None and len(tabela_negadas) > 0:
-                    tabela_negadas.to_excel(writer, sheet_name='Recargas Negadas', index=False)
+            if abas_escritas == 0:
+                logger.warning("Nenhuma tabela com dados, Excel não gerado")
+                return None
 
-            # Formatar Excel
-            self._formatar_excel(filepath)
+            wb.save(filepath)
 
             logger.info(f"Excel gerado: {filepath}")
             return filepath
@@ -164,66 +166,92 @@ class ReportGenerator:
             logger.error(f"Erro ao gerar Excel: {e}")
             return None
 
-    def _formatar_excel(self, filepath: str):
+    @staticmethod
+    def _criar_estilos_excel() -> dict:
         """
-        Aplica formatação profissional ao Excel
+        Cria os objetos de estilo compartilhados por todas as células
 
-        Args:
-            filepath: Caminho do arquivo Excel
+        Returns:
+            Dict com estilos de cabeçalho e corpo
         """
-        try:
-            wb = load_workbook(filepath)
-
-            # Estilos
-            header_fill = PatternFill(start_color="4a5568", end_color="4a5568", fill_type="solid")
-            header_font = Font(bold=True, color="FFFFFF", size=11)
-            border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-
-            # Formatar cada aba
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-
-                # Formatar cabeçalho
-                for cell in ws[1]:
-                    cell.fill = header_fill
-                    cell.font = header_font
-                    cell.alignment = Alignment(horizontal='center', vertical='center')
-                    cell.border = border
-
-                # Ajustar largura das colunas
-                for column in ws.columns:
-                    max_length = 0
-                    column_letter = get_column_letter(column[0].column)
-
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
+        border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+        return {
+            'header_fill': PatternFill(start_color="4a5568", end_color="4a5568", fill_type="solid"),
+            'header_font': Font(bold=True, color="FFFFFF", size=11),
+            'alignment': Alignment(horizontal='center', vertical='center'),
+            'border': border,
+        }
 
-                    adjusted_width = min(max_length + 2, 50)
-                    ws.column_dimensions[column_letter].width = adjusted_width
+    @staticmethod
+    def _larguras_colunas(df: pd.DataFrame) -> list:
+        """
+        Calcula a largura de cada coluna a partir do maior texto (cabeçalho incluso)
 
-                # Aplicar bordas e alinhamento
-                for row in ws.iter_rows(min_row=2, max_row=ws.max_row, max_col=ws.max_column):
-                    for cell in row:
-                        cell.border = border
-                        cell.alignment = Alignment(horizontal='center', vertical='center')
+        Args:
+            df: DataFrame da aba
 
-                # Congelar primeira linha
-                ws.freeze_panes = 'A2'
+        Returns:
+            Lista de larguras (limitadas a 50)
+        """
+        larguras = []
+        for coluna in df.columns:
+            max_valor = df[coluna].astype(str).str.len().max() if len(df) > 0 else 0
+            max_length = max(len(str(coluna)), int(max_valor or 0))
+            larguras.append(min(max_length + 2, 50))
+        return larguras
+
+    def _escrever_aba(self, wb: Workbook, sheet_name: str, df: pd.DataFrame, estilos: dict,
+                      chunk_size: int = 5000):
+        """
+        Escreve uma aba formatada em modo streaming
 
-            wb.save(filepath)
-            logger.info(f"Excel formatado com sucesso: {filepath}")
+        As linhas são convertidas em blocos de chunk_size, então a memória
+        usada não cresce com o tamanho da aba.
 
-        except Exception as e:
-            logger.error(f"Erro ao formatar Excel: {e}")
+        Args:
+            wb: Workbook em modo write_only
+            sheet_name: Nome da aba
+            df: DataFrame a escrever
+            estilos: Estilos de _criar_estilos_excel()
+            chunk_size: Linhas convertidas por bloco
+        """
+        ws = wb.create_sheet(title=sheet_name)
+
+        # Larguras e painel congelado precisam ser definidos antes das linhas
+        for idx, largura in enumerate(self._larguras_colunas(df), start=1):
+            ws.column_dimensions[get_column_letter(idx)].width = largura
+        ws.freeze_panes = 'A2'
+
+        header = []
+        for coluna in df.columns:
+            cell = WriteOnlyCell(ws, value=str(coluna))
+            cell.fill = estilos['header_fill']
+            cell.font = estilos['header_font']
+            cell.alignment = estilos['alignment']
+            cell.border = estilos['border']
+            header.append(cell)
+        ws.append(header)
+
+        border = estilos['border']
+        alignment = estilos['alignment']
+
+        for inicio in range(0, len(df), chunk_size):
+            bloco = df.iloc[inicio:inicio + chunk_size]
+            bloco = bloco.astype(object).where(bloco.notna(), None)
+
+            for valores in bloco.itertuples(index=False, name=None):
+                linha = []
+                for valor in valores:
+                    cell = WriteOnlyCell(ws, value=valor)
+                    cell.border = border
+                    cell.alignment = alignment
+                    linha.append(cell)
+                ws.append(linha)
 
     def limpar_arquivos_antigos(self, dias: int = 7):
         """
@@ -260,56 +288,162 @@ class ReportGenerator:
             logger.error(f"Erro ao limpar arquivos antigos: {e}")
 
 
-def gerar_relatorio_completo(analyzer, output_dir: str = "output") -> dict:
+# Timeout padrão (segundos) por artefato do relatório
+TIMEOUTS_PADRAO = {
+    'tabela_resumo': 30,
+    'tabela_codigos': 30,
+    'tabela_negadas': 60,
+    'ranking_negadas': 30,
+    'ranking_n2': 30,
+    'grafico_negadas': 60,
+    'grafico_n2': 60,
+    'excel': 180,
+}
+
+
+def _executar_grafo(tarefas: dict, timeouts: dict, max_workers: int = 4) -> tuple:
+    """
+    Executa um grafo de tarefas dependentes em um pool de threads
+
+    Cada tarefa roda assim que todas as suas dependências terminam (com
+    sucesso ou não). Dependências que falharam ou estouraram o timeout
+    chegam como None, então um artefato ausente nunca bloqueia os demais.
+
+    Args:
+        tarefas: Dict nome -> (função, [nomes das dependências]); a função
+                 recebe os resultados das dependências na mesma ordem
+        timeouts: Dict nome -> timeout em segundos (ausente = sem limite)
+        max_workers: Quantidade de threads
+
+    Returns:
+        Tupla (resultados, falhas, tempos) - dicts por nome da tarefa
+    """
+    resultados = {}
+    falhas = {}
+    tempos = {}
+    pendentes = dict(tarefas)
+    em_execucao = {}  # future -> (nome, início)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='relatorio')
+
+    try:
+        while pendentes or em_execucao:
+            # Submeter tarefas cujas dependências já foram resolvidas
+            for nome, (funcao, deps) in list(pendentes.items()):
+                if all(dep in resultados or dep in falhas for dep in deps):
+                    argumentos = [resultados.get(dep) for dep in deps]
+                    futuro = executor.submit(funcao, *argumentos)
+                    em_execucao[futuro] = (nome, time.monotonic())
+                    del pendentes[nome]
+
+            if not em_execucao:
+                # Dependência inexistente/cíclica: nada mais pode rodar
+                for nome in pendentes:
+                    falhas[nome] = "dependência não resolvida"
+                break
+
+            # Aguardar até a próxima conclusão ou o prazo mais próximo
+            agora = time.monotonic()
+            prazos = [inicio + timeouts[nome] - agora
+                      for nome, inicio in em_execucao.values() if nome in timeouts]
+            espera = max(0.0, min(prazos)) if prazos else None
+            concluidos, _ = wait(list(em_execucao), timeout=espera, return_when=FIRST_COMPLETED)
+
+            for futuro in concluidos:
+                nome, inicio = em_execucao.pop(futuro)
+                tempos[nome] = round(time.monotonic() - inicio, 3)
+                try:
+                    resultados[nome] = futuro.result()
+                except Exception as e:
+                    falhas[nome] = str(e)
+                    logger.error(f"Artefato '{nome}' falhou: {e}")
+
+            # Abandonar tarefas que estouraram o timeout (a thread segue, o resultado é descartado)
+            agora = time.monotonic()
+            for futuro, (nome, inicio) in list(em_execucao.items()):
+                if nome in timeouts and agora - inicio >= timeouts[nome]:
+                    del em_execucao[futuro]
+                    futuro.cancel()
+                    tempos[nome] = round(agora - inicio, 3)
+                    falhas[nome] = f"timeout ({timeouts[nome]}s)"
+                    logger.error(f"Artefato '{nome}' excedeu o timeout de {timeouts[nome]}s")
+
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return resultados, falhas, tempos
+
+
+def gerar_relatorio_completo(analyzer, output_dir: str = "output", timeouts: dict = None,
+                             max_workers: int = 4) -> dict:
     """
     Função auxiliar para gerar relatório completo
 
+    As tabelas, os dois gráficos e o Excel formam um grafo de dependências
+    executado em paralelo: cada gráfico depende só do seu ranking e o Excel
+    só das tabelas. Artefatos que falham ou estouram o timeout retornam None
+    sem impedir os demais, e a latência total fica próxima à do artefato
+    mais lento.
+
     Args:
         analyzer: Instância de RecargaAnalyzer
         output_dir: Diretório de saída
+        timeouts: Timeout em segundos por artefato (sobrescreve TIMEOUTS_PADRAO)
+        max_workers: Quantidade de threads do pool
 
     Returns:
-        Dict com caminhos dos arquivos gerados
+        Dict com caminhos dos arquivos gerados, tabelas e artefatos que falharam
     """
     try:
         generator = ReportGenerator(output_dir)
 
-        # Gerar dados
-        tabela_resumo = analyzer.gerar_tabela_resumo()
-        tabela_codigos = analyzer.gerar_tabela_codigos()
-        tabela_negadas = analyzer.gerar_tabela_negadas()
-        ranking_negadas = analyzer.gerar_ranking_negadas()
-        ranking_n2 = analyzer.gerar_ranking_n2()
-
-        # Gerar gráfico 1: Ranking de todas as negadas
-        grafico_negadas_path = generator.gerar_grafico_ranking(
-            ranking_negadas,
-            "Ranking de Origens - Todas as Recargas Negadas (Últimos 30min)",
-            cor='#ffc107'  # Amarelo
-        )
+        limites = dict(TIMEOUTS_PADRAO)
+        limites.update(timeouts or {})
+
+        tabelas = ['tabela_resumo', 'tabela_codigos', 'ranking_negadas', 'ranking_n2', 'tabela_negadas']
+
+        tarefas = {
+            # Gerar dados
+            'tabela_resumo': (analyzer.gerar_tabela_resumo, []),
+            'tabela_codigos': (analyzer.gerar_tabela_codigos, []),
+            'tabela_negadas': (analyzer.gerar_tabela_negadas, []),
+            'ranking_negadas': (analyzer.gerar_ranking_negadas, []),
+            'ranking_n2': (analyzer.gerar_ranking_n2, []),
+            # Gráfico 1: Ranking de todas as negadas (amarelo)
+            'grafico_negadas': (
+                lambda ranking: generator.gerar_grafico_ranking(
+                    ranking, "Ranking de Origens - Todas as Recargas Negadas (Últimos 30min)", cor='#ffc107'),
+                ['ranking_negadas']
+            ),
+            # Gráfico 2: Ranking específico de N2 (vermelho)
+            'grafico_n2': (
+                lambda ranking: generator.gerar_grafico_ranking(
+                    ranking, "Ranking de Origens - Erros N2 (Últimos 30min)", cor='#dc3545'),
+                ['ranking_n2']
+            ),
+            # Excel completo (depende apenas das tabelas)
+            'excel': (generator.gerar_excel_completo, tabelas),
+        }
 
-        # Gerar gráfico 2: Ranking específico de N2
-        grafico_n2_path = generator.gerar_grafico_ranking(
-            ranking_n2,
-            "Ranking de Origens - Erros N2 (Últimos 30min)",
-            cor='#dc3545'  # Vermelho
-        )
+        inicio = time.monotonic()
+        resultados, falhas, tempos = _executar_grafo(tarefas, limites, max_workers=max_workers)
+        total = time.monotonic() - inicio
 
-        # Gerar Excel completo
-        excel_path = generator.gerar_excel_completo(
-            tabela_resumo,
-            tabela_codigos,
-            ranking_negadas,
-            ranking_n2,
-            tabela_negadas
-        )
+        if falhas:
+            logger.warning(f"Relatório parcial - artefatos com falha: {', '.join(sorted(falhas))}")
+        logger.info(f"Relatório gerado em {total:.2f}s (por artefato: {tempos})")
 
         return {
-            'grafico_negadas': grafico_negadas_path,
-            'grafico_n2': grafico_n2_path,
-            'excel': excel_path,
-            'ranking_negadas': ranking_negadas,
-            'ranking_n2': ranking_n2
+            'grafico_negadas': resultados.get('grafico_negadas'),
+            'grafico_n2': resultados.get('grafico_n2'),
+            'excel': resultados.get('excel'),
+            'ranking_negadas': resultados.get('ranking_negadas'),
+            'ranking_n2': resultados.get('ranking_n2'),
+            'tabela_resumo': resultados.get('tabela_resumo'),
+            'tabela_codigos': resultados.get('tabela_codigos'),
+            'tabela_negadas': resultados.get('tabela_negadas'),
+            'artefatos_falhos': falhas,
+            'tempos': tempos
         }
 
     except Exception as e:
@@ -0,0 +1,368 @@
+"""
+Módulo de Retenção de Arquivos
+Mantém os diretórios quentes (Recargas/, output/, Logs/) pequenos, compactando
+arquivos antigos em arquivos diários com índice (manifest) consultável
+"""
+
+import io
+import os
+import json
+import time
+import zipfile
+import fnmatch
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Extensões que já são compactadas (xlsx é um zip, png é deflate): armazenadas sem recompactar
+EXTENSOES_COMPACTADAS = ('.xlsx', '.png', '.zip', '.gz')
+
+
+class GerenciadorRetencao:
+    """
+    Aplica políticas de retenção por diretório
+
+    Cada política define:
+    - diretorio: diretório quente a controlar
+    - padrao: padrão fnmatch dos arquivos controlados (ex: 'Transacao*.xlsx')
+    - dias_quente: idade máxima (dias) de um arquivo no diretório quente
+    - max_mb_quente: tamanho máximo (MB) do diretório quente; os mais antigos saem primeiro
+    - dias_arquivo: idade máxima (dias) de um arquivo diário compactado (None = para sempre)
+
+    Arquivos que saem do diretório quente vão para <arquivo_dir>/<categoria>/<categoria>_YYYYMMDD.zip
+    (agrupados pelo dia de modificação) e são registrados em <arquivo_dir>/<categoria>/manifest.json.
+    Um nome já presente no zip do dia com outro conteúdo (ex: alarmistica_YYYYMMDD.log.1 reaproveitado
+    pelo RotatingFileHandler) é gravado com o mtime no nome interno; nada é apagado sem estar no zip.
+    """
+
+    def __init__(self, arquivo_dir: str, minutos_protecao: int = 10):
+        """
+        Inicializa o gerenciador
+
+        Args:
+            arquivo_dir: Diretório raiz dos arquivos compactados
+            minutos_protecao: Arquivos modificados há menos tempo nunca são movidos
+                              (ex: log em uso, download em andamento)
+        """
+        self.arquivo_dir = arquivo_dir
+        self.minutos_protecao = minutos_protecao
+        os.makedirs(arquivo_dir, exist_ok=True)
+
+    # ===== MANIFEST =====
+
+    def _caminho_manifest(self, categoria: str) -> str:
+        """
+        Caminho do manifest de uma categoria
+        """
+        return os.path.join(self.arquivo_dir, categoria, "manifest.json")
+
+    def carregar_manifest(self, categoria: str) -> Dict:
+        """
+        Carrega o índice de arquivos compactados de uma categoria
+
+        Args:
+            categoria: Nome da política (ex: 'Recargas')
+
+        Returns:
+            Dict '<zip>/<nome interno>' -> {'nome', 'zip', 'arcname', 'mtime', 'tamanho', 'arquivado_em'}
+        """
+        caminho = self._caminho_manifest(categoria)
+        if not os.path.exists(caminho):
+            return {}
+
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao ler manifest de {categoria}: {e}")
+            return {}
+
+    def _salvar_manifest(self, categoria: str, manifest: Dict):
+        """
+        Persiste o manifest de forma atômica (arquivo temporário + rename)
+        """
+        caminho = self._caminho_manifest(categoria)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp_path = f"{caminho}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, caminho)
+
+    # ===== POLÍTICAS =====
+
+    def aplicar(self, categoria: str, politica: Dict) -> Dict:
+        """
+        Aplica uma política de retenção
+
+        Args:
+            categoria: Nome da política (usado como subdiretório do arquivo)
+            politica: Dict com diretorio, padrao, dias_quente, max_mb_quente, dias_arquivo
+
+        Returns:
+            Dict com contagens: arquivados, bytes_liberados, zips_expirados
+        """
+        resumo = {'arquivados': 0, 'bytes_liberados': 0, 'zips_expirados': 0}
+        diretorio = politica['diretorio']
+
+        if not os.path.isdir(diretorio):
+            return resumo
+
+        agora = time.time()
+        limite_protecao = agora - self.minutos_protecao * 60
+        padrao = politica.get('padrao', '*')
+
+        # (caminho, mtime, tamanho) dos arquivos elegíveis, do mais antigo para o mais novo
+        candidatos = []
+        for entrada in os.scandir(diretorio):
+            if not entrada.is_file() or not fnmatch.fnmatch(entrada.name, padrao):
+                continue
+            info = entrada.stat()
+            if info.st_mtime >= limite_protecao:
+                continue
+            candidatos.append((entrada.path, info.st_mtime, info.st_size))
+        candidatos.sort(key=lambda c: c[1])
+
+        # Idade máxima no diretório quente
+        dias_quente = politica.get('dias_quente')
+        mover = []
+        restantes = []
+        for caminho, mtime, tamanho in candidatos:
+            if dias_quente is not None and (agora - mtime) > dias_quente * 86400:
+                mover.append((caminho, mtime, tamanho))
+            else:
+                restantes.append((caminho, mtime, tamanho))
+
+        # Cota de tamanho no diretório quente (remove os mais antigos primeiro)
+        max_mb = politica.get('max_mb_quente')
+        if max_mb is not None:
+            total = sum(c[2] for c in restantes)
+            limite = max_mb * 1024 * 1024
+            while restantes and total > limite:
+                caminho, mtime, tamanho = restantes.pop(0)
+                mover.append((caminho, mtime, tamanho))
+                total -= tamanho
+
+        if mover:
+            arquivados, liberados = self._arquivar(categoria, mover)
+            resumo['arquivados'] = arquivados
+            resumo['bytes_liberados'] = liberados
+
+        dias_arquivo = politica.get('dias_arquivo')
+        if dias_arquivo is not None:
+            resumo['zips_expirados'] = self._expirar(categoria, dias_arquivo)
+
+        if resumo['arquivados'] or resumo['zips_expirados']:
+            logger.info(f"Retenção [{categoria}]: {resumo['arquivados']} arquivo(s) compactado(s), "
+                       f"{resumo['bytes_liberados'] / (1024 * 1024):.1f} MB liberados, "
+                       f"{resumo['zips_expirados']} arquivo(s) diário(s) expirado(s)")
+
+        return resumo
+
+    def _arquivar(self, categoria: str, arquivos: List) -> tuple:
+        """
+        Move arquivos para os zips diários e atualiza o manifest
+
+        Args:
+            categoria: Nome da política
+            arquivos: Lista de (caminho, mtime, tamanho)
+
+        Returns:
+            Tupla (quantidade arquivada, bytes liberados)
+        """
+        destino_dir = os.path.join(self.arquivo_dir, categoria)
+        os.makedirs(destino_dir, exist_ok=True)
+        manifest = self.carregar_manifest(categoria)
+
+        # Agrupar por dia de modificação: um zip aberto por dia
+        por_dia = {}
+        for caminho, mtime, tamanho in arquivos:
+            dia = datetime.fromtimestamp(mtime).strftime('%Y%m%d')
+            por_dia.setdefault(dia, []).append((caminho, mtime, tamanho))
+
+        arquivados = 0
+        liberados = 0
+
+        for dia, itens in sorted(por_dia.items()):
+            zip_nome = f"{categoria}_{dia}.zip"
+            zip_path = os.path.join(destino_dir, zip_nome)
+
+            try:
+                gravados = []
+                with zipfile.ZipFile(zip_path, 'a', compression=zipfile.ZIP_DEFLATED) as zf:
+                    existentes = {info.filename: info for info in zf.infolist()}
+
+                    for caminho, mtime, tamanho in itens:
+                        nome = os.path.basename(caminho)
+                        arcname = self._nome_interno(nome, mtime, tamanho, existentes)
+
+                        # None: o mesmo arquivo já está no zip (execução anterior interrompida antes da remoção)
+                        if arcname is None:
+                            arcname = nome
+                        else:
+                            compressao = (zipfile.ZIP_STORED if nome.lower().endswith(EXTENSOES_COMPACTADAS)
+                                          else zipfile.ZIP_DEFLATED)
+                            zf.write(caminho, arcname=arcname, compress_type=compressao)
+                            existentes[arcname] = zf.getinfo(arcname)
+
+                        manifest[f"{zip_nome}/{arcname}"] = {
+                            'nome': nome,
+                            'arcname': arcname,
+                            'zip': zip_nome,
+                            'mtime': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                            'tamanho': tamanho,
+                            'arquivado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        }
+                        gravados.append((caminho, tamanho))
+
+                # Só remove do diretório quente depois que o zip foi fechado com sucesso
+                for caminho, tamanho in gravados:
+                    os.remove(caminho)
+                    arquivados += 1
+                    liberados += tamanho
+
+            except Exception as e:
+                logger.error(f"Erro ao compactar arquivos de {dia} em {zip_nome}: {e}")
+
+        self._salvar_manifest(categoria, manifest)
+        return arquivados, liberados
+
+    @staticmethod
+    def _nome_interno(nome: str, mtime: float, tamanho: int, existentes: Dict) -> Optional[str]:
+        """
+        Nome do arquivo dentro do zip diário, sem sobrescrever outro arquivo de mesmo nome
+
+        Args:
+            nome: Nome original do arquivo
+            mtime: Horário de modificação
+            tamanho: Tamanho em bytes
+            existentes: Dict nome interno -> ZipInfo do zip
+
+        Returns:
+            Nome interno livre, ou None se o mesmo arquivo (nome, tamanho e horário) já está no zip
+        """
+        info = existentes.get(nome)
+        if info is None:
+            return nome
+
+        # ZipInfo guarda o horário com resolução de 2 segundos
+        data_zip = datetime(*info.date_time).timestamp()
+        if info.file_size == tamanho and abs(data_zip - mtime) <= 2:
+            return None
+
+        raiz, extensao = os.path.splitext(nome)
+        base = f"{raiz}.{datetime.fromtimestamp(mtime).strftime('%Y%m%d%H%M%S')}"
+        arcname, sequencia = f"{base}{extensao}", 1
+        while arcname in existentes:
+            arcname = f"{base}_{sequencia}{extensao}"
+            sequencia += 1
+        return arcname
+
+    def _expirar(self, categoria: str, dias_arquivo: int) -> int:
+        """
+        Remove zips diários mais antigos que dias_arquivo
+
+        Args:
+            categoria: Nome da política
+            dias_arquivo: Idade máxima em dias
+
+        Returns:
+            Quantidade de zips removidos
+        """
+        destino_dir = os.path.join(self.arquivo_dir, categoria)
+        if not os.path.isdir(destino_dir):
+            return 0
+
+        limite = datetime.now().timestamp() - dias_arquivo * 86400
+        removidos = []
+
+        for nome in os.listdir(destino_dir):
+            if not (nome.startswith(f"{categoria}_") and nome.endswith('.zip')):
+                continue
+            try:
+                dia = datetime.strptime(nome[len(categoria) + 1:-4], '%Y%m%d')
+            except ValueError:
+                continue
+            if dia.timestamp() < limite:
+                os.remove(os.path.join(destino_dir, nome))
+                removidos.append(nome)
+
+        if removidos:
+            manifest = self.carregar_manifest(categoria)
+            manifest = {k: v for k, v in manifest.items() if v.get('zip') not in removidos}
+            self._salvar_manifest(categoria, manifest)
+
+        return len(removidos)
+
+    # ===== LEITURA =====
+
+    def listar_arquivados(self, categoria: str, padrao: str = '*') -> List[Dict]:
+        """
+        Lista os arquivos compactados de uma categoria (pelo manifest)
+
+        Args:
+            categoria: Nome da política
+            padrao: Padrão fnmatch do nome do arquivo
+
+        Returns:
+            Lista de dicts com 'chave' (para abrir_arquivado), 'nome', 'zip', 'arcname', 'mtime'
+            e 'tamanho', ordenada por mtime
+        """
+        manifest = self.carregar_manifest(categoria)
+        itens = [dict(info, chave=chave) for chave, info in manifest.items() if fnmatch.fnmatch(info['nome'], padrao)]
+        return sorted(itens, key=lambda i: i.get('mtime', ''))
+
+    def abrir_arquivado(self, categoria: str, nome: str) -> Optional[io.BytesIO]:
+        """
+        Lê um arquivo compactado para memória (ex: para RecargaAnalyzer.carregar_arquivo)
+
+        Args:
+            categoria: Nome da política
+            nome: Chave do manifest ('<zip>/<nome interno>', ver listar_arquivados) ou nome
+                  original do arquivo (havendo mais de um com o mesmo nome, o mais recente)
+
+        Returns:
+            BytesIO com o conteúdo, ou None se não estiver arquivado
+        """
+        manifest = self.carregar_manifest(categoria)
+        info = manifest.get(nome)
+        if info is None:
+            mesmos = [i for i in manifest.values() if i['nome'] == nome]
+            info = max(mesmos, key=lambda i: i.get('mtime', '')) if mesmos else None
+        if not info:
+            return None
+
+        zip_path = os.path.join(self.arquivo_dir, categoria, info['zip'])
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zf:
+                buffer = io.BytesIO(zf.read(info['arcname']))
+                buffer.name = info['nome']
+                return buffer
+        except Exception as e:
+            logger.error(f"Erro ao ler {nome} de {info['zip']}: {e}")
+            return None
+
+
+def aplicar_politicas(arquivo_dir: str, politicas: Dict) -> Dict:
+    """
+    Função auxiliar para aplicar todas as políticas configuradas
+
+    Args:
+        arquivo_dir: Diretório raiz dos arquivos compactados
+        politicas: Dict categoria -> política
+
+    Returns:
+        Dict categoria -> resumo retornado por GerenciadorRetencao.aplicar
+    """
+    gerenciador = GerenciadorRetencao(arquivo_dir)
+    resumos = {}
+
+    for categoria, politica in politicas.items():
+        try:
+            resumos[categoria] = gerenciador.aplicar(categoria, politica)
+        except Exception as e:
+            logger.error(f"Erro ao aplicar retenção [{categoria}]: {e}")
+
+    return resumos
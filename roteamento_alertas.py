@@ -0,0 +1,215 @@
+"""
+Módulo de Roteamento de Alertas
+Particiona o agregado Origem x Cod Resp da janela pelas regras de ROTAS_ALERTA,
+para que cada grupo de destinatários receba apenas os seus dados, com estado
+próprio por rota (independente do incidente do NOC)
+"""
+
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Set
+
+from estado_alarme import SEVERIDADE
+
+logger = logging.getLogger(__name__)
+
+
+# Métricas somadas por rota (mesmas colunas de agregado_origem_codigo)
+COLUNAS_METRICAS = ['total', 'negadas', 'n2', 'valor_total', 'valor_negado']
+
+
+def _pertinencia(valores: np.ndarray, filtro) -> np.ndarray:
+    """
+    Máscara das linhas cujo valor está no filtro (filtro vazio/None = todas)
+    """
+    if not filtro:
+        return np.ones(len(valores), dtype=bool)
+    return np.isin(valores, [str(v) for v in filtro])
+
+
+def particionar_por_rotas(agregado: pd.DataFrame, rotas: List[Dict],
+                          threshold_negadas: float, threshold_n2: float, top_n: int = 10) -> List[Dict]:
+    """
+    Calcula as métricas de todas as rotas em uma única passada sobre o agregado
+
+    Cada rota é um dict com 'nome', 'destinatarios' e, opcionalmente, 'origens',
+    'codigos' (None = todos) e 'severidade_minima' ('Normal', 'Alerta' ou 'Crítico').
+    Os totais de transações e de valor usam apenas o filtro de origens (o
+    denominador é o tráfego das origens da rota); negadas, N2 e valor negado
+    usam origens e códigos.
+
+    Args:
+        agregado: resultado['agregado_origem_codigo'] de RecargaAnalyzer.analisar()
+        rotas: Tabela de roteamento (config.ROTAS_ALERTA)
+        threshold_negadas: Threshold de negadas (%) do período
+        threshold_n2: Threshold de N2 (%)
+        top_n: Tamanho dos rankings de cada rota
+
+    Returns:
+        Lista de dicts por rota com métricas, nível, 'enviar' e, para as rotas
+        que serão enviadas, ranking_negadas, ranking_n2 e tabela_codigos
+    """
+    if agregado is None or len(agregado) == 0 or not rotas:
+        return []
+
+    origens = agregado['Origem'].astype(str).to_numpy()
+    codigos = agregado['Cod Resp'].astype(str).to_numpy()
+
+    # Matrizes de pertinência linha x rota
+    mascara_origem = np.column_stack([_pertinencia(origens, rota.get('origens')) for rota in rotas])
+    mascara_codigo = np.column_stack([_pertinencia(codigos, rota.get('codigos')) for rota in rotas])
+    mascara = mascara_origem & mascara_codigo
+
+    # Todas as rotas somadas de uma vez (rotas x métricas)
+    metricas = agregado[COLUNAS_METRICAS].to_numpy(dtype=float)
+    somas_origem = mascara_origem.T.astype(float) @ metricas
+    somas = mascara.T.astype(float) @ metricas
+
+    total = somas_origem[:, 0]
+    valor_total = somas_origem[:, 3]
+    negadas = somas[:, 1]
+    n2 = somas[:, 2]
+    valor_negado = somas[:, 4]
+
+    com_trafego = total > 0
+    perc_negadas = np.divide(negadas * 100, total, out=np.zeros_like(total), where=com_trafego)
+    perc_n2 = np.divide(n2 * 100, total, out=np.zeros_like(total), where=com_trafego)
+    niveis = np.where(perc_n2 >= threshold_n2, 'Crítico',
+                      np.where(perc_negadas >= threshold_negadas, 'Alerta', 'Normal'))
+
+    particoes = []
+    for j, rota in enumerate(rotas):
+        nivel = str(niveis[j])
+        minima = rota.get('severidade_minima', 'Alerta')
+        enviar = bool(negadas[j] > 0) and SEVERIDADE.get(nivel, 0) >= SEVERIDADE.get(minima, 1)
+
+        particao = {
+            'rota': rota.get('nome', f"Rota {j + 1}"),
+            'destinatarios': list(rota.get('destinatarios', [])),
+            'nivel_alarme': nivel,
+            'enviar': enviar,
+            'total_transacoes': int(total[j]),
+            'transacoes_negadas': int(negadas[j]),
+            'percentual_negadas': round(float(perc_negadas[j]), 2),
+            'transacoes_n2': int(n2[j]),
+            'percentual_n2': round(float(perc_n2[j]), 2),
+            'valor_total': round(float(valor_total[j]), 2),
+            'valor_negado': round(float(valor_negado[j]), 2),
+        }
+
+        # Tabelas só para quem vai receber e-mail
+        if enviar:
+            linhas = agregado.loc[mascara[:, j]]
+            particao['ranking_negadas'] = _ranking(linhas, 'negadas', 'Total Negadas', top_n)
+            particao['ranking_n2'] = _ranking(linhas, 'n2', 'Total N2', top_n)
+            particao['tabela_codigos'] = _tabela_codigos(linhas, top_n)
+
+        particoes.append(particao)
+
+    logger.info(f"Roteamento: {sum(p['enviar'] for p in particoes)} de {len(particoes)} rota(s) com alerta")
+    return particoes
+
+
+class EstadoRotas:
+    """
+    Último nível notificado de cada rota, persistido entre execuções
+
+    Uma rota é notificada quando a sua fatia atinge a severidade mínima e
+    quando sobe de severidade; enquanto continuar acima da severidade mínima
+    sem piorar, não recebe o mesmo alerta a cada janela. Quando a fatia fica
+    abaixo da severidade mínima, a rota volta ao início e a próxima ocorrência
+    é notificada. Envio que falhou não é registrado (nova tentativa na janela seguinte).
+    """
+
+    def __init__(self, caminho_estado: str):
+        """
+        Carrega o estado das rotas
+
+        Args:
+            caminho_estado: Arquivo JSON onde o estado é persistido
+        """
+        self.caminho_estado = caminho_estado
+        self.rotas: Dict[str, Dict] = {}
+
+        if os.path.exists(caminho_estado):
+            try:
+                with open(caminho_estado, 'r', encoding='utf-8') as f:
+                    self.rotas = json.load(f)
+            except Exception as e:
+                logger.error(f"Erro ao carregar estado das rotas, reiniciando: {e}")
+
+    def a_notificar(self, particao: Dict) -> bool:
+        """
+        Verifica se a rota deve receber e-mail nesta janela
+
+        Args:
+            particao: Item retornado por particionar_por_rotas()
+
+        Returns:
+            True na primeira janela acima da severidade mínima ou em escalonamento
+        """
+        if not particao['enviar']:
+            return False
+        notificado = self.rotas.get(particao['rota'], {}).get('nivel')
+        return notificado is None or SEVERIDADE.get(particao['nivel_alarme'], 0) > SEVERIDADE.get(notificado, 0)
+
+    def atualizar(self, particoes: List[Dict], notificadas: Set[str]):
+        """
+        Registra os envios da janela e reinicia as rotas abaixo da severidade mínima
+
+        Args:
+            particoes: Retorno de particionar_por_rotas()
+            notificadas: Nomes das rotas cujo e-mail foi enviado com sucesso
+        """
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for particao in particoes:
+            nome = particao['rota']
+            if not particao['enviar']:
+                self.rotas.pop(nome, None)
+            elif nome in notificadas:
+                self.rotas[nome] = {'nivel': particao['nivel_alarme'], 'notificado_em': agora}
+        self._salvar()
+
+    def _salvar(self):
+        """
+        Persiste o estado de forma atômica (arquivo temporário + rename)
+        """
+        diretorio = os.path.dirname(self.caminho_estado)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        tmp_path = f"{self.caminho_estado}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.rotas, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.caminho_estado)
+
+
+def _ranking(linhas: pd.DataFrame, coluna: str, titulo: str, top_n: int) -> pd.DataFrame:
+    """
+    Ranking de origens de uma rota (mesmo formato de RecargaAnalyzer.gerar_ranking_*)
+    """
+    por_origem = linhas.groupby('Origem', sort=False)[coluna].sum()
+    por_origem = por_origem[por_origem > 0].sort_values(ascending=False).head(top_n)
+    if len(por_origem) == 0:
+        return pd.DataFrame()
+
+    ranking = pd.DataFrame({'Origem': por_origem.index, titulo: por_origem.values.astype(int)})
+    ranking.index = ranking.index + 1  # Começar do 1
+    return ranking
+
+
+def _tabela_codigos(linhas: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    """
+    Distribuição de códigos de resposta de uma rota
+    """
+    por_codigo = linhas.groupby('Cod Resp', sort=False)[['total', 'negadas']].sum()
+    por_codigo = por_codigo.sort_values('total', ascending=False).head(top_n)
+    return pd.DataFrame({
+        'Código': por_codigo.index.astype(str),
+        'Quantidade': por_codigo['total'].astype(int).values,
+        'Negadas': por_codigo['negadas'].astype(int).values,
+    })
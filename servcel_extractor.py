@@ -8,12 +8,13 @@ import os
 import sys
 import time
 import logging
+import threading
 from datetime import datetime, timedelta
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
 
 # ===== CONFIGURAÇÃO DE LOGGING =====
@@ -57,11 +58,88 @@ except ImportError:
     logger.error("Crie o arquivo config.py com as credenciais corretas.")
     sys.exit(1)
 
+# ===== CONFIGURAÇÕES OPCIONAIS =====
+# Parâmetros adicionados depois da primeira versão têm valor padrão,
+# para que um config.py antigo continue funcionando
+import config as _config
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORICO_DB_PATH = getattr(_config, 'HISTORICO_DB_PATH', os.path.join(_BASE_DIR, "historico", "historico_janelas.db"))
+ALARME_ESTADO_PATH = getattr(_config, 'ALARME_ESTADO_PATH', os.path.join(_BASE_DIR, "historico", "estado_alarme.json"))
+ALARME_FATOR_HISTERESE = getattr(_config, 'ALARME_FATOR_HISTERESE', 0.8)
+ALARME_JANELAS_PARA_RESOLVER = getattr(_config, 'ALARME_JANELAS_PARA_RESOLVER', 2)
+EMAIL_GRAFICOS_INLINE = getattr(_config, 'EMAIL_GRAFICOS_INLINE', 'html')
+ARQUIVO_DIR = getattr(_config, 'ARQUIVO_DIR', os.path.join(_BASE_DIR, "arquivo"))
+RETENCAO_POLITICAS = getattr(_config, 'RETENCAO_POLITICAS', {})
+ARQUIVO_TRANSACOES_DIR = getattr(_config, 'ARQUIVO_TRANSACOES_DIR', None)
+DIGEST_ATIVO = getattr(_config, 'DIGEST_ATIVO', False)
+DIGEST_INTERVALO_MINUTOS = getattr(_config, 'DIGEST_INTERVALO_MINUTOS', 120)
+ROTAS_ALERTA = getattr(_config, 'ROTAS_ALERTA', [])
+ROTAS_ESTADO_PATH = getattr(_config, 'ROTAS_ESTADO_PATH', os.path.join(_BASE_DIR, "historico", "estado_rotas.json"))
+EMAIL_LIMITES_LINHAS = getattr(_config, 'EMAIL_LIMITES_LINHAS', None)
+EMAIL_LIMITE_BYTES = getattr(_config, 'EMAIL_LIMITE_BYTES', 95_000)
+EMAIL_LIMITE_ANEXOS_MB = getattr(_config, 'EMAIL_LIMITE_ANEXOS_MB', 10.0)
+EMAIL_COMPACTAR_ANEXOS = getattr(_config, 'EMAIL_COMPACTAR_ANEXOS', False)
+EMAIL_ANEXAR_GRAFICOS = getattr(_config, 'EMAIL_ANEXAR_GRAFICOS', True)
+EMAIL_OUTBOX_DIR = getattr(_config, 'EMAIL_OUTBOX_DIR', None)
+EMAIL_USAR_TLS = getattr(_config, 'EMAIL_USAR_TLS', True)
+DB_LOADER_ATIVO = getattr(_config, 'DB_LOADER_ATIVO', False)
+DB_BACKEND = getattr(_config, 'DB_BACKEND', 'mysql')
+DB_SQLITE_PATH = getattr(_config, 'DB_SQLITE_PATH', os.path.join(_BASE_DIR, "historico", "recargas.db"))
+ALERTA_DUAS_FASES = getattr(_config, 'ALERTA_DUAS_FASES', True)
+ALERTA_TIMEOUT_RELATORIO_S = getattr(_config, 'ALERTA_TIMEOUT_RELATORIO_S', 600)
+VOLUME_ATIVO = getattr(_config, 'VOLUME_ATIVO', False)
+VOLUME_MIN_SEMANAS = getattr(_config, 'VOLUME_MIN_SEMANAS', 4)
+VOLUME_Z_LIMITE = getattr(_config, 'VOLUME_Z_LIMITE', 3.0)
+VOLUME_FATOR_QUEDA = getattr(_config, 'VOLUME_FATOR_QUEDA', 0.5)
+VOLUME_FATOR_CRITICO = getattr(_config, 'VOLUME_FATOR_CRITICO', 0.2)
+VOLUME_MINIMO_ORIGEM = getattr(_config, 'VOLUME_MINIMO_ORIGEM', 20)
+CO_FALHAS_ATIVO = getattr(_config, 'CO_FALHAS_ATIVO', False)
+CO_FALHAS_PATH = getattr(_config, 'CO_FALHAS_PATH', os.path.join(_BASE_DIR, "historico", "co_falhas.npz"))
+CO_FALHAS_JANELAS = getattr(_config, 'CO_FALHAS_JANELAS', 336)
+CO_FALHAS_CORRELACAO = getattr(_config, 'CO_FALHAS_CORRELACAO', 0.7)
+COMPARATIVO_ATIVO = getattr(_config, 'COMPARATIVO_ATIVO', True)
+COMPARATIVO_TOLERANCIA_MIN = getattr(_config, 'COMPARATIVO_TOLERANCIA_MIN', 5)
+CUBO_DIR = getattr(_config, 'CUBO_DIR', None)
+PORTAL_TELEMETRIA_ATIVO = getattr(_config, 'PORTAL_TELEMETRIA_ATIVO', True)
+PORTAL_ALERTA_ATIVO = getattr(_config, 'PORTAL_ALERTA_ATIVO', False)
+PORTAL_AMOSTRAS_BASE = getattr(_config, 'PORTAL_AMOSTRAS_BASE', 336)
+PORTAL_MIN_AMOSTRAS = getattr(_config, 'PORTAL_MIN_AMOSTRAS', 10)
+PORTAL_FATOR_LENTIDAO = getattr(_config, 'PORTAL_FATOR_LENTIDAO', 2.0)
+PORTAL_MINIMO_S = getattr(_config, 'PORTAL_MINIMO_S', 5.0)
+PORTAL_EXECUCOES_DEGRADADAS = getattr(_config, 'PORTAL_EXECUCOES_DEGRADADAS', 2)
+ESPERA_PERCENTIL = getattr(_config, 'ESPERA_PERCENTIL', 99)
+ESPERA_MARGEM = getattr(_config, 'ESPERA_MARGEM', 1.5)
+ESPERA_MINIMO_S = getattr(_config, 'ESPERA_MINIMO_S', 5.0)
+ESPERA_MAXIMO_S = getattr(_config, 'ESPERA_MAXIMO_S', 120.0)
+ESPERA_MIN_AMOSTRAS = getattr(_config, 'ESPERA_MIN_AMOSTRAS', 20)
+ESPERA_EXTENSAO_S = getattr(_config, 'ESPERA_EXTENSAO_S', 10.0)
+SLO_DETECCAO_S = getattr(_config, 'SLO_DETECCAO_S', 600)
+TELEGRAM_ATIVO = getattr(_config, 'TELEGRAM_ATIVO', False)
+TELEGRAM_TOKEN = getattr(_config, 'TELEGRAM_TOKEN', None)
+TELEGRAM_CHAT_ID = getattr(_config, 'TELEGRAM_CHAT_ID', None)
+TELEGRAM_API_URL = getattr(_config, 'TELEGRAM_API_URL', "https://api.telegram.org")
+TELEGRAM_TIMEOUT_S = getattr(_config, 'TELEGRAM_TIMEOUT_S', 10)
+
 # ===== IMPORTAR MÓDULOS DE ALARMÍSTICA =====
 try:
     from recarga_analyzer import RecargaAnalyzer
     from email_sender import EmailSender
     from report_generator import gerar_relatorio_completo
+    from historico_janelas import HistoricoJanelas
+    from estado_alarme import MaquinaEstadoAlarme, ESTADOS_ATIVOS, ESTADO_ESCALADO
+    from digest_alertas import DigestAlertas
+    from telegram_notifier import TelegramNotifier
+    from slo_latencia import MarcosExecucao
+    from volume_esperado import ModeloVolume
+    from co_falhas import MatrizFalhas, agrupar_co_falhas
+    from comparativo import montar_comparativo
+    from cubo_recargas import nome_arquivo as nome_arquivo_cubo
+    from telemetria_portal import MedicoesPortal, TelemetriaPortal
+    from politica_espera import PoliticaEspera
+    from retencao import aplicar_politicas
+    from email_outbox import CaixaSaida
+    from roteamento_alertas import particionar_por_rotas, EstadoRotas
     logger.info("Módulos de alarmística carregados com sucesso")
 except ImportError as e:
     logger.error(f"Erro ao importar módulos de alarmística: {e}")
@@ -104,6 +182,8 @@ def calcular_periodo():
         'hora_final': hora_final,
         'minuto_inicial': minuto_inicial,
         'minuto_final': minuto_final,
+        'inicio': inicio.replace(second=0, microsecond=0),
+        'fim': agora.replace(second=0, microsecond=0),
         'periodo_completo': f"{data_inicial} - {hora_inicial}h{minuto_inicial} até {hora_final}h{minuto_final}"
     }
 
@@ -143,19 +223,27 @@ def fazer_login(driver):
     logger.info("Iniciando login...")
 
     try:
+        disparar_etapa_portal('login')
         driver.get(URL_BASE)
-        time.sleep(3)
 
         # Preencher credenciais
-        username_field = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "username"))
-        )
+        username_field = aguardar_etapa_portal(driver, 'login', EC.presence_of_element_located((By.ID, "username")))
+        aguardar_condicao(driver, EC.element_to_be_clickable((By.ID, "kc-login")))
         username_field.send_keys(LOGIN)
 
         driver.find_element(By.ID, "password").send_keys(SENHA)
+        disparar_etapa_portal('menu')
         driver.find_element(By.ID, "kc-login").click()
 
-        time.sleep(5)
+        # Menu ServCel (login aceito) ou formulário devolvido com erro (login recusado)
+        try:
+            aguardar_etapa_portal(
+                driver, 'menu',
+                lambda d: d.find_elements(By.XPATH, "//a[contains(text(), 'ServCel')]")
+                or "login-actions/authenticate" in d.current_url
+            )
+        except TimeoutException:
+            logger.warning("Menu do portal não apareceu após o login")
 
         # Verificar se login foi bem-sucedido
         if "login-actions/authenticate" in driver.current_url:
@@ -178,20 +266,20 @@ def navegar_transacoes(driver):
 
     try:
         # Hover no menu ServCel
-        servcel_link = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, "//a[contains(text(), 'ServCel')]"))
+        servcel_link = aguardar_condicao(
+            driver, EC.presence_of_element_located((By.XPATH, "//a[contains(text(), 'ServCel')]")), 'menu'
         )
 
         actions = ActionChains(driver)
         actions.move_to_element(servcel_link).perform()
-        time.sleep(2)
 
-        # Clicar em Transações
-        transacao_link = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, "//a[contains(text(), 'Transações') or contains(text(), 'Transacao')]"))
+        # Clicar em Transações (submenu visível após o hover)
+        transacao_link = aguardar_condicao(
+            driver, EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Transações') or contains(text(), 'Transacao')]"))
         )
+        disparar_etapa_portal('transacoes')
         transacao_link.click()
-        time.sleep(5)
+        aguardar_etapa_portal(driver, 'transacoes', EC.presence_of_element_located((By.ID, "initialDate")))
 
         logger.info("Página de transações acessada")
         return True
@@ -201,6 +289,44 @@ def navegar_transacoes(driver):
         return False
 
 
+def valor_aplicado(elemento, esperado: str):
+    """
+    Condição de espera: o campo contém o valor esperado (compara só os dígitos, os campos têm máscara)
+
+    Args:
+        elemento: Campo do formulário
+        esperado: Valor preenchido (ex: "14:30")
+    """
+    digitos = ''.join(c for c in esperado if c.isdigit())
+    return lambda d: ''.join(c for c in (elemento.get_attribute('value') or '') if c.isdigit()) == digitos
+
+
+def preencher_hora(driver, campo_id: str, valor: str):
+    """
+    Digita a hora no campo com máscara (HH:MM) e aguarda o valor ser aplicado
+
+    Args:
+        driver: WebDriver
+        campo_id: ID do campo (initialHour/finalHour)
+        valor: Hora no formato HH:MM
+    """
+    campo = aguardar_condicao(driver, EC.presence_of_element_located((By.ID, campo_id)))
+
+    # Scroll até o elemento e garantir que está visível
+    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", campo)
+    aguardar_condicao(driver, EC.element_to_be_clickable((By.ID, campo_id)))
+
+    # Usar ActionChains para interagir
+    actions = ActionChains(driver)
+    actions.move_to_element(campo).click().perform()
+    aguardar_condicao(driver, lambda d: d.switch_to.active_element == campo)
+
+    # Digitar no formato HH:MM usando ActionChains
+    logger.info(f"Digitando {campo_id}: {valor}")
+    actions.send_keys(valor).perform()
+    aguardar_condicao(driver, valor_aplicado(campo, valor))
+
+
 def preencher_formulario(driver, periodo):
     """
     Preenche o formulário de busca com data/hora
@@ -208,84 +334,33 @@ def preencher_formulario(driver, periodo):
     logger.info("Preenchendo formulário de busca...")
 
     try:
-        time.sleep(3)
-
         # Aguardar página carregar
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "initialDate"))
-        )
-        time.sleep(1)
+        aguardar_condicao(driver, EC.element_to_be_clickable((By.ID, "initialDate")), 'transacoes')
 
         # Campos de data usando JavaScript (os campos têm máscara/validação)
-        # Data inicial
-        data_inicial_valor = periodo['data_inicial']
-        driver.execute_script(
-            "document.getElementById('initialDate').value = arguments[0];"
-            "document.getElementById('initialDate').dispatchEvent(new Event('input', { bubbles: true }));"
-            "document.getElementById('initialDate').dispatchEvent(new Event('change', { bubbles: true }));",
-            data_inicial_valor
-        )
-        logger.info(f"Data inicial: {data_inicial_valor}")
-        time.sleep(1)
-
-        # Data final
-        data_final_valor = periodo['data_final']
-        driver.execute_script(
-            "document.getElementById('finalDate').value = arguments[0];"
-            "document.getElementById('finalDate').dispatchEvent(new Event('input', { bubbles: true }));"
-            "document.getElementById('finalDate').dispatchEvent(new Event('change', { bubbles: true }));",
-            data_final_valor
-        )
-        logger.info(f"Data final: {data_final_valor}")
-        time.sleep(1)
+        for campo_id, valor in (('initialDate', periodo['data_inicial']), ('finalDate', periodo['data_final'])):
+            driver.execute_script(
+                "document.getElementById(arguments[1]).value = arguments[0];"
+                "document.getElementById(arguments[1]).dispatchEvent(new Event('input', { bubbles: true }));"
+                "document.getElementById(arguments[1]).dispatchEvent(new Event('change', { bubbles: true }));",
+                valor, campo_id
+            )
+            aguardar_condicao(driver, valor_aplicado(driver.find_element(By.ID, campo_id), valor))
+            logger.info(f"{'Data inicial' if campo_id == 'initialDate' else 'Data final'}: {valor}")
 
         # Campos de hora - Digitar com os dois pontos (formato HH:MM)
         try:
-            # Hora inicial
-            logger.info("Preenchendo hora inicial...")
-            hora_inicial_input = driver.find_element(By.ID, "initialHour")
-
-            # Scroll até o elemento e garantir que está visível
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", hora_inicial_input)
-            time.sleep(0.5)
-
-            # Usar ActionChains para interagir
-            actions = ActionChains(driver)
-            actions.move_to_element(hora_inicial_input).click().perform()
-            time.sleep(0.5)
-
-            # Digitar no formato HH:MM usando ActionChains
             hora_inicial_valor = f"{periodo['hora_inicial']}:{periodo['minuto_inicial']}"
-            logger.info(f"Digitando hora inicial: {hora_inicial_valor}")
-            actions.send_keys(hora_inicial_valor).perform()
-
+            preencher_hora(driver, "initialHour", hora_inicial_valor)
             logger.info(f"✅ Hora inicial preenchida: {hora_inicial_valor}")
-            time.sleep(1)
         except Exception as e:
             logger.error(f"❌ ERRO ao preencher hora inicial: {e}")
             raise
 
         try:
-            # Hora final
-            logger.info("Preenchendo hora final...")
-            hora_final_input = driver.find_element(By.ID, "finalHour")
-
-            # Scroll até o elemento
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", hora_final_input)
-            time.sleep(0.5)
-
-            # Usar ActionChains para interagir
-            actions = ActionChains(driver)
-            actions.move_to_element(hora_final_input).click().perform()
-            time.sleep(0.5)
-
-            # Digitar no formato HH:MM usando ActionChains
             hora_final_valor = f"{periodo['hora_final']}:{periodo['minuto_final']}"
-            logger.info(f"Digitando hora final: {hora_final_valor}")
-            actions.send_keys(hora_final_valor).perform()
-
+            preencher_hora(driver, "finalHour", hora_final_valor)
             logger.info(f"✅ Hora final preenchida: {hora_final_valor}")
-            time.sleep(1)
         except Exception as e:
             logger.error(f"❌ ERRO ao preencher hora final: {e}")
             raise
@@ -308,15 +383,19 @@ def executar_pesquisa(driver):
 
     try:
         # Procurar e clicar no botão Pesquisar
-        pesquisar_button = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, "//button[contains(text(), 'Pesquisar')]"))
+        pesquisar_button = aguardar_condicao(
+            driver, EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Pesquisar')]"))
         )
 
+        disparar_etapa_portal('pesquisa')
         pesquisar_button.click()
         logger.info("Pesquisa iniciada")
 
-        # Aguardar resultados
-        time.sleep(10)
+        # Aguardar resultados (botão Exportar habilitado)
+        aguardar_etapa_portal(
+            driver, 'pesquisa',
+            EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Exportar') or contains(text(), 'Export')]"))
+        )
         logger.info("Resultados carregados")
 
         return True
@@ -326,6 +405,34 @@ def executar_pesquisa(driver):
         return False
 
 
+def export_concluido(desde: float):
+    """
+    Condição de espera: export gravado no DOWNLOAD_DIR após o clique e sem download parcial
+
+    Só contam arquivos modificados a partir do clique: um .crdownload abandonado
+    por uma execução anterior (Chrome derrubado) não bloqueia a espera.
+
+    Args:
+        desde: time.time() do clique em Exportar
+
+    Returns:
+        Condição que devolve o nome do arquivo (ou False enquanto não concluído)
+    """
+    def _condicao(driver):
+        recentes = []
+        for f in os.listdir(DOWNLOAD_DIR):
+            try:
+                if os.path.getmtime(os.path.join(DOWNLOAD_DIR, f)) >= desde - 1:
+                    recentes.append(f)
+            except OSError:
+                continue  # parcial renomeado/removido entre o listdir e o stat
+        if any(f.endswith(('.crdownload', '.tmp')) for f in recentes):
+            return False
+        novos = [f for f in recentes if f.endswith(('.xlsx', '.xls')) and 'Transacao' in f]
+        return novos[0] if novos else False
+    return _condicao
+
+
 def exportar_relatorio(driver):
     """
     Clica no botão Exportar e baixa o arquivo
@@ -333,19 +440,21 @@ def exportar_relatorio(driver):
     logger.info("Procurando botão Exportar...")
 
     try:
-        time.sleep(3)
-
         # Procurar botão Exportar
-        exportar_button = WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.XPATH, "//button[contains(text(), 'Exportar') or contains(text(), 'Export')]"))
+        exportar_button = aguardar_condicao(
+            driver, EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Exportar') or contains(text(), 'Export')]")),
+            'pesquisa'
         )
 
         logger.info("Botão Exportar encontrado")
+        disparar_etapa_portal('download')
+        clique = time.time()
         exportar_button.click()
         logger.info("Download iniciado")
 
         # Aguardar download
-        time.sleep(15)
+        arquivo = aguardar_etapa_portal(driver, 'download', export_concluido(clique))
+        logger.info(f"Download concluído: {arquivo}")
 
         return True
 
@@ -371,6 +480,8 @@ def verificar_download():
             tamanho = os.path.getsize(os.path.join(DOWNLOAD_DIR, arquivo_recente))
 
             logger.info(f"Arquivo baixado: {arquivo_recente} ({tamanho} bytes)")
+            if _portal is not None and not _portal.registrar_export(os.path.join(DOWNLOAD_DIR, arquivo_recente)):
+                logger.warning(f"{arquivo_recente} é anterior ao clique em Exportar (export de outra execução?)")
             return arquivo_recente
         else:
             logger.warning("Nenhum arquivo Excel encontrado")
@@ -381,13 +492,939 @@ def verificar_download():
         return None
 
 
-def analisar_e_alertar(arquivo_path: str, periodo: dict) -> bool:
+def registrar_historico(resultado: dict, periodo: dict, periodo_dia: str) -> bool:
+    """
+    Grava os agregados da janela no histórico (falha não interrompe a alarmística)
+
+    Args:
+        resultado: Resultado da análise
+        periodo: Dicionário com informações do período analisado
+        periodo_dia: Período do dia ('manha', 'tarde', 'noite', 'madrugada')
+
+    Returns:
+        True se gravou com sucesso
+    """
+    try:
+        historico = HistoricoJanelas(HISTORICO_DB_PATH)
+        try:
+            return historico.registrar_janela(resultado, periodo['inicio'], periodo['fim'], periodo_dia)
+        finally:
+            historico.fechar()
+    except Exception as e:
+        logger.error(f"Erro ao registrar histórico da janela: {e}")
+        return False
+
+
+def arquivar_transacoes(analyzer: RecargaAnalyzer, periodo: dict) -> bool:
+    """
+    Anexa as transações da janela ao arquivo Parquet particionado (opcional)
+
+    Args:
+        analyzer: Analisador com a janela carregada
+        periodo: Dicionário com informações do período analisado
+
+    Returns:
+        True se gravou com sucesso
+    """
+    if not ARQUIVO_TRANSACOES_DIR:
+        return False
+
+    try:
+        from arquivo_transacoes import ArquivoTransacoes
+        ArquivoTransacoes(ARQUIVO_TRANSACOES_DIR).anexar_janela(analyzer.df, periodo['fim'])
+        return True
+    except ImportError as e:
+        logger.warning(f"Arquivo de transações desativado: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Erro ao arquivar transações da janela: {e}")
+        return False
+
+
+def salvar_cubo(resultado: dict, periodo: dict) -> bool:
+    """
+    Grava o cubo Origem x Cod Resp x Estado x bucket da janela em CUBO_DIR (opcional)
+
+    Os cubos gravados são combinados por cubo_recargas.py para consultas
+    de várias janelas sem reler os exports.
+
+    Args:
+        resultado: Resultado da análise (com 'cubo')
+        periodo: Dicionário com informações do período analisado
+
+    Returns:
+        True se gravou com sucesso
+    """
+    if not CUBO_DIR or resultado.get('cubo') is None:
+        return False
+
+    try:
+        resultado['cubo'].salvar(os.path.join(CUBO_DIR, nome_arquivo_cubo(periodo['fim'])))
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao gravar o cubo da janela: {e}")
+        return False
+
+
+def carregar_banco(analyzer: RecargaAnalyzer, resultado: dict, periodo: dict) -> bool:
+    """
+    Grava transações e agregados da janela no banco de dados (opcional)
+
+    Args:
+        analyzer: Analisador com a janela carregada
+        resultado: Resultado da análise
+        periodo: Dicionário com informações do período analisado
+
+    Returns:
+        True se gravou com sucesso
+    """
+    if not DB_LOADER_ATIVO:
+        return False
+
+    try:
+        from db_loader import CarregadorBanco
+        carregador = CarregadorBanco(
+            backend=DB_BACKEND,
+            host=getattr(_config, 'DB_HOST', None),
+            user=getattr(_config, 'DB_USER', None),
+            password=getattr(_config, 'DB_PASSWORD', None),
+            database=getattr(_config, 'DB_NAME', None),
+            sqlite_path=DB_SQLITE_PATH,
+        )
+        return carregador.carregar_janela(analyzer.df, resultado, periodo['inicio'], periodo['fim'])
+    except ImportError as e:
+        logger.warning(f"Carga em banco desativada: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Erro ao carregar janela no banco: {e}")
+        return False
+
+
+def formatar_periodo_texto(periodo: dict) -> str:
+    """
+    Formata o período para exibição no e-mail (ex: "14h às 14h30")
+
+    Args:
+        periodo: Dicionário com informações do período analisado
+
+    Returns:
+        Texto do período
+    """
+    hora_ini = f"{periodo['hora_inicial']}h{periodo['minuto_inicial']}" if periodo['minuto_inicial'] != '00' else f"{periodo['hora_inicial']}h"
+    hora_fim = f"{periodo['hora_final']}h{periodo['minuto_final']}" if periodo['minuto_final'] != '00' else f"{periodo['hora_final']}h"
+    return f"{hora_ini} às {hora_fim}"
+
+
+# Caixa de saída da execução atual (None = envio síncrono)
+_caixa_saida = None
+
+
+def iniciar_caixa_saida():
+    """
+    Cria a caixa de saída em disco e inicia o worker de envio (se configurada)
+
+    O worker começa drenando mensagens que ficaram na fila em execuções anteriores.
+    """
+    global _caixa_saida
+
+    if not EMAIL_OUTBOX_DIR:
+        return
+
+    try:
+        _caixa_saida = CaixaSaida(
+            diretorio=EMAIL_OUTBOX_DIR,
+            smtp_server=EMAIL_SMTP_SERVER,
+            smtp_port=EMAIL_SMTP_PORT,
+            smtp_user=EMAIL_USER,
+            smtp_password=EMAIL_PASSWORD,
+            usar_tls=EMAIL_USAR_TLS,
+            ao_enviar=registrar_entrega
+        )
+        pendentes = len(_caixa_saida.listar())
+        if pendentes:
+            logger.info(f"Caixa de saída: {pendentes} e-mail(s) pendente(s) de execuções anteriores")
+        _caixa_saida.iniciar_worker()
+    except Exception as e:
+        logger.error(f"Erro ao iniciar caixa de saída, usando envio direto: {e}")
+        _caixa_saida = None
+
+
+def finalizar_caixa_saida():
+    """
+    Para o worker de envio após uma última drenagem (pendentes ficam para a próxima execução)
+    """
+    global _caixa_saida
+
+    if _caixa_saida is None:
+        return
+
+    try:
+        resumo = _caixa_saida.parar_worker()
+        if resumo['pendentes']:
+            logger.warning(f"Caixa de saída: {resumo['pendentes']} e-mail(s) ficaram para a próxima execução")
+    except Exception as e:
+        logger.error(f"Erro ao finalizar caixa de saída: {e}")
+    finally:
+        _caixa_saida = None
+
+
+# Marcos de tempo da execução atual (latência de detecção)
+_execucao = None
+
+
+def iniciar_execucao(periodo: dict):
+    """
+    Inicia o registro dos marcos de tempo da execução
+
+    Args:
+        periodo: Período calculado (usa o fim da janela como referência)
+    """
+    global _execucao
+    _execucao = MarcosExecucao(periodo['fim'])
+
+
+def marcar_etapa(etapa: str, momento: datetime = None, canal: str = None):
+    """
+    Registra um marco da execução atual (sem efeito fora de main)
+
+    Args:
+        etapa: Etapa de slo_latencia.ETAPAS
+        momento: Horário da etapa (padrão: agora)
+        canal: Canal da primeira notificação
+    """
+    if _execucao is not None:
+        _execucao.marcar(etapa, momento, canal)
+
+
+# E-mails enfileirados na caixa de saída: marcos aguardando a entrega e entregas
+# ainda não reclamadas (o worker pode entregar antes de marcar_envio ser chamado)
+_marcos_fila = {}
+_entregas_fila = {}
+_lock_fila = threading.Lock()
+
+
+def marcar_envio(sender: EmailSender, etapa: str, canal: str = None):
+    """
+    Registra o marco de um e-mail enviado pelo sender
+
+    Com a caixa de saída, o marco usa o horário em que o worker entregou a
+    mensagem ao SMTP (registrar_entrega), e não o da entrada na fila; mensagem
+    que não sai nesta execução fica sem o marco.
+
+    Args:
+        sender: EmailSender usado no envio
+        etapa: Etapa de slo_latencia.ETAPAS
+        canal: Canal da primeira notificação
+    """
+    id_fila = sender.ultimo_enfileirado
+    if id_fila is None:
+        marcar_etapa(etapa, canal=canal)
+        return
+
+    with _lock_fila:
+        momento = _entregas_fila.get(id_fila)
+        if momento is None:
+            _marcos_fila.setdefault(id_fila, []).append((etapa, canal))
+            return
+    marcar_etapa(etapa, momento, canal)
+
+
+def registrar_entrega(id_fila: str, momento: datetime):
+    """
+    Callback da caixa de saída: aplica os marcos da mensagem entregue ao SMTP
+
+    Args:
+        id_fila: Id da mensagem na caixa de saída
+        momento: Horário em que o SMTP aceitou a mensagem
+    """
+    with _lock_fila:
+        pendentes = _marcos_fila.pop(id_fila, None)
+        if pendentes is None:
+            _entregas_fila[id_fila] = momento
+            return
+    for etapa, canal in pendentes:
+        marcar_etapa(etapa, momento, canal)
+
+
+def finalizar_execucao():
+    """
+    Grava os marcos da execução no histórico (falha não interrompe a alarmística)
+    """
+    global _execucao
+    with _lock_fila:
+        _marcos_fila.clear()
+        _entregas_fila.clear()
+    if _execucao is None:
+        return
+
+    try:
+        historico = HistoricoJanelas(HISTORICO_DB_PATH)
+        try:
+            _execucao.registrar(historico)
+            atraso = _execucao.latencia_s('primeira_notificacao')
+            if atraso is not None and SLO_DETECCAO_S and atraso > SLO_DETECCAO_S:
+                logger.warning(f"Primeira notificação {atraso:.0f}s após o fim da janela (alvo: {SLO_DETECCAO_S}s)")
+        finally:
+            historico.fechar()
+    except Exception as e:
+        logger.error(f"Erro ao registrar marcos da execução: {e}")
+    finally:
+        _execucao = None
+
+
+# Medições do portal da execução atual (tempo por etapa e export) e seu período
+_portal = None
+_portal_periodo = None
+
+
+def iniciar_telemetria_portal(periodo: dict):
+    """
+    Inicia as medições de latência do portal da execução
+
+    Args:
+        periodo: Período calculado (o fim da janela identifica a execução)
+    """
+    global _portal, _portal_periodo
+    if PORTAL_TELEMETRIA_ATIVO:
+        _portal = MedicoesPortal(periodo['fim'])
+        _portal_periodo = periodo
+
+
+# Política de espera da execução atual (timeouts por etapa calibrados pela telemetria)
+_espera = None
+
+
+def iniciar_politica_espera():
+    """
+    Calibra os timeouts das etapas do portal com a latência registrada nas execuções anteriores
+
+    Sem telemetria (ou com falha ao ler o histórico) ficam os timeouts padrão.
+    """
+    global _espera
+    _espera = PoliticaEspera(
+        margem=ESPERA_MARGEM,
+        percentil=ESPERA_PERCENTIL,
+        minimo_s=ESPERA_MINIMO_S,
+        maximo_s=ESPERA_MAXIMO_S,
+        min_amostras=ESPERA_MIN_AMOSTRAS,
+        extensao_s=ESPERA_EXTENSAO_S
+    )
+    if PORTAL_TELEMETRIA_ATIVO:
+        try:
+            _espera.calibrar_banco(HISTORICO_DB_PATH, PORTAL_AMOSTRAS_BASE)
+        except Exception as e:
+            logger.error(f"Erro ao calibrar esperas do portal, usando timeouts padrão: {e}")
+    logger.info(f"Timeouts do portal: {_espera.resumo()}")
+
+
+def aguardar_condicao(driver, condicao, etapa: str = 'interacao'):
+    """
+    Aguarda uma condição com o timeout da política de espera (padrão fora de main)
+
+    Args:
+        driver: WebDriver
+        condicao: Condição do WebDriverWait
+        etapa: Etapa de telemetria_portal.ETAPAS_PORTAL ou 'interacao' (esperas curtas do formulário)
+
+    Returns:
+        Retorno da condição
+    """
+    politica = _espera if _espera is not None else PoliticaEspera()
+    return politica.aguardar(driver, etapa, condicao)
+
+
+def disparar_etapa_portal(etapa: str):
+    """
+    Marca a navegação/clique que inicia uma etapa do portal (sem efeito fora de main)
+
+    Args:
+        etapa: Etapa de telemetria_portal.ETAPAS_PORTAL
+    """
+    if _portal is not None:
+        _portal.disparar(etapa)
+
+
+def aguardar_etapa_portal(driver, etapa: str, condicao):
+    """
+    Espera da etapa do portal que registra o tempo até a condição ser atendida (ou o timeout)
+
+    Args:
+        driver: WebDriver
+        etapa: Etapa de telemetria_portal.ETAPAS_PORTAL
+        condicao: Condição do WebDriverWait (ex: EC.presence_of_element_located(...))
+
+    Returns:
+        Retorno da condição (ex: o elemento encontrado)
+
+    Raises:
+        TimeoutException: Condição não atendida no prazo (registrada como falha da etapa)
+    """
+    inicio = time.monotonic()
+    try:
+        retorno = aguardar_condicao(driver, condicao, etapa)
+    except TimeoutException:
+        if _portal is not None:
+            _portal.falhar(etapa)
+        raise
+
+    if _portal is not None:
+        segundos = _portal.concluir(etapa, inicio)
+        logger.info(f"Portal: {etapa} em {segundos:.1f}s")
+    return retorno
+
+
+def finalizar_telemetria_portal():
+    """
+    Grava as medições do portal e alerta quando o nível (Normal/Degradado) muda
+
+    Falha não interrompe a alarmística. Execuções que não chegaram ao portal
+    (ex: erro ao iniciar o Chrome) não são gravadas.
+    """
+    global _portal, _portal_periodo
+    if _portal is None:
+        return
+
+    try:
+        if not _portal.segundos and _portal.etapa_falha is None:
+            return
+
+        telemetria = TelemetriaPortal(
+            HISTORICO_DB_PATH,
+            amostras_base=PORTAL_AMOSTRAS_BASE,
+            min_amostras=PORTAL_MIN_AMOSTRAS,
+            fator=PORTAL_FATOR_LENTIDAO,
+            minimo_s=PORTAL_MINIMO_S,
+            execucoes_para_degradar=PORTAL_EXECUCOES_DEGRADADAS
+        )
+        try:
+            avaliacao = telemetria.verificar(_portal)
+
+            if avaliacao['degradada']:
+                lentas = ', '.join(f"{e['etapa']} {e['segundos']}s (mediana {e['mediana']}s)" for e in avaliacao['etapas_lentas'])
+                falha = f"timeout em {avaliacao['etapa_falha']}" if avaliacao['etapa_falha'] else ''
+                logger.warning(f"PORTAL LENTO ({avaliacao['degradadas_seguidas']} execução(ões) seguida(s)): "
+                               f"{', '.join(t for t in (lentas, falha) if t)}")
+
+            # O novo nível só é gravado depois do alerta enviado (falha = reenvio na próxima execução)
+            if avaliacao['mudou']:
+                if not PORTAL_ALERTA_ATIVO:
+                    telemetria.registrar_nivel(avaliacao['nivel'])
+                elif criar_email_sender().enviar_alerta_portal(EMAIL_DESTINATARIOS_NOC, avaliacao,
+                                                               formatar_periodo_texto(_portal_periodo)):
+                    telemetria.registrar_nivel(avaliacao['nivel'])
+                else:
+                    logger.error("❌ Falha ao enviar alerta de portal degradado (reenvio na próxima execução)")
+        finally:
+            telemetria.fechar()
+    except Exception as e:
+        logger.error(f"Erro na telemetria do portal: {e}")
+    finally:
+        _portal = None
+        _portal_periodo = None
+
+
+def verificar_volume(resultado: dict, periodo: dict):
+    """
+    Compara o volume da janela com o esperado para a meia hora da semana e alerta nas mudanças de nível
+
+    Independe dos percentuais: pega plataforma parada (export vazio ou quase)
+    e origens que pararam de enviar. O e-mail só sai quando o nível de volume
+    muda (entrada, escalonamento ou normalização); o novo nível só é gravado
+    após o envio, então um e-mail que falhou é reenviado na próxima janela.
+
+    Args:
+        resultado: Resultado da análise ({} para export vazio)
+        periodo: Período analisado
+
+    Returns:
+        Avaliação de ModeloVolume.verificar() (None se desativado/falhou)
+    """
+    if not VOLUME_ATIVO:
+        return None
+
+    try:
+        modelo = ModeloVolume(
+            HISTORICO_DB_PATH,
+            min_amostras=VOLUME_MIN_SEMANAS,
+            z_limite=VOLUME_Z_LIMITE,
+            fator_queda=VOLUME_FATOR_QUEDA,
+            fator_critico=VOLUME_FATOR_CRITICO,
+            volume_minimo_origem=VOLUME_MINIMO_ORIGEM
+        )
+        try:
+            avaliacao = modelo.verificar(resultado, periodo['inicio'], periodo['fim'])
+
+            nivel = avaliacao['nivel_volume']
+            if nivel != 'Normal':
+                logger.warning(f"QUEDA DE VOLUME ({nivel}): {avaliacao['total']} transações "
+                               f"(esperado: {avaliacao['total_esperado']}), "
+                               f"{len(avaliacao['origens_ausentes'])} origem(ns) sem tráfego")
+            elif not avaliacao['modelo_pronto']:
+                logger.info(f"Volume: modelo da meia hora da semana ainda em aprendizado (mínimo de {VOLUME_MIN_SEMANAS} semanas)")
+
+            if avaliacao['mudou']:
+                sender = criar_email_sender()
+                if sender.enviar_alerta_volume(EMAIL_DESTINATARIOS_NOC, avaliacao, formatar_periodo_texto(periodo)):
+                    modelo.registrar_nivel(nivel, periodo['fim'])
+                    if nivel != 'Normal':
+                        marcar_envio(sender, 'primeira_notificacao', canal='email_volume')
+                else:
+                    logger.error("❌ Falha ao enviar alerta de volume (reenvio na próxima janela)")
+        finally:
+            modelo.fechar()
+    except Exception as e:
+        logger.error(f"Erro na verificação de volume: {e}")
+        return None
+
+    return avaliacao
+
+
+def analisar_co_falhas(resultado: dict, periodo: dict, tem_alarme: bool, top_n: int = 20) -> list:
+    """
+    Atualiza a matriz janela x origem e, com alarme, agrupa as origens do ranking que falham juntas
+
+    Na primeira execução a matriz é preenchida com as janelas do histórico.
+
+    Args:
+        resultado: Resultado da análise
+        periodo: Período analisado
+        tem_alarme: Se a janela está em alarme (só então os grupos são calculados)
+        top_n: Origens do ranking de negadas consideradas
+
+    Returns:
+        Lista de grupos (vazia se desativado, sem alarme ou sem grupos)
+    """
+    if not CO_FALHAS_ATIVO:
+        return []
+
+    try:
+        matriz = MatrizFalhas(CO_FALHAS_PATH, max_janelas=CO_FALHAS_JANELAS)
+        if len(matriz) == 0:
+            historico = HistoricoJanelas(HISTORICO_DB_PATH)
+            try:
+                inicio = periodo['fim'] - timedelta(minutes=30 * CO_FALHAS_JANELAS)
+                matriz.carregar_historico(historico.carregar_origens(inicio=inicio, fim=periodo['inicio']))
+            finally:
+                historico.fechar()
+
+        matriz.acrescentar(HistoricoJanelas.chave_janela(periodo['fim']), resultado.get('agregado_origem'))
+        matriz.salvar()
+
+        if not tem_alarme:
+            return []
+
+        agregado = resultado.get('agregado_origem')
+        if agregado is None or len(agregado) == 0:
+            return []
+        ranking = agregado[agregado['negadas'] > 0].nlargest(top_n, 'negadas')['Origem'].astype(str).tolist()
+
+        grupos = agrupar_co_falhas(matriz, ranking, limiar=CO_FALHAS_CORRELACAO)
+        for grupo in grupos:
+            logger.info(f"Co-falha: {', '.join(grupo['origens'])} (correlação média {grupo['correlacao_media']})")
+        return grupos
+
+    except Exception as e:
+        logger.error(f"Erro na análise de co-falhas: {e}")
+        return []
+
+
+def montar_contexto_comparativo(resultado: dict, periodo: dict, top_n: int = 20):
+    """
+    Busca no histórico a janela anterior, o mesmo horário de ontem e da semana passada
+
+    Só consultas pela chave das tabelas do histórico (fim da janela e origem);
+    os exports antigos não são relidos.
+
+    Args:
+        resultado: Resultado da análise
+        periodo: Período analisado
+        top_n: Origens dos rankings de negadas e de N2 com variação por origem
+
+    Returns:
+        Retorno de comparativo.montar_comparativo() (None se desativado/falhou)
+    """
+    if not COMPARATIVO_ATIVO:
+        return None
+
+    try:
+        origens = []
+        agregado = resultado.get('agregado_origem')
+        if agregado is not None and len(agregado) > 0:
+            for coluna in ('negadas', 'n2'):
+                top = agregado[agregado[coluna] > 0].nlargest(top_n, coluna)
+                origens.extend(top['Origem'].astype(str))
+
+        historico = HistoricoJanelas(HISTORICO_DB_PATH)
+        try:
+            comparativo = montar_comparativo(historico, periodo['fim'], list(dict.fromkeys(origens)),
+                                             tolerancia_min=COMPARATIVO_TOLERANCIA_MIN)
+        finally:
+            historico.fechar()
+
+        encontradas = [r['rotulo'] for r in comparativo['referencias'] if r['janela']]
+        logger.info(f"Comparativo: {', '.join(encontradas) or 'nenhuma janela de referência no histórico'}")
+        return comparativo
+
+    except Exception as e:
+        logger.error(f"Erro ao montar o comparativo com janelas anteriores: {e}")
+        return None
+
+
+def notificar_telegram(resultado: dict, periodo: dict):
+    """
+    Dispara a notificação curta no Telegram em segundo plano
+
+    Chamada logo após a análise, antes do histórico, dos gráficos e do e-mail,
+    para que o primeiro aviso chegue em segundos; só na abertura e no
+    escalonamento do incidente (janelas Em andamento não repetem o aviso).
+
+    Args:
+        resultado: Resultado da análise
+        periodo: Período analisado
+
+    Returns:
+        Thread da notificação (ou None se desativado/falhou)
+    """
+    if not TELEGRAM_ATIVO:
+        return None
+
+    if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
+        logger.warning("TELEGRAM_ATIVO sem TELEGRAM_TOKEN/TELEGRAM_CHAT_ID - notificação ignorada")
+        return None
+
+    try:
+        notifier = TelegramNotifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, base_url=TELEGRAM_API_URL,
+                                    timeout_s=TELEGRAM_TIMEOUT_S)
+        return notifier.notificar_em_segundo_plano(
+            resultado, formatar_periodo_texto(periodo),
+            ao_enviar=lambda: marcar_etapa('primeira_notificacao', canal='telegram')
+        )
+    except Exception as e:
+        logger.error(f"Erro ao disparar notificação Telegram: {e}")
+        return None
+
+
+def criar_email_sender() -> EmailSender:
+    """
+    Cria o EmailSender com as configurações SMTP do config.py
+
+    Returns:
+        Instância de EmailSender
+    """
+    return EmailSender(
+        smtp_server=EMAIL_SMTP_SERVER,
+        smtp_port=EMAIL_SMTP_PORT,
+        smtp_user=EMAIL_USER,
+        smtp_password=EMAIL_PASSWORD,
+        graficos_inline=EMAIL_GRAFICOS_INLINE,
+        usar_tls=EMAIL_USAR_TLS,
+        outbox=_caixa_saida,
+        limites_linhas=EMAIL_LIMITES_LINHAS,
+        limite_bytes=EMAIL_LIMITE_BYTES,
+        limite_anexos_mb=EMAIL_LIMITE_ANEXOS_MB,
+        compactar_anexos=EMAIL_COMPACTAR_ANEXOS
+    )
+
+
+# Máquina de estados da janela atual (transição pendente até confirmar_estado_alarme)
+_maquina_alarme = None
+
+
+def atualizar_estado_alarme(resultado: dict, thresholds: dict, tem_alarme: bool) -> dict:
+    """
+    Aplica a janela atual à máquina de estados do incidente
+
+    Se a máquina de estados falhar, retorna o comportamento antigo
+    (relatório completo sempre que houver alarme). Abertura, escalonamento e
+    resolução só são gravados por confirmar_estado_alarme(), após o envio.
+
+    Args:
+        resultado: Resultado da análise
+        thresholds: Thresholds da janela (get_thresholds_atuais)
+        tem_alarme: Se a janela está em Alerta/Crítico
+
+    Returns:
+        Dict retornado por MaquinaEstadoAlarme.atualizar()
+    """
+    global _maquina_alarme
+    _maquina_alarme = None
+    try:
+        maquina = MaquinaEstadoAlarme(
+            ALARME_ESTADO_PATH,
+            fator_histerese=ALARME_FATOR_HISTERESE,
+            janelas_para_resolver=ALARME_JANELAS_PARA_RESOLVER
+        )
+        _maquina_alarme = maquina
+        return maquina.atualizar(
+            resultado,
+            thresholds['threshold_negadas'],
+            thresholds['threshold_n2'],
+            thresholds.get('threshold_valor_negadas')
+        )
+    except Exception as e:
+        logger.error(f"Erro na máquina de estados do alarme: {e}")
+        return {
+            'estado': 'Aberto' if tem_alarme else 'Normal',
+            'gerar_relatorio': tem_alarme,
+            'enviar_atualizacao': False,
+            'enviar_resolucao': False,
+        }
+
+
+def confirmar_estado_alarme():
+    """
+    Grava a transição do incidente após a notificação ter sido enviada
+    """
+    if _maquina_alarme is not None:
+        _maquina_alarme.confirmar()
+
+
+# Relatórios completos sendo gerados em segundo plano (segunda fase do alerta)
+_tarefas_relatorio = []
+
+
+def enviar_relatorio_completo(analyzer: RecargaAnalyzer, resultado: dict, periodo_texto: str) -> bool:
+    """
+    Envia o alerta da abertura/escalonamento do incidente
+
+    Em duas fases (ALERTA_DUAS_FASES): o resumo, montado só com o resultado da
+    análise, sai na hora; gráficos e Excel são gerados em uma thread e enviados
+    como resposta ao resumo. Se o resumo falhar, o relatório é enviado de forma
+    síncrona, como antes.
+
+    Args:
+        analyzer: Analisador com a janela carregada
+        resultado: Resultado da análise
+        periodo_texto: Período formatado para exibição
+
+    Returns:
+        True se o primeiro e-mail foi enviado com sucesso
+    """
+    if not ALERTA_DUAS_FASES:
+        return gerar_e_enviar_relatorio(analyzer, resultado, periodo_texto)
+
+    logger.info("Enviando resumo imediato do alarme...")
+    sender = criar_email_sender()
+    message_id = sender.enviar_resumo_imediato(EMAIL_DESTINATARIOS_NOC, resultado, periodo_texto)
+
+    if not message_id:
+        logger.warning("Falha no resumo imediato - enviando relatório completo de forma síncrona")
+        return gerar_e_enviar_relatorio(analyzer, resultado, periodo_texto)
+
+    logger.info("✅ Resumo imediato enviado - relatório completo segue em segundo plano")
+    marcar_envio(sender, 'primeira_notificacao', canal='email_resumo')
+    tarefa = threading.Thread(
+        target=gerar_e_enviar_relatorio,
+        args=(analyzer, resultado, periodo_texto, message_id),
+        name="relatorio-completo",
+        daemon=True
+    )
+    tarefa.start()
+    _tarefas_relatorio.append(tarefa)
+    return True
+
+
+def aguardar_relatorios_pendentes(timeout_s: float = 600):
+    """
+    Aguarda os relatórios em segundo plano antes de encerrar o processo
+
+    Args:
+        timeout_s: Tempo máximo de espera (somado entre as tarefas)
+    """
+    limite = time.monotonic() + timeout_s
+    while _tarefas_relatorio:
+        tarefa = _tarefas_relatorio.pop(0)
+        tarefa.join(max(0.0, limite - time.monotonic()))
+        if tarefa.is_alive():
+            logger.error(f"Relatório completo não terminou em {timeout_s}s - processo encerrado sem ele")
+
+
+def gerar_e_enviar_relatorio(analyzer: RecargaAnalyzer, resultado: dict, periodo_texto: str,
+                             em_resposta_a: str = None) -> bool:
+    """
+    Gera gráficos e Excel e envia o e-mail de alerta completo
+
+    Args:
+        analyzer: Analisador com a janela carregada
+        resultado: Resultado da análise
+        periodo_texto: Período formatado para exibição
+        em_resposta_a: Message-ID do resumo imediato (envia como resposta na mesma conversa)
+
+    Returns:
+        True se enviou com sucesso
+    """
+    nivel_alarme = resultado['nivel_alarme']
+
+    # Enviar e-mail
+    logger.info("Preparando envio de e-mail de alerta...")
+
+    try:
+        # Gerar relatório completo (tabelas, gráficos, excel)
+        logger.info("Gerando relatório completo (gráficos e Excel)...")
+        relatorio = gerar_relatorio_completo(analyzer, output_dir="output")
+
+        if not relatorio:
+            logger.error("Falha ao gerar relatório completo")
+            return False
+
+        # Reaproveitar as tabelas do relatório (gera de novo só se o artefato falhou)
+        tabela_resumo = relatorio.get('tabela_resumo')
+        if tabela_resumo is None:
+            tabela_resumo = analyzer.gerar_tabela_resumo()
+        tabela_codigos = relatorio.get('tabela_codigos')
+        if tabela_codigos is None:
+            tabela_codigos = analyzer.gerar_tabela_codigos()
+        tabela_negadas = relatorio.get('tabela_negadas')
+        if tabela_negadas is None:
+            tabela_negadas = analyzer.gerar_tabela_negadas()
+
+        # Criar sender
+        sender = criar_email_sender()
+
+        # Enviar alerta com todos os anexos
+        enviado = sender.enviar_alerta(
+            destinatarios=EMAIL_DESTINATARIOS_NOC,
+            resultado_analise=resultado,
+            tabela_resumo=tabela_resumo,
+            tabela_codigos=tabela_codigos,
+            tabela_negadas=tabela_negadas,
+            ranking_negadas=relatorio.get('ranking_negadas'),
+            ranking_n2=relatorio.get('ranking_n2'),
+            nivel_alarme=nivel_alarme,
+            periodo_analise=periodo_texto,
+            excel_path=relatorio.get('excel'),
+            anexos=[relatorio.get('grafico_negadas'), relatorio.get('grafico_n2')] if EMAIL_ANEXAR_GRAFICOS else None,
+            em_resposta_a=em_resposta_a
+        )
+
+        if enviado:
+            marcar_envio(sender, 'primeira_notificacao', canal='email_relatorio')
+            marcar_envio(sender, 'relatorio_enviado')
+            logger.info("✅ E-mail de alerta enviado com sucesso!")
+            logger.info(f"Destinatários: {', '.join(EMAIL_DESTINATARIOS_NOC)}")
+            if relatorio.get('excel'):
+                logger.info(f"Excel anexado: {os.path.basename(relatorio.get('excel'))}")
+            return True
+
+        logger.error("❌ Falha ao enviar e-mail de alerta")
+        return False
+
+    except Exception as e:
+        logger.error(f"Erro ao enviar e-mail: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return False
+
+
+def enviar_alertas_roteados(resultado: dict, thresholds: dict, periodo_texto: str) -> int:
+    """
+    Envia a cada grupo de ROTAS_ALERTA um alerta com apenas as suas origens/códigos
+
+    Avaliado em toda janela, independente do incidente do NOC: cada rota tem o
+    seu próprio estado (EstadoRotas) e só recebe e-mail quando a sua fatia
+    atinge a severidade mínima ou escala.
+
+    Args:
+        resultado: Resultado da análise (com agregado_origem_codigo)
+        thresholds: Thresholds do período atual
+        periodo_texto: Período formatado para o e-mail
+
+    Returns:
+        Quantidade de e-mails enviados
+    """
+    if not ROTAS_ALERTA:
+        return 0
+
+    try:
+        particoes = particionar_por_rotas(
+            resultado.get('agregado_origem_codigo'),
+            ROTAS_ALERTA,
+            thresholds['threshold_negadas'],
+            thresholds['threshold_n2']
+        )
+
+        estado = EstadoRotas(ROTAS_ESTADO_PATH)
+        sender = None
+        notificadas = set()
+        for particao in particoes:
+            if not particao['destinatarios'] or not estado.a_notificar(particao):
+                continue
+            sender = sender or criar_email_sender()
+            if sender.enviar_alerta_roteado(particao, periodo_texto):
+                notificadas.add(particao['rota'])
+                logger.info(f"Alerta roteado enviado: {particao['rota']} ({particao['nivel_alarme']})")
+            else:
+                logger.error(f"❌ Falha ao enviar alerta roteado: {particao['rota']}")
+
+        estado.atualizar(particoes, notificadas)
+        return len(notificadas)
+
+    except Exception as e:
+        logger.error(f"Erro ao enviar alertas roteados: {e}")
+        return 0
+
+
+def processar_digest(resultado: dict, periodo: dict, estado_alarme: dict, abertura: bool = False) -> bool:
+    """
+    Modo digest: acumula a janela do incidente e envia o consolidado quando for a hora
+
+    Args:
+        resultado: Resultado da análise
+        periodo: Dicionário com informações do período analisado
+        estado_alarme: Retorno de MaquinaEstadoAlarme.atualizar()
+        abertura: A janela já recebeu o relatório completo (só vira referência da cadência)
+
+    Returns:
+        False apenas se o envio do digest falhou
+    """
+    try:
+        historico = HistoricoJanelas(HISTORICO_DB_PATH)
+        try:
+            digest = DigestAlertas(historico, DIGEST_INTERVALO_MINUTOS)
+
+            if abertura:
+                digest.registrar_abertura(periodo['fim'], resultado['nivel_alarme'])
+                return True
+
+            motivo = digest.acumular(periodo['fim'], resultado['nivel_alarme'],
+                                     resolvido=estado_alarme.get('enviar_resolucao', False))
+            if motivo is None:
+                logger.info("Modo digest: janela acumulada, sem envio nesta execução")
+                return True
+
+            conteudo = digest.montar()
+            if conteudo is None:
+                return True
+
+            logger.info(f"Modo digest: enviando consolidado de {len(conteudo['chaves'])} janela(s) ({motivo})")
+            sender = criar_email_sender()
+            if not sender.enviar_digest(EMAIL_DESTINATARIOS_NOC, conteudo, motivo):
+                logger.error("❌ Falha ao enviar digest (janelas continuam acumuladas)")
+                return False
+
+            digest.confirmar_envio(conteudo['chaves'])
+            marcar_envio(sender, 'primeira_notificacao', canal='email_digest')
+            return True
+
+        finally:
+            historico.fechar()
+
+    except Exception as e:
+        logger.error(f"Erro no modo digest: {e}")
+        return False
+
+
+def analisar_e_alertar(arquivo_path: str, periodo: dict, forcar_relatorio: bool = False) -> bool:
     """
     Analisa o arquivo de recargas e envia alerta se necessário
 
+    O relatório completo (gráficos + Excel) só é gerado na abertura ou no
+    escalonamento de um incidente; janelas em andamento recebem atualização leve.
+
     Args:
         arquivo_path: Caminho completo do arquivo a analisar
         periodo: Dicionário com informações do período analisado
+        forcar_relatorio: Gera o relatório completo em qualquer janela com alarme
 
     Returns:
         True se análise foi bem-sucedida
@@ -396,6 +1433,8 @@ def analisar_e_alertar(arquivo_path: str, periodo: dict) -> bool:
     logger.info("INICIANDO ANÁLISE DE ALARMÍSTICA")
     logger.info("="*70)
 
+    notificacao = None
+
     try:
         # Obter thresholds dinâmicos baseados no período do dia atual
         thresholds = get_thresholds_atuais()
@@ -413,7 +1452,8 @@ def analisar_e_alertar(arquivo_path: str, periodo: dict) -> bool:
         analyzer = RecargaAnalyzer(
             threshold_negadas=thresholds['threshold_negadas'],
             threshold_n2=thresholds['threshold_n2'],
-            periodo_texto=periodo_info
+            periodo_texto=periodo_info,
+            threshold_valor_negadas=thresholds.get('threshold_valor_negadas')
         )
 
         # Carregar arquivo
@@ -425,6 +1465,11 @@ def analisar_e_alertar(arquivo_path: str, periodo: dict) -> bool:
         resultado = analyzer.analisar()
 
         if not resultado:
+            if analyzer.df is not None and len(analyzer.df) == 0:
+                # Export sem nenhuma transação: só a verificação de volume se aplica
+                logger.warning("Export sem transações na janela")
+                marcar_etapa('decisao')
+                return verificar_volume({}, periodo) is not None
             logger.error("Falha na análise dos dados")
             return False
 
@@ -433,76 +1478,83 @@ def analisar_e_alertar(arquivo_path: str, periodo: dict) -> bool:
         logger.info(f"Recargas efetuadas: {resultado['transacoes_efetuadas']}")
         logger.info(f"Recargas negadas: {resultado['transacoes_negadas']} ({resultado['percentual_negadas']}%)")
         logger.info(f"Recargas com N2 (Erro Servidor): {resultado['transacoes_n2']} ({resultado['percentual_n2']}%)")
+        logger.info(f"Valor negado: R$ {resultado['valor_negado']:.2f} ({resultado['percentual_valor_negado']}% do valor)")
         logger.info(f"Nível de alarme: {resultado['nivel_alarme']}")
 
+        marcar_etapa('decisao')
+        if _execucao is not None:
+            _execucao.definir_nivel(resultado['nivel_alarme'])
+
+        # Atualizar máquina de estados do incidente
+        estado_alarme = atualizar_estado_alarme(resultado, thresholds, analyzer.tem_alarme())
+
+        # Aviso imediato no Telegram na abertura/escalonamento, desacoplado do caminho pesado (relatório + SMTP)
+        if estado_alarme['gerar_relatorio']:
+            notificacao = notificar_telegram(resultado, periodo)
+
+        # Queda de volume (parada da plataforma ou de origens), independente dos percentuais
+        verificar_volume(resultado, periodo)
+
+        # Registrar agregados da janela no histórico
+        registrar_historico(resultado, periodo, thresholds['periodo'])
+
+        # Anexar transações brutas ao arquivo particionado (consultas históricas)
+        arquivar_transacoes(analyzer, periodo)
+
+        # Carregar transações e agregados no banco compartilhado com outras equipes
+        carregar_banco(analyzer, resultado, periodo)
+
+        # Cubo da janela para consultas ad hoc de várias janelas
+        salvar_cubo(resultado, periodo)
+
+        # Variação contra a janela anterior, ontem e a semana passada (anotada no e-mail)
+        resultado['comparativo'] = montar_contexto_comparativo(resultado, periodo)
+
+        # Grupos de origens falhando juntas (anotados no e-mail)
+        resultado['grupos_co_falha'] = analisar_co_falhas(resultado, periodo, analyzer.tem_alarme())
+
+        periodo_texto = formatar_periodo_texto(periodo)
+
         # Verificar se há alarme
         if analyzer.tem_alarme():
             nivel_alarme = resultado['nivel_alarme']
             mensagem = analyzer.get_mensagem_alarme()
 
             logger.warning("="*70)
-            logger.warning(f"ALARME DETECTADO: {nivel_alarme}")
+            logger.warning(f"ALARME DETECTADO: {nivel_alarme} (estado: {estado_alarme['estado']})")
             logger.warning(mensagem)
             logger.warning("="*70)
 
-            # Enviar e-mail
-            logger.info("Preparando envio de e-mail de alerta...")
+        # Grupos parceiros: apenas as suas origens/códigos, sem anexos (estado próprio por rota)
+        enviar_alertas_roteados(resultado, thresholds, periodo_texto)
 
-            try:
-                # Gerar relatório completo (tabelas, gráficos, excel)
-                logger.info("Gerando relatório completo (gráficos e Excel)...")
-                relatorio = gerar_relatorio_completo(analyzer, output_dir="output")
-
-                if not relatorio:
-                    logger.error("Falha ao gerar relatório completo")
-                    return False
-
-                # Gerar tabelas adicionais
-                tabela_resumo = analyzer.gerar_tabela_resumo()
-                tabela_codigos = analyzer.gerar_tabela_codigos()
-                tabela_negadas = analyzer.gerar_tabela_negadas()
-
-                # Criar sender
-                sender = EmailSender(
-                    smtp_server=EMAIL_SMTP_SERVER,
-                    smtp_port=EMAIL_SMTP_PORT,
-                    smtp_user=EMAIL_USER,
-                    smtp_password=EMAIL_PASSWORD
-                )
-
-                # Formatar período para exibição (ex: "14h às 14h30")
-                hora_ini = f"{periodo['hora_inicial']}h{periodo['minuto_inicial']}" if periodo['minuto_inicial'] != '00' else f"{periodo['hora_inicial']}h"
-                hora_fim = f"{periodo['hora_final']}h{periodo['minuto_final']}" if periodo['minuto_final'] != '00' else f"{periodo['hora_final']}h"
-                periodo_texto = f"{hora_ini} às {hora_fim}"
-
-                # Enviar alerta com todos os anexos
-                enviado = sender.enviar_alerta(
-                    destinatarios=EMAIL_DESTINATARIOS_NOC,
-                    resultado_analise=resultado,
-                    tabela_resumo=tabela_resumo,
-                    tabela_codigos=tabela_codigos,
-                    tabela_negadas=tabela_negadas,
-                    ranking_negadas=relatorio.get('ranking_negadas'),
-                    ranking_n2=relatorio.get('ranking_n2'),
-                    nivel_alarme=nivel_alarme,
-                    periodo_analise=periodo_texto,
-                    excel_path=relatorio.get('excel')
-                )
-
-                if enviado:
-                    logger.info("✅ E-mail de alerta enviado com sucesso!")
-                    logger.info(f"Destinatários: {', '.join(EMAIL_DESTINATARIOS_NOC)}")
-                    if relatorio.get('excel'):
-                        logger.info(f"Excel anexado: {os.path.basename(relatorio.get('excel'))}")
-                else:
-                    logger.error("❌ Falha ao enviar e-mail de alerta")
-                    return False
+        # No modo digest, o escalonamento entra no consolidado (mudança de severidade) em vez do relatório completo
+        escalonamento_digest = DIGEST_ATIVO and estado_alarme.get('estado') == ESTADO_ESCALADO
 
-            except Exception as e:
-                logger.error(f"Erro ao enviar e-mail: {e}")
-                import traceback
-                logger.error(traceback.format_exc())
+        if (estado_alarme['gerar_relatorio'] and not escalonamento_digest) or (forcar_relatorio and analyzer.tem_alarme()):
+            # Abertura/escalonamento do incidente (ou pedido explícito): relatório completo
+            if not enviar_relatorio_completo(analyzer, resultado, periodo_texto):
                 return False
+            confirmar_estado_alarme()
+
+            if DIGEST_ATIVO:
+                processar_digest(resultado, periodo, estado_alarme, abertura=True)
+
+        elif DIGEST_ATIVO and (estado_alarme.get('estado') in ESTADOS_ATIVOS or estado_alarme['enviar_resolucao']):
+            # Incidente em andamento: janelas acumuladas e enviadas em um e-mail consolidado
+            if not processar_digest(resultado, periodo, estado_alarme):
+                return False
+            confirmar_estado_alarme()
+
+        elif estado_alarme['enviar_atualizacao'] or estado_alarme['enviar_resolucao']:
+            # Incidente em andamento ou resolvido: apenas atualização leve, sem gráficos/Excel
+            logger.info(f"Incidente {estado_alarme['estado'].lower()} - enviando atualização leve")
+            sender = criar_email_sender()
+            if not sender.enviar_atualizacao(EMAIL_DESTINATARIOS_NOC, resultado, estado_alarme, periodo_texto):
+                logger.error("❌ Falha ao enviar atualização do incidente")
+                return False
+            confirmar_estado_alarme()
+            marcar_envio(sender, 'primeira_notificacao', canal='email_atualizacao')
 
         else:
             logger.info("✅ Status normal - nenhum alarme detectado")
@@ -519,10 +1571,18 @@ def analisar_e_alertar(arquivo_path: str, periodo: dict) -> bool:
         logger.error(f"Erro durante análise de alarmística: {e}")
         return False
 
+    finally:
+        # A thread é daemon: aguardar o envio antes de o processo encerrar
+        if notificacao is not None:
+            notificacao.join(TELEGRAM_TIMEOUT_S * 2)
 
-def main():
+
+def main(forcar_relatorio: bool = False):
     """
     Função principal
+
+    Args:
+        forcar_relatorio: Gera o relatório completo mesmo com incidente em andamento
     """
     logger.info("="*70)
     logger.info("SERVCEL REPORT EXTRACTOR - INICIANDO")
@@ -530,9 +1590,15 @@ def main():
 
     driver = None
 
+    # Envio de e-mails em segundo plano (drena também a fila de execuções anteriores)
+    iniciar_caixa_saida()
+
     try:
         # Calcular período
         periodo = calcular_periodo()
+        iniciar_execucao(periodo)
+        iniciar_telemetria_portal(periodo)
+        iniciar_politica_espera()
         logger.info(f"Período: {periodo['data_inicial']} {periodo['hora_inicial']}:{periodo['minuto_inicial']} até {periodo['data_final']} {periodo['hora_final']}:{periodo['minuto_final']}")
 
         # Configurar Chrome
@@ -572,7 +1638,8 @@ def main():
 
             # Executar análise de alarmística
             arquivo_completo = os.path.join(DOWNLOAD_DIR, arquivo)
-            analise_ok = analisar_e_alertar(arquivo_completo, periodo)
+            marcar_etapa('arquivo_disponivel', datetime.fromtimestamp(os.path.getmtime(arquivo_completo)))
+            analise_ok = analisar_e_alertar(arquivo_completo, periodo, forcar_relatorio=forcar_relatorio)
 
             if analise_ok:
                 logger.info("="*70)
@@ -595,7 +1662,19 @@ def main():
             driver.quit()
             logger.info("Chrome fechado")
 
+        # Segunda fase do alerta: o relatório precisa da caixa de saída ainda ativa
+        aguardar_relatorios_pendentes(ALERTA_TIMEOUT_RELATORIO_S)
+        finalizar_telemetria_portal()
+        finalizar_caixa_saida()
+        # Depois da última drenagem: os marcos de e-mail são os da entrega ao SMTP
+        finalizar_execucao()
+
+        # Retenção: compactar exports, relatórios e logs antigos (mantém os diretórios quentes pequenos)
+        if RETENCAO_POLITICAS:
+            aplicar_politicas(ARQUIVO_DIR, RETENCAO_POLITICAS)
+
 
 if __name__ == "__main__":
-    exit_code = main()
+    # --relatorio-completo: força gráficos + Excel mesmo com incidente já aberto
+    exit_code = main(forcar_relatorio='--relatorio-completo' in sys.argv[1:])
     sys.exit(exit_code)
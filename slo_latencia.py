@@ -0,0 +1,220 @@
+"""
+Módulo de SLO de Latência de Detecção
+Marcos de tempo de cada execução (fim da janela -> export -> decisão ->
+primeira notificação -> relatório completo) e percentis por etapa e por dia
+
+Uso:
+    python3 slo_latencia.py [--dias 7] [--alvo-s 600] [--etapa primeira_notificacao] [--db caminho]
+"""
+
+import os
+import sys
+import logging
+import argparse
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from historico_janelas import HistoricoJanelas
+
+logger = logging.getLogger(__name__)
+
+
+# Etapas medidas a partir do fim da janela, na ordem do pipeline
+ETAPAS = ['arquivo_disponivel', 'decisao', 'primeira_notificacao', 'relatorio_enviado']
+
+PERCENTIS = [0.5, 0.9, 0.95, 0.99]
+
+FORMATO = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class MarcosExecucao:
+    """
+    Marcos de tempo de uma execução
+
+    Pode ser marcado por várias threads (Telegram, relatório em segundo plano,
+    worker da caixa de saída). Os horários de envio de e-mail são os de
+    aceitação pelo SMTP, também quando a mensagem passa pela caixa de saída.
+    """
+
+    def __init__(self, fim_janela: datetime):
+        """
+        Inicia o registro de uma execução
+
+        Args:
+            fim_janela: Fim da janela analisada
+        """
+        self.marcos: Dict[str, Optional[str]] = {
+            'iniciada_em': datetime.now().strftime(FORMATO)[:-3],
+            'fim_janela': HistoricoJanelas.chave_janela(fim_janela),
+        }
+        self._lock = threading.Lock()
+
+    def marcar(self, etapa: str, momento: Optional[datetime] = None, canal: Optional[str] = None):
+        """
+        Registra uma etapa (vale o horário mais cedo de cada etapa)
+
+        Args:
+            etapa: Uma de ETAPAS
+            momento: Horário da etapa (padrão: agora)
+            canal: Canal da primeira notificação (ex: 'telegram', 'email_resumo')
+        """
+        horario = (momento or datetime.now()).strftime(FORMATO)[:-3]
+        with self._lock:
+            # Entregas da caixa de saída chegam fora de ordem: mantém o horário mais cedo
+            if self.marcos.get(etapa) and self.marcos[etapa] <= horario:
+                return
+            self.marcos[etapa] = horario
+            if etapa == 'primeira_notificacao' and canal:
+                self.marcos['canal_primeira_notificacao'] = canal
+
+    def definir_nivel(self, nivel_alarme: str):
+        """
+        Registra o nível de alarme decidido na janela
+        """
+        with self._lock:
+            self.marcos['nivel_alarme'] = nivel_alarme
+
+    def registrar(self, historico: HistoricoJanelas) -> bool:
+        """
+        Grava os marcos no histórico
+
+        Returns:
+            True se gravou com sucesso
+        """
+        with self._lock:
+            marcos = dict(self.marcos)
+
+        ok = historico.registrar_execucao(marcos)
+        if ok:
+            latencias = [f"{e}={self.latencia_s(e):.0f}s" for e in ETAPAS if self.latencia_s(e) is not None]
+            logger.info(f"Latência da janela {marcos['fim_janela']}: {', '.join(latencias) or 'sem marcos'}")
+        return ok
+
+    def latencia_s(self, etapa: str) -> Optional[float]:
+        """
+        Segundos entre o fim da janela e a etapa (None se a etapa não ocorreu)
+        """
+        momento = self.marcos.get(etapa)
+        if not momento:
+            return None
+        fim = datetime.strptime(self.marcos['fim_janela'], '%Y-%m-%d %H:%M')
+        return (pd.Timestamp(momento) - pd.Timestamp(fim)).total_seconds()
+
+
+def calcular_latencias(execucoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte os marcos em segundos desde o fim da janela
+
+    Args:
+        execucoes: Retorno de HistoricoJanelas.carregar_execucoes()
+
+    Returns:
+        DataFrame com fim_janela, dia, nivel_alarme, canal e uma coluna por etapa (segundos)
+    """
+    fim = pd.to_datetime(execucoes['fim_janela'], format='%Y-%m-%d %H:%M')
+    latencias = pd.DataFrame({
+        'fim_janela': fim,
+        'dia': fim.dt.date,
+        'nivel_alarme': execucoes['nivel_alarme'],
+        'canal': execucoes['canal_primeira_notificacao'],
+    })
+    for etapa in ETAPAS:
+        latencias[etapa] = (pd.to_datetime(execucoes[etapa], errors='coerce') - fim).dt.total_seconds()
+    return latencias
+
+
+def _resumir(valores: pd.Series, alvo_s: Optional[float]) -> Dict:
+    """
+    Contagem, percentis, máximo e aderência ao alvo de uma série de latências
+    """
+    valores = valores.dropna()
+    resumo = {'execucoes': len(valores)}
+    for p in PERCENTIS:
+        resumo[f"p{int(p * 100)}"] = round(float(valores.quantile(p)), 1) if len(valores) else None
+    resumo['max'] = round(float(valores.max()), 1) if len(valores) else None
+    if alvo_s is not None:
+        resumo['dentro_alvo_%'] = round(float((valores <= alvo_s).mean() * 100), 1) if len(valores) else None
+    return resumo
+
+
+def percentis_por_etapa(latencias: pd.DataFrame, alvo_s: Optional[float] = None) -> pd.DataFrame:
+    """
+    Percentis de latência de cada etapa no período inteiro
+
+    Args:
+        latencias: Retorno de calcular_latencias()
+        alvo_s: Alvo de latência em segundos (adiciona a coluna de aderência)
+
+    Returns:
+        DataFrame com uma linha por etapa
+    """
+    linhas = [dict(etapa=etapa, **_resumir(latencias[etapa], alvo_s)) for etapa in ETAPAS]
+    return pd.DataFrame(linhas)
+
+
+def percentis_por_dia(latencias: pd.DataFrame, etapa: str = 'primeira_notificacao',
+                      alvo_s: Optional[float] = None) -> pd.DataFrame:
+    """
+    Percentis diários de uma etapa (evolução após cada otimização)
+
+    Args:
+        latencias: Retorno de calcular_latencias()
+        etapa: Etapa avaliada
+        alvo_s: Alvo de latência em segundos
+
+    Returns:
+        DataFrame com uma linha por dia
+    """
+    linhas = [dict(dia=dia, **_resumir(grupo[etapa], alvo_s)) for dia, grupo in latencias.groupby('dia')]
+    return pd.DataFrame(linhas)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI de relatório de latência
+    """
+    parser = argparse.ArgumentParser(description="Latência de detecção da alarmística (fim da janela -> alerta)")
+    parser.add_argument('--dias', type=int, default=7, help="Dias analisados (padrão: 7)")
+    parser.add_argument('--etapa', choices=ETAPAS, default='primeira_notificacao',
+                        help="Etapa do relatório diário (padrão: primeira_notificacao)")
+    parser.add_argument('--alvo-s', type=float, default=None, help="Alvo de latência em segundos (padrão: SLO_DETECCAO_S)")
+    parser.add_argument('--db', default=None, help="Banco do histórico (padrão: HISTORICO_DB_PATH)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    db_path = args.db
+    alvo_s = args.alvo_s
+    if db_path is None or alvo_s is None:
+        import config
+        base_dir = getattr(config, 'BASE_DIR', os.path.dirname(os.path.abspath(__file__)))
+        db_path = db_path or getattr(config, 'HISTORICO_DB_PATH',
+                                     os.path.join(base_dir, "historico", "historico_janelas.db"))
+        alvo_s = alvo_s if alvo_s is not None else getattr(config, 'SLO_DETECCAO_S', None)
+
+    historico = HistoricoJanelas(db_path)
+    try:
+        execucoes = historico.carregar_execucoes(inicio=datetime.now() - timedelta(days=args.dias))
+    finally:
+        historico.fechar()
+
+    if len(execucoes) == 0:
+        print("Nenhuma execução registrada no período", file=sys.stderr)
+        return 1
+
+    latencias = calcular_latencias(execucoes)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(f"Latência por etapa (segundos desde o fim da janela) - últimos {args.dias} dias")
+        print(percentis_por_etapa(latencias, alvo_s).to_string(index=False))
+        print(f"\nLatência diária - {args.etapa}")
+        print(percentis_por_dia(latencias, args.etapa, alvo_s).to_string(index=False))
+        canais = latencias['canal'].value_counts()
+        if len(canais):
+            print("\nCanal da primeira notificação: " + ', '.join(f"{c} ({n})" for c, n in canais.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
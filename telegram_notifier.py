@@ -0,0 +1,180 @@
+"""
+Módulo de Notificação via Telegram
+Mensagem curta de alarme enviada logo após a análise, antes do relatório e do e-mail
+"""
+
+import json
+import html
+import logging
+import threading
+import http.client
+from urllib.parse import urlsplit
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+ICONES_NIVEL = {'Crítico': '🔴', 'Alerta': '🟡', 'Normal': '🟢'}
+
+
+class TelegramNotifier:
+    """
+    Envia mensagens pela Bot API do Telegram
+
+    Mantém uma única conexão HTTP(S) keep-alive por instância (reaberta se o
+    servidor fechar), sem dependências além da biblioteca padrão. A URL base é
+    configurável para testes com um servidor HTTP local.
+    """
+
+    def __init__(self, token: str, chat_id: str, base_url: str = "https://api.telegram.org", timeout_s: float = 10.0):
+        """
+        Inicializa o notificador
+
+        Args:
+            token: Token do bot
+            chat_id: Chat/grupo de destino
+            base_url: URL base da Bot API
+            timeout_s: Timeout de conexão e resposta
+        """
+        self.token = token
+        self.chat_id = chat_id
+        self.timeout_s = timeout_s
+
+        url = urlsplit(base_url)
+        self.https = url.scheme == 'https'
+        self.host = url.hostname
+        self.porta = url.port
+        self.prefixo = url.path.rstrip('/')
+
+        self._conexao: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def _conectar(self) -> http.client.HTTPConnection:
+        """
+        Retorna a conexão persistente (cria na primeira chamada)
+        """
+        if self._conexao is None:
+            classe = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self._conexao = classe(self.host, self.porta, timeout=self.timeout_s)
+        return self._conexao
+
+    def _fechar_conexao(self):
+        """
+        Descarta a conexão atual
+        """
+        if self._conexao is not None:
+            try:
+                self._conexao.close()
+            except Exception:
+                pass
+            self._conexao = None
+
+    def fechar(self):
+        """
+        Fecha a conexão persistente
+        """
+        with self._lock:
+            self._fechar_conexao()
+
+    def enviar_mensagem(self, texto: str) -> bool:
+        """
+        Envia uma mensagem de texto (HTML do Telegram)
+
+        Args:
+            texto: Mensagem com marcação HTML simples (<b>, <i>)
+
+        Returns:
+            True se a API confirmou o envio
+        """
+        corpo = json.dumps({
+            'chat_id': self.chat_id,
+            'text': texto,
+            'parse_mode': 'HTML',
+            'disable_web_page_preview': True,
+        }).encode('utf-8')
+        caminho = f"{self.prefixo}/bot{self.token}/sendMessage"
+        cabecalhos = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+
+        with self._lock:
+            # Uma nova tentativa se a conexão keep-alive tiver sido fechada pelo servidor
+            for tentativa in range(2):
+                try:
+                    conexao = self._conectar()
+                    conexao.request('POST', caminho, body=corpo, headers=cabecalhos)
+                    resposta = conexao.getresponse()
+                    dados = resposta.read()
+
+                    if resposta.status == 200 and json.loads(dados or b'{}').get('ok', False):
+                        logger.info("Notificação Telegram enviada")
+                        return True
+
+                    logger.error(f"Telegram recusou a mensagem: HTTP {resposta.status} {dados[:200]!r}")
+                    return False
+
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                    self._fechar_conexao()
+                    if tentativa == 1:
+                        logger.error(f"Erro ao enviar notificação Telegram: {e}")
+                except Exception as e:
+                    self._fechar_conexao()
+                    logger.error(f"Erro ao enviar notificação Telegram: {e}")
+                    return False
+
+        return False
+
+    @staticmethod
+    def montar_mensagem(resultado: Dict, periodo_texto: str, top_n: int = 3) -> str:
+        """
+        Monta a mensagem compacta de alarme
+
+        Args:
+            resultado: Resultado de RecargaAnalyzer.analisar()
+            periodo_texto: Período analisado (ex: "14h às 14h30")
+            top_n: Quantidade de origens listadas
+
+        Returns:
+            Texto da mensagem
+        """
+        nivel = resultado.get('nivel_alarme', 'Normal')
+        linhas = [
+            f"{ICONES_NIVEL.get(nivel, '')} <b>{html.escape(nivel)}</b> - Recargas {html.escape(periodo_texto)}",
+            f"Negadas: <b>{resultado.get('percentual_negadas', 0.0):.2f}%</b> "
+            f"({resultado.get('transacoes_negadas', 0)}/{resultado.get('total_transacoes', 0)})",
+            f"N2 (servidor): <b>{resultado.get('percentual_n2', 0.0):.2f}%</b> ({resultado.get('transacoes_n2', 0)})",
+        ]
+
+        if resultado.get('valor_negado'):
+            linhas.append(f"Valor negado: R$ {resultado['valor_negado']:.2f} "
+                          f"({resultado.get('percentual_valor_negado', 0.0):.2f}%)")
+
+        agregado = resultado.get('agregado_origem')
+        if agregado is not None and len(agregado) > 0:
+            top = agregado[agregado['negadas'] > 0].nlargest(top_n, 'negadas')
+            if len(top) > 0:
+                origens = ', '.join(f"{html.escape(str(o))} ({int(n)})" for o, n in zip(top['Origem'], top['negadas']))
+                linhas.append(f"Top origens: {origens}")
+
+        return '\n'.join(linhas)
+
+    def notificar_em_segundo_plano(self, resultado: Dict, periodo_texto: str,
+                                   ao_enviar: Optional[Callable[[], None]] = None) -> threading.Thread:
+        """
+        Envia a notificação em uma thread, sem bloquear o relatório e o e-mail
+
+        Args:
+            resultado: Resultado da análise
+            periodo_texto: Período analisado
+            ao_enviar: Chamado na thread quando a API confirma o envio (ex: marco de latência)
+
+        Returns:
+            Thread iniciada (use join() antes de encerrar o processo)
+        """
+        texto = self.montar_mensagem(resultado, periodo_texto)
+
+        def _enviar():
+            if self.enviar_mensagem(texto) and ao_enviar is not None:
+                ao_enviar()
+
+        thread = threading.Thread(target=_enviar, name="telegram", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,408 @@
+"""
+Módulo de Telemetria do Portal
+Tempo de cada etapa do GWCelWeb (página de login, menu, página de transações,
+pesquisa e download do export) e tamanho do export, gravados a cada execução,
+e alarme de "portal degradado" quando a latência foge da linha de base.
+Lentidão do portal costuma anteceder os erros de servidor (N2).
+
+Uso (relatório das últimas execuções):
+    python3 telemetria_portal.py [--dias 7] [--db caminho]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Etapas medidas, na ordem do fluxo: do gatilho (navegação/clique) até o elemento esperado
+ETAPAS_PORTAL = {
+    'login': "Página de login (URL -> campo de usuário)",
+    'menu': "Autenticação (Entrar -> menu ServCel)",
+    'transacoes': "Página de transações (menu -> formulário)",
+    'pesquisa': "Pesquisa (Pesquisar -> botão Exportar)",
+    'download': "Export (Exportar -> arquivo em disco)",
+}
+
+FORMATO = '%Y-%m-%d %H:%M:%S'
+
+
+class MedicoesPortal:
+    """
+    Medições de uma execução (em memória, gravadas ao final com TelemetriaPortal.registrar)
+    """
+
+    def __init__(self, fim_janela: datetime):
+        """
+        Inicia as medições de uma execução
+
+        Args:
+            fim_janela: Fim da janela exportada
+        """
+        self.iniciada_em = datetime.now()
+        self.fim_janela = fim_janela
+        self.segundos: Dict[str, float] = {}
+        self.export_bytes: Optional[int] = None
+        self.etapa_falha: Optional[str] = None
+        self._gatilhos: Dict[str, float] = {}
+        self._exportar_em: Optional[datetime] = None
+
+    def disparar(self, etapa: str):
+        """
+        Marca a ação que inicia a etapa (navegação ou clique)
+        """
+        self._gatilhos[etapa] = time.monotonic()
+        if etapa == 'download':
+            self._exportar_em = datetime.now()
+
+    def concluir(self, etapa: str, inicio: Optional[float] = None) -> Optional[float]:
+        """
+        Registra o fim da etapa (elemento apareceu)
+
+        Args:
+            etapa: Uma de ETAPAS_PORTAL
+            inicio: time.monotonic() do início (padrão: o gatilho da etapa)
+
+        Returns:
+            Segundos medidos (None se a etapa não foi iniciada)
+        """
+        inicio = self._gatilhos.pop(etapa, inicio)
+        if inicio is None:
+            return None
+        self.segundos[etapa] = time.monotonic() - inicio
+        return self.segundos[etapa]
+
+    def falhar(self, etapa: str):
+        """
+        Registra a etapa em que o portal não respondeu (timeout)
+        """
+        if self.etapa_falha is None:
+            self.etapa_falha = etapa
+        self._gatilhos.pop(etapa, None)
+
+    def registrar_export(self, caminho: str) -> bool:
+        """
+        Registra o tamanho do export e o tempo do clique em Exportar até o arquivo gravado
+        (se a espera do download já mediu a etapa, a medição da espera é mantida)
+
+        Args:
+            caminho: Arquivo baixado
+
+        Returns:
+            False se o arquivo é anterior ao clique (export de outra execução)
+        """
+        gravado_em = datetime.fromtimestamp(os.path.getmtime(caminho))
+        self._gatilhos.pop('download', None)
+        if self._exportar_em is None or gravado_em < self._exportar_em:
+            return False
+        self.export_bytes = os.path.getsize(caminho)
+        self.segundos.setdefault('download', (gravado_em - self._exportar_em).total_seconds())
+        return True
+
+    def como_linha(self) -> Dict:
+        """
+        Medições no formato da tabela telemetria_portal
+        """
+        linha = {
+            'iniciada_em': self.iniciada_em.strftime(FORMATO),
+            'fim_janela': self.fim_janela.strftime('%Y-%m-%d %H:%M'),
+            'export_bytes': self.export_bytes,
+            'etapa_falha': self.etapa_falha,
+        }
+        for etapa in ETAPAS_PORTAL:
+            valor = self.segundos.get(etapa)
+            linha[f"{etapa}_s"] = round(valor, 3) if valor is not None else None
+        return linha
+
+
+class TelemetriaPortal:
+    """
+    Série temporal das medições do portal e avaliação contra a linha de base
+
+    A linha de base de cada etapa é a mediana e o MAD das últimas execuções
+    bem-sucedidas; a etapa está lenta quando passa da mediana por k desvios
+    robustos, por um fator e por um mínimo absoluto (as três condições, para
+    não alarmar com variações de poucos segundos). Timeout de etapa conta
+    como execução degradada. O nível só muda após execucoes_para_degradar
+    execuções degradadas seguidas e volta ao normal na primeira execução normal.
+
+    O nível gravado em telemetria_estado é o último notificado: na mudança,
+    quem envia o alerta chama registrar_nivel() após o envio (falha de envio =
+    a mudança é reenviada na próxima execução).
+    """
+
+    def __init__(self, db_path: str, amostras_base: int = 336, min_amostras: int = 10, k_mad: float = 4.0,
+                 fator: float = 2.0, minimo_s: float = 5.0, execucoes_para_degradar: int = 2):
+        """
+        Inicializa a telemetria (cria as tabelas no banco do histórico se necessário)
+
+        Args:
+            db_path: Banco SQLite (o mesmo do histórico de janelas)
+            amostras_base: Execuções usadas na linha de base (336 = 7 dias de janelas de 30 min)
+            min_amostras: Execuções mínimas antes de avaliar uma etapa
+            k_mad: Desvios robustos (1.4826 x MAD) acima da mediana
+            fator: A etapa também precisa passar de mediana x fator
+            minimo_s: ... e de mediana + minimo_s segundos
+            execucoes_para_degradar: Execuções degradadas seguidas para alarmar
+        """
+        self.db_path = db_path
+        self.amostras_base = amostras_base
+        self.min_amostras = min_amostras
+        self.k_mad = k_mad
+        self.fator = fator
+        self.minimo_s = minimo_s
+        self.execucoes_para_degradar = execucoes_para_degradar
+
+        diretorio = os.path.dirname(db_path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        colunas = ',\n'.join(f"                    {etapa}_s REAL" for etapa in ETAPAS_PORTAL)
+        with self.conn:
+            self.conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS telemetria_portal (
+                    iniciada_em TEXT PRIMARY KEY,
+                    fim_janela TEXT,
+{colunas},
+                    export_bytes INTEGER,
+                    etapa_falha TEXT
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_telemetria_portal_fim_janela
+                    ON telemetria_portal (fim_janela);
+
+                CREATE TABLE IF NOT EXISTS telemetria_estado (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    nivel TEXT,
+                    degradadas_seguidas INTEGER,
+                    atualizado_em TEXT
+                );
+            """)
+
+    def registrar(self, medicoes: MedicoesPortal) -> bool:
+        """
+        Grava as medições de uma execução
+
+        Returns:
+            True se gravou com sucesso
+        """
+        linha = medicoes.como_linha()
+        try:
+            with self.conn:
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO telemetria_portal ({', '.join(linha)}) "
+                    f"VALUES ({', '.join('?' * len(linha))})",
+                    list(linha.values())
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao registrar telemetria do portal: {e}")
+            return False
+
+    def carregar(self, inicio: Optional[datetime] = None, limite: Optional[int] = None,
+                 antes_de: Optional[str] = None) -> pd.DataFrame:
+        """
+        Carrega as medições (mais recentes primeiro)
+
+        Args:
+            inicio: Execuções iniciadas a partir deste horário (None = sem limite)
+            limite: Quantidade máxima de execuções
+            antes_de: Só execuções iniciadas antes deste horário (texto FORMATO)
+
+        Returns:
+            DataFrame ordenado por iniciada_em decrescente
+        """
+        condicoes, params = [], []
+        if inicio is not None:
+            condicoes.append("iniciada_em >= ?")
+            params.append(inicio.strftime(FORMATO))
+        if antes_de is not None:
+            condicoes.append("iniciada_em < ?")
+            params.append(antes_de)
+        sql = "SELECT * FROM telemetria_portal"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        sql += " ORDER BY iniciada_em DESC"
+        if limite:
+            sql += f" LIMIT {int(limite)}"
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def linha_base(self, antes_de: Optional[str] = None) -> pd.DataFrame:
+        """
+        Mediana, MAD e limite de cada etapa nas últimas execuções bem-sucedidas
+
+        Args:
+            antes_de: Ignora execuções a partir deste horário (a própria execução avaliada)
+
+        Returns:
+            DataFrame indexado pela etapa com amostras, mediana, mad e limite_s
+        """
+        historico = self.carregar(limite=self.amostras_base, antes_de=antes_de)
+        historico = historico[historico['etapa_falha'].isna()]
+
+        linhas = []
+        for etapa in ETAPAS_PORTAL:
+            valores = historico[f"{etapa}_s"].dropna().to_numpy(dtype=float)
+            if len(valores) == 0:
+                linhas.append({'etapa': etapa, 'amostras': 0, 'mediana': np.nan, 'mad': np.nan, 'limite_s': np.nan})
+                continue
+            mediana = float(np.median(valores))
+            mad = float(np.median(np.abs(valores - mediana))) * 1.4826
+            limite = max(mediana + self.k_mad * mad, mediana * self.fator, mediana + self.minimo_s)
+            linhas.append({'etapa': etapa, 'amostras': len(valores), 'mediana': mediana, 'mad': mad, 'limite_s': limite})
+
+        return pd.DataFrame(linhas).set_index('etapa')
+
+    def avaliar(self, medicoes: MedicoesPortal) -> Dict:
+        """
+        Compara as medições da execução com a linha de base
+
+        Args:
+            medicoes: Medições da execução
+
+        Returns:
+            Dict com 'degradada' (bool), 'etapa_falha', 'export_bytes' e 'etapas_lentas'
+            (lista de dicts com etapa, descricao, segundos, mediana e limite_s)
+        """
+        base = self.linha_base(antes_de=medicoes.iniciada_em.strftime(FORMATO))
+        lentas = []
+        for etapa, segundos in medicoes.segundos.items():
+            if etapa not in base.index or base.at[etapa, 'amostras'] < self.min_amostras:
+                continue
+            if segundos > base.at[etapa, 'limite_s']:
+                lentas.append({
+                    'etapa': etapa,
+                    'descricao': ETAPAS_PORTAL[etapa],
+                    'segundos': round(segundos, 1),
+                    'mediana': round(float(base.at[etapa, 'mediana']), 1),
+                    'limite_s': round(float(base.at[etapa, 'limite_s']), 1),
+                })
+
+        return {
+            'degradada': bool(lentas) or medicoes.etapa_falha is not None,
+            'etapa_falha': medicoes.etapa_falha,
+            'export_bytes': medicoes.export_bytes,
+            'etapas_lentas': lentas,
+        }
+
+    def verificar(self, medicoes: MedicoesPortal) -> Dict:
+        """
+        Avalia a execução, grava as medições e o contador de execuções degradadas
+
+        O nível só é gravado aqui se não mudou; com 'mudou', o chamador notifica
+        e então chama registrar_nivel().
+
+        Args:
+            medicoes: Medições da execução
+
+        Returns:
+            Retorno de avaliar() acrescido de 'nivel' ('Normal' ou 'Degradado'),
+            'nivel_anterior', 'mudou' e 'degradadas_seguidas'
+        """
+        avaliacao = self.avaliar(medicoes)
+        self.registrar(medicoes)
+
+        linha = self.conn.execute("SELECT nivel, degradadas_seguidas FROM telemetria_estado WHERE id = 1").fetchone()
+        anterior, seguidas = (linha[0], int(linha[1] or 0)) if linha else ('Normal', 0)
+
+        seguidas = seguidas + 1 if avaliacao['degradada'] else 0
+        if avaliacao['degradada'] and seguidas >= self.execucoes_para_degradar:
+            nivel = 'Degradado'
+        elif not avaliacao['degradada']:
+            nivel = 'Normal'
+        else:
+            nivel = anterior
+
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO telemetria_estado VALUES (1, ?, ?, ?)",
+                              (anterior, seguidas, datetime.now().strftime(FORMATO)))
+
+        avaliacao.update(nivel=nivel, nivel_anterior=anterior, mudou=nivel != anterior, degradadas_seguidas=seguidas)
+        if not avaliacao['mudou']:
+            self.registrar_nivel(nivel)
+        return avaliacao
+
+    def registrar_nivel(self, nivel: str):
+        """
+        Grava o nível notificado do portal (referência da próxima mudança)
+
+        Args:
+            nivel: 'Normal' ou 'Degradado'
+        """
+        with self.conn:
+            self.conn.execute("UPDATE telemetria_estado SET nivel = ?, atualizado_em = ? WHERE id = 1",
+                              (nivel, datetime.now().strftime(FORMATO)))
+
+    def fechar(self):
+        """
+        Fecha a conexão com o banco
+        """
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.error(f"Erro ao fechar telemetria do portal: {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI de relatório da telemetria do portal
+    """
+    parser = argparse.ArgumentParser(description="Latência do portal GWCelWeb por etapa")
+    parser.add_argument('--dias', type=int, default=7, help="Dias analisados (padrão: 7)")
+    parser.add_argument('--db', default=None, help="Banco do histórico (padrão: HISTORICO_DB_PATH)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    db_path = args.db
+    if db_path is None:
+        import config
+        base_dir = getattr(config, 'BASE_DIR', os.path.dirname(os.path.abspath(__file__)))
+        db_path = getattr(config, 'HISTORICO_DB_PATH', os.path.join(base_dir, "historico", "historico_janelas.db"))
+
+    telemetria = TelemetriaPortal(db_path)
+    try:
+        execucoes = telemetria.carregar(inicio=datetime.now() - timedelta(days=args.dias))
+        base = telemetria.linha_base()
+    finally:
+        telemetria.fechar()
+
+    if len(execucoes) == 0:
+        print("Nenhuma execução registrada no período", file=sys.stderr)
+        return 1
+
+    linhas = []
+    for etapa, descricao in ETAPAS_PORTAL.items():
+        valores = execucoes[f"{etapa}_s"].dropna()
+        linhas.append({
+            'etapa': descricao,
+            'execucoes': len(valores),
+            'p50': round(float(valores.quantile(0.5)), 1) if len(valores) else None,
+            'p95': round(float(valores.quantile(0.95)), 1) if len(valores) else None,
+            'max': round(float(valores.max()), 1) if len(valores) else None,
+            'limite_s': round(float(base.at[etapa, 'limite_s']), 1) if pd.notna(base.at[etapa, 'limite_s']) else None,
+        })
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(f"Latência do portal por etapa (segundos) - últimos {args.dias} dias")
+        print(pd.DataFrame(linhas).to_string(index=False))
+        tamanhos = execucoes['export_bytes'].dropna()
+        if len(tamanhos):
+            print(f"\nExport: mediana {tamanhos.median() / 1024:.0f} KB, máximo {tamanhos.max() / 1024:.0f} KB")
+        falhas = execucoes['etapa_falha'].value_counts()
+        if len(falhas):
+            print("Timeouts por etapa: " + ', '.join(f"{e} ({n})" for e, n in falhas.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+Módulo de Volume Esperado
+Modelo sazonal (meia hora da semana x origem) do volume de transações por janela,
+atualizado incrementalmente a cada janela, para detectar quedas de tráfego
+que os percentuais não mostram (plataforma parada, origem sem enviar)
+
+Uso (recria o modelo a partir das janelas já gravadas no histórico):
+    python3 volume_esperado.py reconstruir [--db caminho]
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Chave do volume total da janela (as demais chaves são origens)
+CHAVE_TOTAL = '__total__'
+
+
+def meia_hora_semana(inicio_janela: datetime) -> int:
+    """
+    Meia hora da semana da janela (0 = segunda 00h00 ... 335 = domingo 23h30)
+
+    Cada janela de 30 minutos tem a sua posição: as janelas :00 e :30 de uma
+    hora não dividem média/variância, e cada posição recebe uma amostra por semana.
+    """
+    return inicio_janela.weekday() * 48 + inicio_janela.hour * 2 + inicio_janela.minute // 30
+
+
+class ModeloVolume:
+    """
+    Volume esperado por (meia hora da semana, chave) com média e variância incrementais
+
+    A atualização é a de Welford com peso mínimo 1/max_amostras: até
+    max_amostras observações é a média/variância exata; depois disso vira uma
+    média móvel exponencial, para acompanhar mudanças lentas de tráfego.
+
+    A avaliação de uma janela é uma única consulta pela meia hora da semana
+    (chave primária) mais operações vetorizadas sobre as origens.
+
+    O nível gravado em volume_estado é o último notificado: verificar() só o
+    grava quando não há mudança; na mudança, quem envia o e-mail chama
+    registrar_nivel() após o envio (falha de envio = a mudança é reavaliada
+    e reenviada na próxima janela).
+    """
+
+    def __init__(self, db_path: str, min_amostras: int = 4, max_amostras: int = 8, z_limite: float = 3.0,
+                 fator_queda: float = 0.5, fator_critico: float = 0.2, volume_minimo_origem: float = 20.0):
+        """
+        Inicializa o modelo (cria as tabelas no banco do histórico se necessário)
+
+        Args:
+            db_path: Banco SQLite (o mesmo do histórico de janelas)
+            min_amostras: Semanas observadas antes de avaliar uma meia hora da semana
+            max_amostras: Peso mínimo da atualização (1/max_amostras)
+            z_limite: Desvios abaixo do esperado para considerar queda significativa
+            fator_queda: Além do z, o observado precisa ficar abaixo de esperado x fator
+            fator_critico: Volume total abaixo de esperado x fator = Crítico (colapso)
+            volume_minimo_origem: Volume esperado mínimo para acusar uma origem ausente
+        """
+        self.db_path = db_path
+        self.min_amostras = min_amostras
+        self.max_amostras = max_amostras
+        self.z_limite = z_limite
+        self.fator_queda = fator_queda
+        self.fator_critico = fator_critico
+        self.volume_minimo_origem = volume_minimo_origem
+
+        diretorio = os.path.dirname(db_path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path, timeout=30)
+
+        # Modelo antigo indexado por hora da semana (:00 e :30 juntas): recriado a partir do histórico
+        colunas = [c[1] for c in self.conn.execute("PRAGMA table_info(volume_esperado)")]
+        migrar = 'hora_semana' in colunas
+        if migrar:
+            with self.conn:
+                self.conn.execute("DROP TABLE volume_esperado")
+
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS volume_esperado (
+                    meia_hora_semana INTEGER,
+                    chave TEXT,
+                    amostras INTEGER,
+                    media REAL,
+                    variancia REAL,
+                    atualizado_em TEXT,
+                    PRIMARY KEY (meia_hora_semana, chave)
+                );
+
+                CREATE TABLE IF NOT EXISTS volume_estado (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    nivel TEXT,
+                    fim_janela TEXT
+                );
+            """)
+
+        if migrar:
+            try:
+                janelas = self.reconstruir()
+                logger.info(f"Modelo de volume migrado para meia hora da semana ({janelas} janela(s) do histórico)")
+            except Exception as e:
+                logger.error(f"Erro ao recriar modelo de volume por meia hora (recomeça o aprendizado): {e}")
+
+    @staticmethod
+    def observacao(resultado: Dict) -> pd.Series:
+        """
+        Volume observado da janela por chave (total + origens)
+
+        Args:
+            resultado: Resultado de RecargaAnalyzer.analisar() ({} para export vazio)
+
+        Returns:
+            Series chave -> transações
+        """
+        agregado = (resultado or {}).get('agregado_origem')
+        if agregado is not None and len(agregado) > 0:
+            origens = pd.Series(agregado['total'].to_numpy(dtype=float), index=agregado['Origem'].astype(str))
+        else:
+            origens = pd.Series(dtype=float)
+        total = pd.Series([float((resultado or {}).get('total_transacoes', 0))], index=[CHAVE_TOTAL])
+        return pd.concat([total, origens.groupby(level=0).sum()])
+
+    def _carregar(self, posicao: int) -> pd.DataFrame:
+        """
+        Linhas do modelo de uma meia hora da semana (indexadas pela chave)
+        """
+        return pd.read_sql_query(
+            "SELECT chave, amostras, media, variancia FROM volume_esperado WHERE meia_hora_semana = ?",
+            self.conn, params=(posicao,), index_col='chave'
+        )
+
+    def avaliar(self, observado: pd.Series, inicio_janela: datetime) -> Dict:
+        """
+        Compara o volume da janela com o esperado para a meia hora da semana
+
+        Args:
+            observado: Retorno de observacao()
+            inicio_janela: Início da janela
+
+        Returns:
+            Dict com 'nivel_volume' ('Normal', 'Alerta', 'Crítico'), 'total', 'total_esperado',
+            'z_total', 'origens_ausentes' e 'origens_em_queda' (listas de dicts), e 'modelo_pronto'
+        """
+        modelo = self._carregar(meia_hora_semana(inicio_janela))
+        modelo = modelo[modelo['amostras'] >= self.min_amostras]
+
+        total = float(observado.get(CHAVE_TOTAL, 0.0))
+        avaliacao = {
+            'nivel_volume': 'Normal',
+            'total': int(total),
+            'total_esperado': None,
+            'z_total': None,
+            'origens_ausentes': [],
+            'origens_em_queda': [],
+            'modelo_pronto': CHAVE_TOTAL in modelo.index,
+        }
+        if len(modelo) == 0:
+            return avaliacao
+
+        # Desvio com piso de Poisson (sqrt da média): evita z enorme com variância ~0
+        obs = observado.reindex(modelo.index, fill_value=0.0).to_numpy(dtype=float)
+        media = modelo['media'].to_numpy(dtype=float)
+        desvio = np.maximum(np.sqrt(modelo['variancia'].to_numpy(dtype=float)), np.sqrt(np.maximum(media, 1.0)))
+        z = (obs - media) / desvio
+        queda = (z <= -self.z_limite) & (obs < media * self.fator_queda)
+
+        eh_total = (modelo.index == CHAVE_TOTAL)
+        relevante = ~eh_total & (media >= self.volume_minimo_origem)
+        ausente = relevante & (obs == 0) & queda
+        em_queda = relevante & (obs > 0) & queda
+
+        def _listar(mascara):
+            ordem = np.argsort(-media[mascara])
+            return [{'origem': o, 'observado': int(v), 'esperado': round(float(m), 1)}
+                    for o, v, m in zip(modelo.index[mascara][ordem], obs[mascara][ordem], media[mascara][ordem])]
+
+        avaliacao['origens_ausentes'] = _listar(ausente)
+        avaliacao['origens_em_queda'] = _listar(em_queda)
+
+        if eh_total.any():
+            i = int(np.argmax(eh_total))
+            avaliacao['total_esperado'] = round(float(media[i]), 1)
+            avaliacao['z_total'] = round(float(z[i]), 2)
+            if total < media[i] * self.fator_critico and queda[i]:
+                avaliacao['nivel_volume'] = 'Crítico'
+            elif queda[i]:
+                avaliacao['nivel_volume'] = 'Alerta'
+
+        if avaliacao['nivel_volume'] == 'Normal' and avaliacao['origens_ausentes']:
+            avaliacao['nivel_volume'] = 'Alerta'
+
+        return avaliacao
+
+    def atualizar(self, observado: pd.Series, inicio_janela: datetime):
+        """
+        Incorpora a janela ao modelo (chaves conhecidas ausentes na janela entram com 0)
+
+        Args:
+            observado: Retorno de observacao()
+            inicio_janela: Início da janela
+        """
+        posicao = meia_hora_semana(inicio_janela)
+        modelo = self._carregar(posicao)
+        chaves = modelo.index.union(observado.index)
+        modelo = modelo.reindex(chaves)
+
+        x = observado.reindex(chaves, fill_value=0.0).to_numpy(dtype=float)
+        amostras = np.minimum(modelo['amostras'].fillna(0).to_numpy() + 1, self.max_amostras)
+        media = modelo['media'].fillna(0.0).to_numpy(dtype=float)
+        variancia = modelo['variancia'].fillna(0.0).to_numpy(dtype=float)
+
+        peso = 1.0 / amostras
+        delta = x - media
+        media = media + peso * delta
+        variancia = (1.0 - peso) * (variancia + peso * delta * delta)
+
+        # amostras conta as semanas observadas (para min_amostras), mesmo após o limite do peso
+        contagem = modelo['amostras'].fillna(0).to_numpy() + 1
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO volume_esperado VALUES (?, ?, ?, ?, ?, ?)",
+                [(posicao, str(c), int(n), float(m), float(v), agora)
+                 for c, n, m, v in zip(chaves, contagem, media, variancia)]
+            )
+
+    def verificar(self, resultado: Dict, inicio_janela: datetime, fim_janela: datetime) -> Dict:
+        """
+        Avalia a janela e atualiza o modelo; o nível só é gravado aqui se não mudou
+
+        Janelas em colapso (Crítico) não entram no modelo, para não rebaixar o
+        volume esperado durante uma parada. Com 'mudou', o chamador notifica e
+        então chama registrar_nivel().
+
+        Args:
+            resultado: Resultado da análise ({} para export vazio)
+            inicio_janela: Início da janela
+            fim_janela: Fim da janela
+
+        Returns:
+            Retorno de avaliar() acrescido de 'nivel_anterior' e 'mudou'
+        """
+        observado = self.observacao(resultado)
+        avaliacao = self.avaliar(observado, inicio_janela)
+
+        if avaliacao['nivel_volume'] != 'Crítico':
+            self.atualizar(observado, inicio_janela)
+
+        linha = self.conn.execute("SELECT nivel FROM volume_estado WHERE id = 1").fetchone()
+        anterior = linha[0] if linha else 'Normal'
+
+        avaliacao['nivel_anterior'] = anterior
+        avaliacao['mudou'] = anterior != avaliacao['nivel_volume']
+        if not avaliacao['mudou']:
+            self.registrar_nivel(avaliacao['nivel_volume'], fim_janela)
+        return avaliacao
+
+    def registrar_nivel(self, nivel: str, fim_janela: datetime):
+        """
+        Grava o nível de volume notificado (referência da próxima mudança)
+
+        Args:
+            nivel: 'Normal', 'Alerta' ou 'Crítico'
+            fim_janela: Fim da janela avaliada
+        """
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO volume_estado VALUES (1, ?, ?)",
+                              (nivel, fim_janela.strftime('%Y-%m-%d %H:%M')))
+
+    def reconstruir(self) -> int:
+        """
+        Recria o modelo a partir das tabelas janelas e janelas_origem do histórico
+
+        Returns:
+            Quantidade de janelas processadas
+        """
+        janelas = pd.read_sql_query(
+            "SELECT fim_janela, inicio_janela, total_transacoes FROM janelas ORDER BY fim_janela", self.conn
+        )
+        origens = pd.read_sql_query("SELECT fim_janela, origem, total FROM janelas_origem", self.conn)
+        por_janela = {chave: grupo for chave, grupo in origens.groupby('fim_janela')}
+
+        with self.conn:
+            self.conn.execute("DELETE FROM volume_esperado")
+
+        for linha in janelas.itertuples(index=False):
+            grupo = por_janela.get(linha.fim_janela)
+            observado = pd.concat([
+                pd.Series([float(linha.total_transacoes or 0)], index=[CHAVE_TOTAL]),
+                pd.Series(grupo['total'].to_numpy(dtype=float), index=grupo['origem'].astype(str))
+                if grupo is not None else pd.Series(dtype=float),
+            ])
+            self.atualizar(observado, datetime.strptime(linha.inicio_janela[:16], '%Y-%m-%d %H:%M'))
+
+        return len(janelas)
+
+    def fechar(self):
+        """
+        Fecha a conexão com o banco
+        """
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.error(f"Erro ao fechar modelo de volume: {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    CLI do modelo de volume
+    """
+    parser = argparse.ArgumentParser(description="Modelo de volume esperado por meia hora da semana e origem")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    reconstruir = sub.add_parser('reconstruir', help="Recria o modelo a partir do histórico de janelas")
+    reconstruir.add_argument('--db', default=None, help="Banco do histórico (padrão: HISTORICO_DB_PATH)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    db_path = args.db
+    if db_path is None:
+        import config
+        db_path = getattr(config, 'HISTORICO_DB_PATH', os.path.join(config.BASE_DIR, "historico", "historico_janelas.db"))
+
+    modelo = ModeloVolume(db_path)
+    try:
+        janelas = modelo.reconstruir()
+    finally:
+        modelo.fechar()
+
+    print(f"Modelo de volume reconstruído a partir de {janelas} janela(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())